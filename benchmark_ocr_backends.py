@@ -0,0 +1,57 @@
+"""
+2021 Yifu (https://github.com/chen-yifu) and Lucy (https://github.com/lhao03)
+This file includes code that compares the time and the text of the OCR backends on the operative reports.
+"""
+import time
+from typing import List
+
+from pipeline.emr_pipeline import EMRPipeline
+from pipeline.preprocessing.scanned_pdf_to_text import get_ocr_settings, get_pdf_page_count, ocr_backends, ocr_pages
+from pipeline.utils.report_type import ReportType
+
+
+def benchmark_ocr_backends(path_to_input: str, paths_to_pdfs: List[str], backends: List[str] = None,
+                           max_workers: int = None, ocr_settings: dict = None) -> List[dict]:
+    """
+    OCRs the same pages with each backend and compares the time and the text to the first backend.
+
+    :param path_to_input:        path to input folder
+    :param paths_to_pdfs:        paths to the pdf files to benchmark on
+    :param backends:             names of the backends in ocr_backends, by default all of them
+    :param max_workers:          number of worker processes, defaults to the number of cores
+    :param ocr_settings:         pdf2image and tesseract parameters, see default_ocr_settings
+    :return:                     backend, pages, seconds, seconds per page and the fraction of pages with the same
+                                 text as the first backend
+    """
+    ocr_settings = get_ocr_settings(ocr_settings)
+    backends = backends if backends else list(ocr_backends.keys())
+    pages_per_report = {}
+    for index, pdf_path in enumerate(paths_to_pdfs):
+        num_pages = get_pdf_page_count(pdf_path)
+        num_pages = min(num_pages, ocr_settings["max pages"]) if ocr_settings["max pages"] else num_pages
+        pages_per_report[index] = list(range(1, num_pages + 1))
+
+    results = []
+    first_texts = None
+    for backend in backends:
+        start_time = time.perf_counter()
+        texts = {(index, page_number): text for index, page_number, text, _ in
+                 ocr_pages(path_to_input, paths_to_pdfs, pages_per_report, max_workers,
+                           {**ocr_settings, "ocr backend": backend})}
+        seconds = time.perf_counter() - start_time
+        first_texts = first_texts if first_texts else texts
+        results.append({"backend": backend, "pages": len(texts), "seconds": seconds,
+                        "seconds per page": seconds / max(len(texts), 1),
+                        "same text": sum(1 for page, text in texts.items() if first_texts.get(page) == text) /
+                        max(len(texts), 1)})
+        print("OCR backend {backend}: {pages} pages in {seconds:.1f}s, {seconds per page:.2f}s per page, "
+              "{same text:.0%} of pages have the same text as {first}.".format(first=backends[0], **results[-1]))
+    return results
+
+
+if __name__ == "__main__":
+    operative_pipeline = EMRPipeline(start=1, end=50, report_name="operative", report_ending="V.pdf",
+                                     report_type=ReportType.ALPHA)
+    benchmark_ocr_backends(operative_pipeline.paths["path to input"],
+                           operative_pipeline.get_report_paths(operative_pipeline.report_ids)[0],
+                           ocr_settings=operative_pipeline.ocr_settings)
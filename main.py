@@ -70,7 +70,9 @@ def operative_pipeline_main() -> Tuple[Any, pd.DataFrame]:
 #     pathology_app.geometry("1280x740")
 #     pathology_app.mainloop()
 
-# pathology_gui()
-# operative_gui()
-pathology_pipeline_main()
-operative_pipeline_main()
+if __name__ == "__main__":
+    # the worker processes import this file again where they are spawned, they must not run the pipelines
+    # pathology_gui()
+    # operative_gui()
+    pathology_pipeline_main()
+    operative_pipeline_main()
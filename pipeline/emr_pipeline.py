@@ -2,6 +2,9 @@
 2021 Yifu (https://github.com/chen-yifu) and Lucy (https://github.com/lhao03)
 This file includes code that represents an EMRPipeline object.
 """
+import json
+import shutil
+import tempfile
 from copy import copy, deepcopy
 from typing import List, Any, Tuple, Dict
 import os
@@ -9,20 +12,30 @@ import pandas as pd
 from pipeline.postprocessing.highlight_differences import highlight_csv_differences
 from pipeline.postprocessing.write_csv_excel import save_dictionaries_into_csv_raw, reports_to_spreadsheet, \
     add_report_id
-from pipeline.preprocessing.extract_synoptic import clean_up_reports
-from pipeline.preprocessing.resolve_ocr_spaces import preprocess_resolve_ocr_spaces
-from pipeline.preprocessing.scanned_pdf_to_text import load_reports_into_pipeline
+from pipeline.preprocessing.extract_synoptic import clean_up_reports, iter_clean_up_reports
+from pipeline.preprocessing.ocr_cache import OCRCache
+from pipeline.preprocessing.resolve_ocr_spaces import preprocess_resolve_ocr_spaces, iter_resolve_ocr_spaces
+from pipeline.preprocessing.scanned_pdf_to_text import load_reports_into_pipeline, iter_reports_into_pipeline, \
+    convert_pdfs_to_texts, get_ocr_settings, make_ocr_settings_grid, report_characters
 from pipeline.processing.clean_text import filter_report
 from pipeline.processing.encode_extractions import encode_extractions
 from pipeline.processing.process_synoptic_general import process_synoptics_and_ids
 from pipeline.processing.turn_to_values import turn_reports_extractions_to_values
+from pipeline.utils.alternation_trie import count_column_hits
 from pipeline.utils.column import Column
-from pipeline.utils.import_tools import get_input_paths, import_code_book, import_columns, get_acronyms
+from pipeline.utils.extraction_engine import ExtractionEngine
+from pipeline.utils.import_tools import get_input_paths_from_ids, import_code_book, import_columns, get_acronyms, \
+    import_ocr_settings, save_ocr_settings
+from pipeline.utils.manifest import find_report_ids, load_manifest, scan_input_folder, find_changed_report_ids, \
+    save_manifest, merge_with_prior_results
 from pipeline.utils.paths import get_paths
-from pipeline.utils.regex_tools import synoptic_capture_regex_
+from pipeline.utils.regex_timeout import default_regex_time_budget
+from pipeline.utils.regex_tools import compile_synoptic_capture_regex, compile_synoptic_column_prefilter, \
+    compile_synoptic_header_index, operative_page_anchors, pathology_page_anchors
 from pipeline.utils.report import Report
 from pipeline.utils.report_type import ReportType
-from pipeline.utils.utils import find_all_vocabulary, get_current_time, create_rules
+from pipeline.utils.utils import get_current_time, create_rules
+from pipeline.utils.vocabulary_counts import VocabularyCounts
 
 
 class EMRPipeline:
@@ -36,28 +49,28 @@ class EMRPipeline:
         :param other_paths:                        any other paths the pipeline requires that is not in the paths func
         :param report_ending:                      the file endings of the reports, all must be same
         :param report_name:                        what is the type of the report? pathology, surgical, operative
-        :param start:                              the first report id
-        :param end:                                the last report id
+        :param start:                              the first report id, None to use every report in the input folder
+        :param end:                                the last report id, None to use every report in the input folder
         :param report_type:                        the type of report being analyzed, is an Enum
         """
         self.other_paths = other_paths if other_paths is None else {}
-        self.start = start
-        self.end = end
         self.report_name = report_name
         self.report_ending = report_ending
         self.other_paths = other_paths
         self.paths = get_paths(report_name, other_paths)
+        if start is not None and end is not None:
+            self.report_ids = list(range(start, end + 1))
+        else:
+            self.report_ids = find_report_ids(self.paths["path to reports"], report_ending)
+        self.start = self.report_ids[0] if self.report_ids else start
+        self.end = self.report_ids[-1] if self.report_ids else end
         self.code_book = import_code_book(self.paths["path to code book"])
         self.column_mappings = import_columns(self.paths["path to mappings"], self.paths["path to thresholds"],
                                               self.paths["path to regex rules"])
         self.pickle_path = self.paths["path to autocorrect"] if "path to autocorrect" in self.paths else None
-        self.paths_to_pdfs = get_input_paths(start, end, path_to_reports=self.paths["path to reports"],
-                                             report_str="{}" + report_ending)
         self.report_type = report_type
-        if report_type is ReportType.ALPHA:
-            report_ending = report_ending[:-3] + "txt"
-        self.paths_to_reports_to_read_in = get_input_paths(start, end, path_to_reports=self.paths["path to reports"],
-                                                           report_str="{}" + report_ending)
+        self.ocr_settings = import_ocr_settings(self.paths["path to ocr settings"])
+        self.paths_to_pdfs, self.paths_to_reports_to_read_in = self.get_report_paths(self.report_ids)
         flat_los = []
         for encodings in self.code_book.values():
             for encoding in encodings:
@@ -66,6 +79,31 @@ class EMRPipeline:
         self.acronyms = get_acronyms(flat_los)
         self.current_regex_rules = deepcopy(list(list(self.column_mappings.values())[0].regular_pattern_rules.keys()))
 
+    def get_report_paths(self, report_ids: List[int]) -> Tuple[List[str], List[str]]:
+        """
+        :param report_ids:         ids of the reports
+        :return:                   paths to the report pdfs and paths to the files that are read in (pdf or txt)
+        """
+        path_to_reports = self.paths["path to reports"]
+        read_in_ending = self.report_ending[:-3] + "txt" if self.report_type is ReportType.ALPHA else self.report_ending
+        paths_to_pdfs = get_input_paths_from_ids(report_ids, path_to_reports, report_str="{}" + self.report_ending)
+        paths_to_reports_to_read_in = get_input_paths_from_ids(report_ids, path_to_reports,
+                                                               report_str="{}" + read_in_ending)
+        return paths_to_pdfs, paths_to_reports_to_read_in
+
+    def get_run_ocr_settings(self, ocr_settings: dict, targeted_ocr: bool) -> dict:
+        """
+        :param ocr_settings:     OCR settings, see default_ocr_settings
+        :param targeted_ocr:     see run_pipeline
+        :return:                 the settings the reports of a run are OCR'd with, with the page anchors of the report
+                                 type if targeted_ocr is True
+        """
+        ocr_settings = dict(ocr_settings)
+        if targeted_ocr:
+            ocr_settings["page anchors"] = operative_page_anchors if self.report_type is ReportType.ALPHA \
+                else pathology_page_anchors
+        return ocr_settings
+
     def run_pipeline(self, baseline_versions: List[str], anchor: str, single_line_list: list = [],
                      separator: str = ":", use_separator_to_capture: bool = False, add_anchor: bool = False,
                      val_on_next_line_cols_to_add: list = [], val_on_same_line_cols_to_add: list = [],
@@ -76,7 +114,13 @@ class EMRPipeline:
                      resolve_ocr: bool = True, filter_func_args: Tuple = None, train_thresholds: bool = False,
                      train_regex: bool = False, filter_values: bool = False, start_threshold: float = 0.7,
                      end_threshold: float = 1, extraction_tools: list = [],
-                     threshold_interval: float = 0.05) -> Tuple[Any, pd.DataFrame]:
+                     threshold_interval: float = 0.05, ocr_workers: int = None,
+                     use_ocr_cache: bool = True, save_ocr_page_images: bool = False, lazy_loading: bool = False,
+                     read_ahead: int = 8, incremental: bool = False,
+                     targeted_ocr: bool = False, resolve_ocr_workers: int = None,
+                     regex_time_budget: float = default_regex_time_budget, refresh_ocr_texts: bool = False,
+                     extraction_engine: ExtractionEngine = ExtractionEngine.REGEX,
+                     save_state: bool = True, skip_non_synoptic: bool = False) -> Tuple[Any, pd.DataFrame]:
         """
         The starting function of the EMR pipeline. Reports must be preprocessed by Adobe OCR before being loaded into
         the pipeline if the values to be extracted are mostly numerical. Reports with values that are mostly
@@ -110,25 +154,100 @@ class EMRPipeline:
         :param max_edit_distance_autocorrect:  the maximum edit distance for autocorrecting extracted pairs
         :param substitution_cost:              the substitution cost for edit distance
         :param resolve_ocr:                    resolve ocr white space if true
+        :param ocr_workers:                    number of processes used to OCR reports, defaults to the number of cores
+        :param use_ocr_cache:                  reuse OCR results of pdfs with the same content and OCR settings
+        :param save_ocr_page_images:           debug mode, save every page image that is OCR'd under the input folder
+        :param lazy_loading:                   stream reports through loading, OCR resolution and section extraction
+                                               instead of loading every report first. the medical vocabulary comes
+                                               from the word counts of earlier runs in this mode
+        :param read_ahead:                     with lazy_loading, the maximum number of loaded reports held in memory
+        :param incremental:                    only process reports that are new or changed since the last successful
+                                               incremental run and merge their results into the earlier results
+        :param targeted_ocr:                   find the first page with a synoptic section in a fast low resolution
+                                               pass and only OCR the pages from it on at full resolution
+        :param resolve_ocr_workers:            number of processes used to resolve ocr white space, defaults to the
+                                               number of cores
+        :param regex_time_budget:              seconds a regular pattern may take on one report before it falls back
+                                               to line based extraction, None for no budget
+        :param refresh_ocr_texts:              OCR every pdf again and overwrite its text file, by default only the text
+                                               files the OCR cache wrote are checked against their pdf
+        :param extraction_engine:              how the columns are found, see ExtractionEngine. its value, like
+                                               "keyword index", is taken too
+        :param save_state:                     save the word counts and the manifest of this run for the next runs,
+                                               the word counts of a training run are never saved
+        :param skip_non_synoptic:              skip the sections with too few column headers to be synoptic before
+                                               anything is extracted from them, they are kept as rows without values
         :return:                               autocorrect results
         """
         timestamp = get_current_time()
+        # raises ValueError for an engine that does not exist before any report is read in
+        extraction_engine = ExtractionEngine(extraction_engine)
 
         # try to read in the reports. if there is exception this is because the pdfs have to be turned into text
         # files first then try to read in again.
 
-        reports_loaded_in_str = load_reports_into_pipeline(self.paths["path to input"], self.paths_to_pdfs,
-                                                           self.paths_to_reports_to_read_in, self.start)
-
-        medical_vocabulary = find_all_vocabulary([report.text for report in reports_loaded_in_str],
-                                                 print_debug=print_debug, min_freq=int((self.end - self.start) / 2) - 1)
+        path_to_cache = self.paths["path to cache"]
+        ocr_cache = OCRCache(self.paths["path to ocr cache"]) if use_ocr_cache else None
+        ocr_settings = self.get_run_ocr_settings(self.ocr_settings, targeted_ocr)
 
-        if resolve_ocr:
-            reports_loaded_in_str = preprocess_resolve_ocr_spaces(reports_loaded_in_str, print_debug=print_debug,
-                                                                  medical_vocabulary=medical_vocabulary)
-
-        # returns list[Report] with everything BUT encoded and not_found initialized
-        cleaned_emr, ids_without_synoptic = clean_up_reports(emr_text=reports_loaded_in_str)
+        report_ids, manifest = self.report_ids, None
+        if incremental:
+            previous_manifest = load_manifest(self.paths["path to manifest"])
+            manifest = scan_input_folder(self.paths["path to reports"], self.report_ending, self.report_ids,
+                                         previous_manifest)
+            report_ids = find_changed_report_ids(manifest, previous_manifest)
+            if print_debug:
+                print("{} of {} reports are new or changed since the last run.".format(len(report_ids),
+                                                                                       len(manifest)))
+            if not report_ids:
+                save_manifest(self.paths["path to manifest"], manifest)
+                return "No new or changed reports.", pd.DataFrame()
+        paths_to_pdfs, paths_to_reports_to_read_in = self.get_report_paths(report_ids)
+
+        # word counts of every report seen so far, the medical vocabulary is found in them
+        vocabulary_counts = VocabularyCounts(self.paths["path to vocabulary counts"])
+
+        if lazy_loading:
+            # only the reports of earlier runs are counted before the reports stream through
+            medical_vocabulary = vocabulary_counts.find_vocabulary(print_debug=print_debug) \
+                if vocabulary_counts.num_documents else []
+            reports_loaded_in_str = iter_reports_into_pipeline(self.paths["path to input"], paths_to_pdfs,
+                                                               paths_to_reports_to_read_in, self.start,
+                                                               read_ahead=read_ahead, ocr_workers=ocr_workers,
+                                                               ocr_cache=ocr_cache, ocr_settings=ocr_settings,
+                                                               save_page_images=save_ocr_page_images,
+                                                               report_ids=report_ids,
+                                                               refresh_text_files=refresh_ocr_texts)
+            reports_loaded_in_str = vocabulary_counts.count_reports(reports_loaded_in_str)
+            if resolve_ocr:
+                reports_loaded_in_str = iter_resolve_ocr_spaces(reports_loaded_in_str,
+                                                                medical_vocabulary=medical_vocabulary,
+                                                                vocabulary_cache_folder=path_to_cache)
+            cleaned_emr = iter_clean_up_reports(reports_loaded_in_str)
+            if train_regex:
+                cleaned_emr = list(cleaned_emr)
+        else:
+            reports_loaded_in_str = load_reports_into_pipeline(self.paths["path to input"], paths_to_pdfs,
+                                                               paths_to_reports_to_read_in, self.start,
+                                                               ocr_workers=ocr_workers, print_debug=print_debug,
+                                                               ocr_cache=ocr_cache, ocr_settings=ocr_settings,
+                                                               save_page_images=save_ocr_page_images,
+                                                               report_ids=report_ids,
+                                                               refresh_text_files=refresh_ocr_texts)
+
+            for report in reports_loaded_in_str:
+                vocabulary_counts.add(report.text, report.report_id)
+            # min_freq is about half of all the reports counted so far
+            medical_vocabulary = vocabulary_counts.find_vocabulary(print_debug=print_debug)
+
+            if resolve_ocr:
+                reports_loaded_in_str = preprocess_resolve_ocr_spaces(reports_loaded_in_str, print_debug=print_debug,
+                                                                      medical_vocabulary=medical_vocabulary,
+                                                                      vocabulary_cache_folder=path_to_cache,
+                                                                      max_workers=resolve_ocr_workers)
+
+            # returns list[Report] with everything BUT encoded and not_found initialized
+            cleaned_emr, ids_without_synoptic = clean_up_reports(emr_text=reports_loaded_in_str)
 
         if train_regex:
             regex_training_df = self.train_pipeline_regex(
@@ -147,7 +266,8 @@ class EMRPipeline:
                 baseline_versions=baseline_versions,
                 filter_values=filter_values, start_threshold=start_threshold,
                 encoding_tools=encoding_tools,
-                filter_func_args=filter_func_args)
+                filter_func_args=filter_func_args,
+                skip_non_synoptic=skip_non_synoptic)
             print("Regex Training")
             print(regex_training_df)
 
@@ -166,19 +286,47 @@ class EMRPipeline:
         # print(synoptic_regex)
         # print(regex_variable_mappings)
 
-        synoptic_regex, regex_variable_mappings = synoptic_capture_regex_(
-            {k: v for k, v in self.column_mappings.items() if k.lower() not in cols_to_skip},
+        synoptic_columns = {k: v for k, v in self.column_mappings.items() if k.lower() not in cols_to_skip}
+        # when the reports are in memory, the report columns that are in the most reports are tried first
+        column_hits = {}
+        if isinstance(cleaned_emr, list):
+            column_hits = count_column_hits([report.text for report in cleaned_emr],
+                                            [col for column in synoptic_columns.values()
+                                             for col in column.primary_report_col + column.alternative_report_col])
+        synoptic_regex, regex_variable_mappings = compile_synoptic_capture_regex(
+            synoptic_columns,
             val_on_same_line_cols_to_add=val_on_same_line_cols_to_add,
             val_on_next_line_cols_to_add=val_on_next_line_cols_to_add,
-            anchor=anchor)
+            anchor=anchor,
+            column_hits=column_hits)
 
-        print(synoptic_regex)
+        print(synoptic_regex.pattern)
         print(regex_variable_mappings)
 
+        specific_extractor = synoptic_regex
+        if extraction_engine is ExtractionEngine.KEYWORD_INDEX:
+            synoptic_index, _ = compile_synoptic_header_index(
+                synoptic_columns,
+                val_on_same_line_cols_to_add=val_on_same_line_cols_to_add,
+                val_on_next_line_cols_to_add=val_on_next_line_cols_to_add,
+                anchor=anchor,
+                column_hits=column_hits)
+            if synoptic_index is None:
+                print("The columns or the anchor can not be put in a keyword index, using the regex instead.")
+            else:
+                specific_extractor = synoptic_index
+        elif extraction_engine is ExtractionEngine.COLUMN_PREFILTER:
+            specific_extractor, _ = compile_synoptic_column_prefilter(
+                synoptic_columns,
+                val_on_same_line_cols_to_add=val_on_same_line_cols_to_add,
+                val_on_next_line_cols_to_add=val_on_next_line_cols_to_add,
+                anchor=anchor,
+                column_hits=column_hits)
+
         filtered_reports, autocorrect_df = process_synoptics_and_ids(
             cleaned_emr,
             self.column_mappings,
-            synoptic_regex,
+            specific_extractor,
             r"(?P<column>.*){}(?P<value>((?!.+({}|—)\?*)[\s\S])*)".format(separator, separator),
             print_debug=print_debug,
             max_edit_distance_missing=max_edit_distance_missing,
@@ -188,7 +336,10 @@ class EMRPipeline:
             regex_mappings=regex_variable_mappings,
             pickle_path=self.pickle_path,
             paths=self.paths,
-            extraction_tools=extraction_tools)
+            extraction_tools=extraction_tools,
+            separator=separator,
+            time_budget=regex_time_budget,
+            skip_non_synoptic=skip_non_synoptic)
 
         for report in filtered_reports:
             old_id = report.report_id
@@ -230,8 +381,17 @@ class EMRPipeline:
                                                  type_of_report="coded",
                                                  function=add_report_id)
 
+        if incremental:
+            dataframe_coded = merge_with_prior_results(dataframe_coded, self.paths["csv path merged"], report_ids)
+
         dataframe_coded.to_csv(self.paths["csv path coded"], index=False)
 
+        # the reports of a training run are not counted for the runs after it
+        if save_state and not (train_regex or train_thresholds):
+            vocabulary_counts.save()
+        if incremental and save_state:
+            save_manifest(self.paths["path to manifest"], manifest)
+
         stats = None
 
         if not baseline_versions:
@@ -260,6 +420,102 @@ class EMRPipeline:
 
         return stats, autocorrect_df
 
+    def train_ocr_settings(self, baseline_versions: List[str], anchor: str, ocr_settings_to_try: List[dict] = None,
+                           sample_size: int = 20, save_best: bool = True, print_debug: bool = True,
+                           **pipeline_args) -> pd.DataFrame:
+        """
+        Benchmarks OCR settings on a sample of the reports. Every setting is timed while it OCRs the sample and the
+        text it produced is run through the pipeline, so the accuracy compared to the baseline can be weighed against
+        the seconds per page. The sample is OCR'd and run through the pipeline in a scratch folder, so the text files,
+        outputs, word counts, manifest and excluded autocorrect columns of the reports are left as they are. The sample
+        is OCR'd the way the pipeline run would OCR it, with page anchors if targeted_ocr is in pipeline_args.
+
+        :param baseline_versions:          the baseline version to compare to, only the first one is used
+        :param anchor:                     the anchor that the regex will look for to anchor to the start of page
+        :param ocr_settings_to_try:        OCR settings to compare, by default dpi, binarization, page segmentation
+                                           mode, OCR engine mode and the character whitelist are swept
+        :param sample_size:                number of reports to benchmark on, the first ones of the pipeline
+        :param save_best:                  save the most accurate settings, the fastest of them if there is a tie, so
+                                           the OCR stage uses them from now on
+        :param print_debug:                print debug statements in Terminal if True
+        :param pipeline_args:              any other arguments of run_pipeline, every report of the sample is run
+                                           without training, incremental runs or the OCR cache
+        :return:                           seconds per page and accuracy of every setting
+        """
+        if self.report_type is not ReportType.ALPHA:
+            raise ValueError("Only ALPHA reports are OCR'd, there are no OCR settings to train.")
+        if not baseline_versions:
+            raise ValueError("OCR settings are trained against a baseline, but there are no baseline versions.")
+        if ocr_settings_to_try is None:
+            ocr_settings_to_try = make_ocr_settings_grid({"dpi": [200, 300], "binarize threshold": [None, 160],
+                                                          "psm": [None, 6], "oem": [None, 1],
+                                                          "whitelist": ["", report_characters]},
+                                                         {**self.ocr_settings, "grayscale": True})
+        pipeline_args = {**pipeline_args, "use_ocr_cache": False, "incremental": False, "train_regex": False,
+                         "train_thresholds": False, "save_state": False}
+        timestamp = get_current_time()
+        sample_ids = self.report_ids[:sample_size]
+        report_ids, ocr_settings, paths, pickle_path = self.report_ids, self.ocr_settings, self.paths, self.pickle_path
+        training = []
+        with tempfile.TemporaryDirectory(prefix="ocr_training_") as scratch_folder:
+            scratch_paths = {"path to input": "reports/", "path to reports": "reports/", "path to output": "output/",
+                             "path to output csv": "output/csv_files/", "path to output excel": "output/excel_files/"}
+            scratch_paths = {name: os.path.join(scratch_folder, path) for name, path in scratch_paths.items()}
+            for path in scratch_paths.values():
+                os.makedirs(path, exist_ok=True)
+            scratch_paths.update({"csv path raw": scratch_paths["path to output csv"] + "raw.csv",
+                                  "csv path coded": scratch_paths["path to output csv"] + "coded.csv",
+                                  "csv path merged": scratch_paths["path to output csv"] + "coded_merged.csv"})
+            for pdf_path in self.get_report_paths(sample_ids)[0]:
+                if os.path.exists(pdf_path):
+                    shutil.copy(pdf_path, scratch_paths["path to reports"])
+            # the excluded autocorrect columns are used as they are, from a copy the run can not change
+            scratch_paths["path to autocorrect"] = os.path.join(scratch_folder, "excluded_autocorrect_columns.data")
+            if pickle_path and os.path.exists(pickle_path):
+                shutil.copy(pickle_path, scratch_paths["path to autocorrect"])
+            try:
+                self.report_ids, self.paths = sample_ids, {**paths, **scratch_paths}
+                self.pickle_path = scratch_paths["path to autocorrect"]
+                paths_to_pdfs, paths_to_texts = self.get_report_paths(sample_ids)
+                for settings in ocr_settings_to_try:
+                    settings = get_ocr_settings(settings)
+                    run_ocr_settings = self.get_run_ocr_settings(settings, pipeline_args.get("targeted_ocr", False))
+                    ocr_stats = convert_pdfs_to_texts(self.paths["path to input"], paths_to_pdfs, paths_to_texts,
+                                                      print_debug=print_debug, ocr_settings=run_ocr_settings)
+                    # the text files were just written with these settings, so the pipeline reads them as they are
+                    self.ocr_settings = settings
+                    stats, _ = self.run_pipeline(baseline_versions=baseline_versions[:1], anchor=anchor,
+                                                 print_debug=print_debug, **pipeline_args)
+                    if not stats:
+                        continue
+                    num_same, num_different, num_missing, num_extra = stats
+                    training.append({"ocr settings": json.dumps(settings, sort_keys=True),
+                                     "pages": ocr_stats["pages"],
+                                     "text layer pages": ocr_stats["text layer pages"],
+                                     "seconds per page": ocr_stats["seconds"] / max(ocr_stats["pages"], 1),
+                                     "num_same": num_same, "num_different": num_different,
+                                     "num_missing": num_missing, "num_extra": num_extra,
+                                     "accuracy": num_same / max(num_same + num_different + num_missing, 1)})
+                    if print_debug:
+                        print("OCR settings {} -> {}".format(training[-1]["ocr settings"], training[-1]))
+            finally:
+                self.report_ids, self.ocr_settings, self.paths = report_ids, ocr_settings, paths
+                self.pickle_path = pickle_path
+
+        training_df = pd.DataFrame(training)
+        if not os.path.exists(self.paths["path to training folder"]):
+            os.makedirs(self.paths["path to training folder"])
+        training_df.to_excel(self.paths["path to training folder"] + "ocr_training_{}_{}.xlsx".format(
+            self.report_name, timestamp))
+        if save_best and not training_df.empty:
+            best = training_df.sort_values(["accuracy", "seconds per page"], ascending=[False, True]).iloc[0]
+            self.ocr_settings = json.loads(best["ocr settings"])
+            save_ocr_settings(self.paths["path to ocr settings"], self.ocr_settings)
+            if print_debug:
+                print("Saved the best OCR settings {} to {}".format(best["ocr settings"],
+                                                                   self.paths["path to ocr settings"]))
+        return training_df
+
     def train_pipeline_encodings(self, baseline_versions: List[str], end_threshold: float, print_debug: bool,
                                  report_name: str, reports_with_values: List[Report], start_threshold: float,
                                  threshold_interval: float, timestamp: str, encoding_tools: dict, output_path: str,
@@ -389,7 +645,7 @@ class EMRPipeline:
                              cleaned_reports: List[Report], separator, max_edit_distance_missing,
                              max_edit_distance_autocorrect, substitution_cost, autocorrect_tools,
                              extraction_tools, timestamp, baseline_versions, filter_values, start_threshold,
-                             encoding_tools, filter_func_args) -> pd.DataFrame:
+                             encoding_tools, filter_func_args, skip_non_synoptic: bool = False) -> pd.DataFrame:
         """
         :param columns:
         :param val_on_same_line_cols_to_add:
@@ -408,6 +664,7 @@ class EMRPipeline:
         :param start_threshold:
         :param encoding_tools:
         :param filter_func_args:
+        :param skip_non_synoptic: see run_pipeline
         :return:
         """
 
@@ -438,13 +695,13 @@ class EMRPipeline:
             print("On training set number", str(index + 1))
             cleaned_reports_copy = deepcopy(cleaned_reports)
 
-            synoptic_regex, regex_variable_mappings = synoptic_capture_regex_(
+            synoptic_regex, regex_variable_mappings = compile_synoptic_capture_regex(
                 training_set,
                 val_on_same_line_cols_to_add=val_on_same_line_cols_to_add,
                 val_on_next_line_cols_to_add=val_on_next_line_cols_to_add,
                 anchor=anchor)
 
-            print(synoptic_regex)
+            print(synoptic_regex.pattern)
             print(regex_variable_mappings)
 
             filtered_reports, autocorrect_df = process_synoptics_and_ids(
@@ -459,7 +716,9 @@ class EMRPipeline:
                 regex_mappings=regex_variable_mappings,
                 pickle_path=self.pickle_path,
                 paths=self.paths,
-                extraction_tools=extraction_tools)
+                extraction_tools=extraction_tools,
+                separator=separator,
+                skip_non_synoptic=skip_non_synoptic)
 
             id_end = self.report_ending[0]
             for report in filtered_reports:
@@ -5,11 +5,31 @@ There can be 1 or 2 synoptic sections in a report.
 """
 import itertools
 import re
-from typing import Tuple, List
+from typing import Tuple, List, Iterable, Iterator, Union
 from pipeline.utils.regex_tools import right_operative_report, left_operative_report, export_operative_regex, \
-    export_pathology_regex, extract_section
+    export_pathology_regex, extract_section, FirstSectionScan
 from pipeline.utils.report import Report
 from pipeline.utils.report_type import ReportType
+from pipeline.utils.section_splitter import MarkerScan
+
+# https://regex101.com/r/ITYrAN/1
+preop_diag = r"PREOPERATIVE DIAGNOSIS[\s\S]*?(?P<laterality>l *e *f *t|r *i *g *h *t|Right|Left).*"
+# https://regex101.com/r/P2KVkz/1
+clinical_pream = r"(?i)CLINICAL PREAMBLE[\s\S]*?(?P<laterality>l *e *f *t|r *i *g *h *t|Right|Left).*"
+op_perforemd = r"OPERATION PERFORMED[\s\S]*?(?P<laterality>l *e *f *t|r *i *g *h *t|Right|Left).*"
+# regex demo: https://regex101.com/r/FX8VfI/8
+parts_involved = r"(?i)p *a *r *t *\( *s *\) *i *n *v *o *l *v *e *d *: *\n.*(?P<laterality>l *e *f *t *|r *i *g " \
+                 r"*h *t *).* "
+# the laterality patterns in priority, each with the phrase it begins with
+laterality_regexes = [(re.compile(parts_involved), re.compile(r"p *a *r *t *\( *s *\) *i *n *v *o *l *v *e *d *: *\n",
+                                                              re.IGNORECASE)),
+                      (re.compile(preop_diag), re.compile("PREOPERATIVE DIAGNOSIS")),
+                      (re.compile(clinical_pream), re.compile("CLINICAL PREAMBLE", re.IGNORECASE)),
+                      (re.compile(op_perforemd), re.compile("OPERATION PERFORMED"))]
+laterality_scan = MarkerScan([phrase for _, phrase in laterality_regexes])
+
+# the sections of the left and of the right breast in bilateral operative reports
+operative_sides_scan = FirstSectionScan([left_operative_report, right_operative_report])
 
 
 # TODO: This is still pretty bad
@@ -20,38 +40,15 @@ def find_left_right_label(string: str, report_type: ReportType, print_debug=True
     :param report_type:       enum, TEXT or NUMERICAL
     :param string:            input synoptic report
     :param print_debug:       print debug statements if True
-    :return:                  suffix, one of "L", "R", or "_laterality_undetected"
+    :return:                  suffix, one of "L", "R", or "unknown"
     """
-    match = ""
-    # https://regex101.com/r/ITYrAN/1
-    preop_diag = r"PREOPERATIVE DIAGNOSIS[\s\S]*?(?P<laterality>l *e *f *t|r *i *g *h *t|Right|Left).*"
-    # https://regex101.com/r/P2KVkz/1
-    clinical_pream = r"(?i)CLINICAL PREAMBLE[\s\S]*?(?P<laterality>l *e *f *t|r *i *g *h *t|Right|Left).*"
-    op_perforemd = r"OPERATION PERFORMED[\s\S]*?(?P<laterality>l *e *f *t|r *i *g *h *t|Right|Left).*"
-    # regex demo: https://regex101.com/r/FX8VfI/8
-    parts_involved = r"(?i)p *a *r *t *\( *s *\) *i *n *v *o *l *v *e *d *: *\n.*(?P<laterality>l *e *f *t *|r *i *g " \
-                     r"*h *t *).* "
-    list_of_laterality_regex = [parts_involved, preop_diag, clinical_pream, op_perforemd]
-
-    for laterality_regex in list_of_laterality_regex:
-        laterality_regex = re.compile(laterality_regex)
-        match = re.search(laterality_regex, string)
-        try:
-            laterality = match.group("laterality").replace(" ", "").strip().lower()
-            if laterality == "left":
-                return "L"
-            elif laterality == "right":
-                return "R"
-            else:
-                raise AttributeError
-        except AttributeError:
-            continue
-
-    try:
-        laterality = match.group("laterality").replace(" ", "").strip()
-        return "L" if laterality.lower() == "left" else "R"
-    except AttributeError:
-        return "unknown"
+    # each pattern is only searched for from where its phrase first occurs, the case of the text is folded only once
+    positions = laterality_scan.positions(string)
+    for index, (laterality_regex, _) in enumerate(laterality_regexes):
+        match = laterality_regex.search(string, positions[index]) if positions[index] is not None else None
+        if match:
+            return "L" if match.group("laterality").replace(" ", "").strip().lower() == "left" else "R"
+    return "unknown"
 
 
 def extract_synoptic_report(uncleaned_txt: str, report_id: str, report_type: ReportType,
@@ -84,12 +81,8 @@ def extract_synoptic_report(uncleaned_txt: str, report_id: str, report_type: Rep
         """
         :return:
         """
-        left_breast = extract_section(left_operative_report, uncleaned_txt)
-        left_text = left_breast[0] if len(left_breast) > 0 else ""
-        left_text = left_text[0] if isinstance(left_text, tuple) else left_text
-        right_breast = extract_section(right_operative_report, uncleaned_txt)
-        right_text = right_breast[0] if len(right_breast) > 0 else ""
-        right_text = right_text[0] if isinstance(right_text, tuple) else right_text
+        left_text, right_text = [section if section is not None else ""
+                                 for section in operative_sides_scan.first_sections(uncleaned_txt)]
 
         return [Report(text=left_text, report_id=report_id + "L", laterality="left", report_type=report_type),
                 Report(text=right_text, report_id=report_id + "R", laterality="right", report_type=report_type)]
@@ -137,16 +130,36 @@ def clean_up_reports(emr_text: List[Report]) -> Tuple[List[Report], List[str]]:
     ids_without_synoptic = []
     report_and_id = []
     for report in emr_text:
-        text = report.text
-        list_of_regex = export_operative_regex if report.report_type is ReportType.ALPHA else export_pathology_regex
-        extracted_reports = extract_synoptic_report(uncleaned_txt=text, report_id=report.report_id,
-                                                    list_of_regex=list_of_regex, report_type=report.report_type)
+        extracted_reports = extract_synoptic_sections(report)
         if isinstance(extracted_reports, str):
             ids_without_synoptic.append(extracted_reports)
         else:
-            if extracted_reports:
-                for cleaned_report in extracted_reports:
-                    report_and_id.append(cleaned_report)
-            else:
-                report_and_id.append(Report(text=text, report_id=report.report_id, report_type=report.report_type))
+            report_and_id += extracted_reports
     return report_and_id, ids_without_synoptic
+
+
+def iter_clean_up_reports(emr_text: Iterable[Report]) -> Iterator[Report]:
+    """
+    Lazy version of clean_up_reports, yields the sections of each report as soon as the report is pulled in.
+
+    :param emr_text:              reports that are currently not sorted or filtered
+    :return:                      reports that have been separated into preoperative breast, operative breast and operative axilla
+    """
+    for report in emr_text:
+        extracted_reports = extract_synoptic_sections(report)
+        if not isinstance(extracted_reports, str):
+            yield from extracted_reports
+
+
+def extract_synoptic_sections(report: Report) -> Union[List[Report], str]:
+    """
+    :param report:                a report that is currently not sorted or filtered
+    :return:                      the synoptic sections of the report, or the whole report if none were found
+    """
+    text = report.text
+    list_of_regex = export_operative_regex if report.report_type is ReportType.ALPHA else export_pathology_regex
+    extracted_reports = extract_synoptic_report(uncleaned_txt=text, report_id=report.report_id,
+                                                list_of_regex=list_of_regex, report_type=report.report_type)
+    if isinstance(extracted_reports, str) or extracted_reports:
+        return extracted_reports
+    return [Report(text=text, report_id=report.report_id, report_type=report.report_type)]
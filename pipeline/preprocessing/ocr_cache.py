@@ -0,0 +1,132 @@
+"""
+2021 Yifu (https://github.com/chen-yifu) and Lucy (https://github.com/lhao03)
+This file includes code that caches the text that optical character recognition (OCR) produced for a pdf.
+Entries are keyed by the content of the pdf and the OCR settings, so renamed or duplicated pdfs are only OCR'd once.
+The cache also remembers the text files it wrote, so only those are checked again and text files made in some other
+way are left alone.
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+from typing import List, Union
+
+from pipeline.utils.utils import hash_file
+
+
+class OCRCache:
+    """
+    Local SQLite cache of OCR results. Each entry holds the text of every page of one pdf. A report is only visible
+    once all of its pages were written in a single transaction, so a crashed run never leaves half of a report behind.
+    The database runs in WAL mode so several processes can read and write it at once.
+    """
+
+    def __init__(self, cache_path: str):
+        """
+        :param cache_path:    path to the sqlite file, created if it does not exist
+        """
+        self.cache_path = cache_path
+        self._local = threading.local()
+        folder = os.path.dirname(cache_path)
+        if folder and not os.path.exists(folder):
+            os.makedirs(folder, exist_ok=True)
+        with self._connect() as connection:
+            connection.execute("CREATE TABLE IF NOT EXISTS reports (key TEXT PRIMARY KEY, num_pages INTEGER)")
+            connection.execute("CREATE TABLE IF NOT EXISTS pages (key TEXT, page INTEGER, text TEXT, "
+                               "PRIMARY KEY (key, page))")
+            connection.execute("CREATE TABLE IF NOT EXISTS text_files (path TEXT PRIMARY KEY, text_hash TEXT, "
+                               "pdf_path TEXT, pdf_size INTEGER, pdf_mtime INTEGER, settings_hash TEXT)")
+
+    def _connect(self) -> sqlite3.Connection:
+        """
+        sqlite connections can not be shared between processes or threads, so every thread of every process opens its
+        own.
+
+        :return:              connection to the cache
+        """
+        local = self._local
+        if getattr(local, "connection", None) is None or local.pid != os.getpid():
+            local.connection = sqlite3.connect(self.cache_path, timeout=60)
+            local.connection.execute("PRAGMA journal_mode=WAL")
+            local.pid = os.getpid()
+        return local.connection
+
+    def __getstate__(self):
+        return {"cache_path": self.cache_path}
+
+    def __setstate__(self, state: dict):
+        self.cache_path = state["cache_path"]
+        self._local = threading.local()
+
+    @staticmethod
+    def hash_settings(ocr_settings: dict) -> str:
+        """
+        :param ocr_settings:      tesseract and pdf2image parameters
+        :return:                  short hash of the settings
+        """
+        settings = json.dumps(ocr_settings, sort_keys=True, default=str)
+        return hashlib.sha256(settings.encode("utf8")).hexdigest()[:16]
+
+    @staticmethod
+    def make_key(pdf_path: str, ocr_settings: dict) -> str:
+        """
+        :param pdf_path:          path to the pdf
+        :param ocr_settings:      tesseract and pdf2image parameters the pdf is OCR'd with
+        :return:                  key made of the pdf's content hash and the settings
+        """
+        return hash_file(pdf_path) + "-" + OCRCache.hash_settings(ocr_settings)
+
+    def get(self, key: str) -> Union[List[str], None]:
+        """
+        :param key:           key made by make_key
+        :return:              text of every page in order, None if the pdf has not been OCR'd with these settings
+        """
+        connection = self._connect()
+        row = connection.execute("SELECT num_pages FROM reports WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        pages = connection.execute("SELECT text FROM pages WHERE key = ? ORDER BY page", (key,)).fetchall()
+        return [page[0] for page in pages] if len(pages) == row[0] else None
+
+    def put(self, key: str, pages: List[str]):
+        """
+        :param key:           key made by make_key
+        :param pages:         text of every page in order
+        """
+        with self._connect() as connection:
+            connection.execute("DELETE FROM pages WHERE key = ?", (key,))
+            connection.executemany("INSERT INTO pages (key, page, text) VALUES (?, ?, ?)",
+                                   [(key, page_number, text) for page_number, text in enumerate(pages)])
+            connection.execute("INSERT OR REPLACE INTO reports (key, num_pages) VALUES (?, ?)", (key, len(pages)))
+
+    def record_text_file(self, text_path: str, pdf_path: str, ocr_settings: dict):
+        """
+        Remembers that the text file was just written from the pdf with these settings.
+
+        :param text_path:     path to the text file
+        :param pdf_path:      path to the pdf it was made from
+        :param ocr_settings:  tesseract and pdf2image parameters the pdf was OCR'd with
+        """
+        pdf_stat = os.stat(pdf_path)
+        with self._connect() as connection:
+            connection.execute("INSERT OR REPLACE INTO text_files (path, text_hash, pdf_path, pdf_size, pdf_mtime, "
+                               "settings_hash) VALUES (?, ?, ?, ?, ?, ?)",
+                               (os.path.abspath(text_path), hash_file(text_path), os.path.abspath(pdf_path),
+                                pdf_stat.st_size, pdf_stat.st_mtime_ns, self.hash_settings(ocr_settings)))
+
+    def is_stale_text_file(self, text_path: str, pdf_path: str, ocr_settings: dict) -> bool:
+        """
+        :param text_path:     path to the text file
+        :param pdf_path:      path to the pdf it is made from
+        :param ocr_settings:  tesseract and pdf2image parameters the pdf is OCR'd with
+        :return:              True if the cache wrote the text file, nobody changed it since, and the pdf or the
+                              settings changed. False for text files the cache did not write or that were edited
+        """
+        row = self._connect().execute("SELECT text_hash, pdf_path, pdf_size, pdf_mtime, settings_hash FROM text_files "
+                                      "WHERE path = ?", (os.path.abspath(text_path),)).fetchone()
+        if row is None or not os.path.exists(text_path) or hash_file(text_path) != row[0]:
+            return False
+        pdf_stat = os.stat(pdf_path)
+        return (os.path.abspath(pdf_path), pdf_stat.st_size, pdf_stat.st_mtime_ns, self.hash_settings(ocr_settings)) \
+            != tuple(row[1:])
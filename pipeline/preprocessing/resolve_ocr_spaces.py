@@ -2,13 +2,252 @@
 2021 Yifu (https://github.com/chen-yifu) and Lucy (https://github.com/lhao03)
 This file includes code that resolves errors that occur from optical character recognition (OCR).
 """
+import bisect
+import glob
+import hashlib
+import json
+import os
+import pickle
 import re
-from nltk.corpus import stopwords
+from typing import Iterable, Iterator, FrozenSet, List, Dict, Tuple
+from nltk.corpus import stopwords, words
 from pipeline.utils import utils
+from pipeline.utils.utils import get_process_pool, print_and_log
+from pipeline.utils.report import Report
+
+
+# bump when the words that go into the vocabulary change, so vocabularies saved on disk are rebuilt
+vocabulary_version = 2
+# number of vocabularies with different medical words kept in this process, the one built first is dropped after that
+max_vocabularies = 4
+# the english dictionary and stop words, built once per process and keyed by get_base_vocabulary_key
+base_vocabularies: Dict[str, FrozenSet[str]] = {}
+# base vocabulary with the medical words of a run, keyed by get_vocabulary_key
+vocabularies: Dict[str, FrozenSet[str]] = {}
+
+
+def get_base_vocabulary_key() -> str:
+    """
+    :return:                    key made of everything the base vocabulary is built from, the nltk word lists
+    """
+    inputs = {"version": vocabulary_version,
+              "words": {fileid: utils.hash_file(words.abspath(fileid)) for fileid in words.fileids()},
+              "stop words": utils.hash_file(stopwords.abspath("english"))}
+    return hashlib.sha256(json.dumps(inputs, sort_keys=True).encode("utf8")).hexdigest()[:16]
+
+
+def get_vocabulary_key(medical_vocabulary: List[str]) -> str:
+    """
+    :param medical_vocabulary:  words common to the PDFs
+    :return:                    key of the medical words added to the base vocabulary
+    """
+    inputs = json.dumps({"version": vocabulary_version, "medical vocabulary": sorted(set(medical_vocabulary))})
+    return hashlib.sha256(inputs.encode("utf8")).hexdigest()[:16]
+
+
+def build_base_vocabulary() -> FrozenSet[str]:
+    """
+    :return:                    the english dictionary and stop words that OCR fragments are merged into
+    """
+    # vocabularies in english dictionaries, words must be longer than 2
+    eng_vocab = [w for w in utils.get_english_dictionary_as_list() if len(w) > 2]  # only words longer than 2
+    eng_vocab += list(stopwords.words('english'))  # add stop words
+    eng_vocab.remove("i")  # lower case "i" is a common cause of extra white space
+    return frozenset(eng_vocab)
+
+
+def build_vocabulary(medical_vocabulary: List[str], base_vocabulary: FrozenSet[str] = None) -> FrozenSet[str]:
+    """
+    :param medical_vocabulary:  words common to the PDFs
+    :param base_vocabulary:     the vocabulary from build_base_vocabulary, built if None
+    :return:                    the english dictionary, stop words and medical words that OCR fragments are merged into
+    """
+    if base_vocabulary is None:
+        base_vocabulary = build_base_vocabulary()
+    # common (frequency > min_freq) vocabularies specific to the PDFs, keep only long words (exclude punctuations)
+    return base_vocabulary.union(w for w in medical_vocabulary if len(w) > 2)
+
+
+def get_base_vocabulary(cache_folder: str = None) -> FrozenSet[str]:
+    """
+    Builds the base vocabulary once per process. If cache_folder is given it is also pickled there, so later runs only
+    load it, and the vocabularies pickled there before are deleted.
+
+    :param cache_folder:        folder the vocabulary is saved in, it is not saved if None
+    :return:                    the base vocabulary
+    """
+    key = get_base_vocabulary_key()
+    if key in base_vocabularies:
+        return base_vocabularies[key]
+    vocabulary_path = os.path.join(cache_folder, "ocr_vocabulary_{}.pickle".format(key)) if cache_folder else None
+    vocabulary = None
+    if vocabulary_path and os.path.exists(vocabulary_path):
+        try:
+            with open(vocabulary_path, "rb") as f:
+                vocabulary = pickle.load(f)
+        except Exception:
+            vocabulary = None
+    if vocabulary is None:
+        vocabulary = build_base_vocabulary()
+        if vocabulary_path:
+            os.makedirs(cache_folder, exist_ok=True)
+            temporary_path = vocabulary_path + ".part"
+            with open(temporary_path, "wb") as f:
+                pickle.dump(vocabulary, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(temporary_path, vocabulary_path)
+            for old_path in glob.glob(os.path.join(cache_folder, "ocr_vocabulary_*.pickle*")):
+                if old_path != vocabulary_path:
+                    os.remove(old_path)
+    base_vocabularies.clear()
+    base_vocabularies[key] = vocabulary
+    return vocabulary
+
+
+def get_vocabulary(medical_vocabulary: List[str] = [], cache_folder: str = None) -> FrozenSet[str]:
+    """
+    Adds the medical words to the base vocabulary once per process, only the base vocabulary is saved.
+
+    :param medical_vocabulary:  words common to the PDFs
+    :param cache_folder:        folder the base vocabulary is saved in, it is not saved if None
+    :return:                    the vocabulary
+    """
+    key = get_vocabulary_key(medical_vocabulary)
+    if key in vocabularies:
+        return vocabularies[key]
+    vocabulary = build_vocabulary(medical_vocabulary, get_base_vocabulary(cache_folder))
+    if len(vocabularies) >= max_vocabularies:
+        dropped = vocabularies.pop(next(iter(vocabularies)))
+        prefix_indexes.pop(id(dropped), None)
+    vocabularies[key] = vocabulary
+    return vocabulary
+
+
+class PrefixIndex:
+    """
+    Sorted array of the vocabulary that answers whether any word starts with a prefix with a binary search. Used like a
+    trie, it stops the merging of OCR fragments as soon as no vocabulary word can start with the merged fragments, but
+    it takes a fraction of the memory of a trie made of dicts.
+    """
+
+    def __init__(self, vocabulary: Iterable[str]):
+        """
+        :param vocabulary:      words that fragments are merged into
+        """
+        self.sorted_words = sorted(vocabulary)
+        self.max_length = max((len(word) for word in self.sorted_words), default=0)
+
+    def has_prefix(self, prefix: str) -> bool:
+        """
+        :param prefix:          start of a word
+        :return:                True if a word of the vocabulary starts with prefix
+        """
+        index = bisect.bisect_left(self.sorted_words, prefix)
+        return index < len(self.sorted_words) and self.sorted_words[index].startswith(prefix)
+
+
+# prefix indexes of the vocabularies used in this process, keyed by id, the vocabulary is kept so the id stays unique
+prefix_indexes: Dict[int, Tuple[FrozenSet[str], PrefixIndex]] = {}
+
+
+def get_prefix_index(vocabulary: FrozenSet[str]) -> PrefixIndex:
+    """
+    :param vocabulary:          the vocabulary from get_vocabulary
+    :return:                    the prefix index of the vocabulary, built once per process
+    """
+    if id(vocabulary) not in prefix_indexes:
+        prefix_indexes[id(vocabulary)] = (vocabulary, PrefixIndex(vocabulary))
+    return prefix_indexes[id(vocabulary)][1]
+
+
+def merge_fragments(words_list: List[str], alpha_positions: List[int], position: int, vocab: FrozenSet[str],
+                    prefix_index: PrefixIndex) -> Tuple[str, int]:
+    """
+    Merges the out of vocabulary word at alpha_positions[position] with the words after it until the merged word is in
+    the vocabulary. Gives up when a word after it is in the vocabulary, the merged word is longer than any vocabulary
+    word or no vocabulary word starts with it, so at most the length of the longest vocabulary word is looked at.
+
+    :param words_list:          the words and separators of the report
+    :param alpha_positions:     positions of the alphabetical words in words_list
+    :param position:            index in alpha_positions of the word that is not in the vocabulary
+    :param vocab:               the vocabulary
+    :param prefix_index:        prefix index of the vocabulary
+    :return:                    the merged word, or the word itself, and the number of words after it that were merged
+    """
+    word = words_list[alpha_positions[position]]
+    candidate_word = ""
+    for num_merged in range(len(alpha_positions) - position):
+        next_word = words_list[alpha_positions[position + num_merged]]
+        candidate_word += next_word
+        candidate_key = candidate_word.lower().strip()
+        if candidate_key in vocab:
+            return candidate_word, num_merged
+        if next_word.lower().strip() in vocab or len(candidate_word) > prefix_index.max_length:
+            break
+        # lowercasing the capital sigma depends on the letters around it, so only stop early on a prefix without it
+        if "\u03a3" not in candidate_word and not prefix_index.has_prefix(candidate_key):
+            break
+    return word, 0
+
+
+def resolve_ocr(raw_string, medical_vocabulary=[], vocabulary: FrozenSet[str] = None):
+    """
+    resolve extra white space in raw string by merging two fragments
+    :param medical_vocabulary:
+    :param raw_string:          str;        raw string
+    :param vocabulary:          the vocabulary from get_vocabulary, built from medical_vocabulary if None
+    :return:                    str;        resolved string
+    """
+
+    # words_list = [w.lower() for w in re.findall(r'\S+|\n', raw_string)]  # make everything lowercase
+    # demo: (?<=[ \n\W])|(?=[ \n\W])
+    # equivalent to string.split(), but retains linebreaks
+    words_list = re.split("(?<=[ \n\W])|(?=[ \n\W])", raw_string)
+
+    vocab = vocabulary if vocabulary is not None else get_vocabulary(medical_vocabulary)
+    prefix_index = get_prefix_index(vocab)
+    alpha_positions = [i for i, word in enumerate(words_list) if word.strip().isalpha()]
+    result_words = []
+    skip = 0
+    position = 0
+    for word in words_list:
+        if not word.strip().isalpha():
+            result_words.append(word)
+            continue
+        position += 1
+        # if this word was merged into the word before it, don't process it
+        if skip > 0:
+            skip -= 1
+        elif word.lower().strip() not in vocab:
+            merged_word, skip = merge_fragments(words_list, alpha_positions, position - 1, vocab, prefix_index)
+            result_words.append(merged_word)
+        else:
+            result_words.append(word)
+    resolved_words = "".join(result_words)
+    return resolved_words
+
+
+# vocabulary of the worker processes of preprocess_resolve_ocr_spaces, set once when a worker starts
+worker_vocabulary: FrozenSet[str] = frozenset()
+
+
+def init_resolve_worker(vocabulary: FrozenSet[str]):
+    """
+    :param vocabulary:              the vocabulary, shared copy-on-write if the workers are forked
+    """
+    global worker_vocabulary
+    worker_vocabulary = vocabulary
+
+
+def resolve_ocr_in_worker(raw_string: str) -> str:
+    """
+    :param raw_string:              text of a report
+    :return:                        the resolved text
+    """
+    return re.sub(" +", " ", resolve_ocr(raw_string, vocabulary=worker_vocabulary))
 
 
 def preprocess_resolve_ocr_spaces(strings_and_ids, medical_vocabulary=[], print_debug=True,
-                                  log_box=None, app=None):
+                                  log_box=None, app=None, vocabulary_cache_folder: str = None, max_workers: int = 1):
     """
     given a list of strings and ids, using a english vocabulary, resolve redundant white spaces from OCR.
     Example: "Inv asive Carcinoma" should be corrected as "Invasive Carcinoma" because "Inv" and "Asive" are not in the
@@ -18,77 +257,51 @@ def preprocess_resolve_ocr_spaces(strings_and_ids, medical_vocabulary=[], print_
     :param strings_and_ids:         a list of (str, str) tuples;        represents the strings and study_ids of PDFs
     :param medical_vocabulary:      a list of str;                      a list of valid english words_list common to PDFs
     :param print_debug:             boolean;                            print debug statements in Terminal if true
+    :param log_box:                 tk.Text the progress is logged to, not used if None
+    :param app:                     the GUI of log_box
+    :param vocabulary_cache_folder: folder the vocabulary is saved in so later runs can load it, not saved if None
+    :param max_workers:             number of worker processes the reports are spread over, None for the number of
+                                    cores and 1 to resolve them in this process
     :return:
     """
+    reports = list(strings_and_ids)
+    vocabulary = get_vocabulary(medical_vocabulary, vocabulary_cache_folder)
+    # built before the workers are started so forked workers share it
+    get_prefix_index(vocabulary)
+    pool = None
+    if max_workers != 1 and len(reports) > 1:
+        pool = get_process_pool(max_workers, initializer=init_resolve_worker, initargs=(vocabulary,))
+        chunksize = max(1, len(reports) // ((max_workers or os.cpu_count() or 1) * 4))
+        # map keeps the order of the reports
+        resolved_strings = pool.map(resolve_ocr_in_worker, [report.text for report in reports], chunksize=chunksize)
+    else:
+        resolved_strings = (re.sub(" +", " ", resolve_ocr(report.text, vocabulary=vocabulary)) for report in reports)
+    try:
+        log_every = max(1, len(reports) // 10)
+        for index, (report, resolved_string) in enumerate(zip(reports, resolved_strings), 1):
+            report.text = resolved_string
+            if index % log_every == 0 or index == len(reports):
+                print_and_log("Resolved OCR spaces of {} of {} reports.".format(index, len(reports)), print_debug,
+                              log_box, app)
+    finally:
+        if pool:
+            pool.shutdown()
+    return reports
 
-    def resolve_ocr(raw_string, medical_vocabulary=[]):
-        """
-        resolve extra white space in raw string by merging two fragments
-        :param medical_vocabulary:
-        :param raw_string:          str;        raw string
-        :return:                    str;        resolved string
-        """
 
-        # words_list = [w.lower() for w in re.findall(r'\S+|\n', raw_string)]  # make everything lowercase
-        # demo: (?<=[ \n\W])|(?=[ \n\W])
-        # equivalent to string.split(), but retains linebreaks
-        words_list = re.split("(?<=[ \n\W])|(?=[ \n\W])", raw_string)
-
-        # common (frequency > min_freq) vocabularies specific to the PDFs, keep only long words (exclude punctuations)
-        medical_vocabulary = [w for w in medical_vocabulary if len(w) > 2]
-
-        # vocabularies in english dictionaries, words must be longer than 2
-        eng_vocab = [w for w in utils.get_english_dictionary_as_list() if len(w) > 2]  # only words longer than 2
-        eng_vocab += list(stopwords.words('english'))  # add stop words
-        eng_vocab.remove("i")  # lower case "i" is a common cause of extra white space
-        vocab = set(medical_vocabulary + eng_vocab)
-        result_words = []
-        skip = 0
-        for i, word in enumerate(words_list):
-            if not word.strip().isalpha():
-                result_words.append(word)
-                continue
-            # if this words_list need to be skipped, or if this word is last word in list, don't process it
-            # word = word.strip()
-            if skip > 0:
-                skip -= 1
-            elif word.lower().strip() not in vocab:
-                candidate_word = ""
-                for next_word in words_list[i:]:
-                    if not next_word.strip().isalpha():
-                        continue
-                    candidate_word += next_word
-                    skip += 1
-                    if candidate_word.lower().strip() in vocab:
-                        skip -= 1
-                        break
-                    else:
-                        if next_word.lower().strip() in vocab:
-                            skip = 0
-                            break
-                        else:
-                            continue
-
-                if candidate_word.lower().strip() in vocab:
-                    result_words.append(candidate_word)
-                else:
-                    result_words.append(word)
-                    skip = 0
-
-            else:
-                if skip == 0:
-                    result_words.append(word)
-        resolved_words = "".join(result_words)
-        return resolved_words
-
-    result = []
-    for index, report in enumerate(strings_and_ids):
-        resolved_string = resolve_ocr(report.text, medical_vocabulary=medical_vocabulary)
+def iter_resolve_ocr_spaces(reports: Iterable[Report], medical_vocabulary=[],
+                            vocabulary_cache_folder: str = None) -> Iterator[Report]:
+    """
+    Lazy version of preprocess_resolve_ocr_spaces, resolves each report as it is pulled from the iterable.
+
+    :param reports:                 reports to resolve
+    :param medical_vocabulary:      a list of str;                      a list of valid english words_list common to PDFs
+    :param vocabulary_cache_folder: folder the vocabulary is saved in so later runs can load it, not saved if None
+    :return:                        the reports with their text resolved
+    """
+    vocabulary = get_vocabulary(medical_vocabulary, vocabulary_cache_folder)
+    for report in reports:
+        resolved_string = resolve_ocr(report.text, vocabulary=vocabulary)
         resolved_string = re.sub(" +", " ", resolved_string)
         report.text = resolved_string
-        result.append(report)
-
-    return result
-
-
-
+        yield report
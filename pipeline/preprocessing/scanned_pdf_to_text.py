@@ -3,18 +3,56 @@
 This file includes code that converts PDFs to .txt documents.
 We use pytesseract (https://pypi.org/project/pytesseract/).
 """
+import abc
+import contextlib
+import itertools
+import queue
 import re
-from typing import List
+import shlex
+import string
+import subprocess
+import tempfile
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from typing import List, Tuple, Dict, Iterator, Union, Iterable, Pattern
 import pdftotext
 import pytesseract
-from pdf2image import convert_from_path
+from pdf2image import convert_from_path, pdfinfo_from_path
+from PIL import Image
 import os
 import io
 from appdirs import unicode
-from pipeline.utils import utils
+from pipeline.preprocessing.ocr_cache import OCRCache
+from pipeline.utils.utils import get_process_pool
+from pipeline.utils.regex_tools import add_asterisk
+from pipeline.utils.text_views import SpacedSearch, get_searches
 from pipeline.utils.report import Report
 from pipeline.utils.report_type import ReportType
 
+# parameters passed to pdf2image and tesseract, they are part of the OCR cache key. if "use text layer", the embedded
+# text of a page is used instead of OCR when it has at least "text layer min words" words, and at least
+# "text layer min word ratio" of its tokens look like words. a page is rendered in grayscale if "grayscale" and turned
+# into black and white at "binarize threshold" (0-255) if it is not None. "psm", "oem" and "whitelist" are passed to
+# tesseract as --psm, --oem and tessedit_char_whitelist if they are set. if there are "page anchors", every page is
+# first OCR'd at "anchor dpi" and only the pages from the first page with an anchor to the end of the report are
+# OCR'd at full "dpi". "max pages" limits the pages read per report if it is set.
+# "ocr backend" is one of ocr_backends and "batch size" is the number of pages of a report given to it at once
+default_ocr_settings = {"dpi": 200, "max pages": None, "tesseract config": "", "use text layer": True,
+                        "text layer min words": 20, "text layer min word ratio": 0.6, "grayscale": False,
+                        "binarize threshold": None, "psm": None, "oem": None, "whitelist": "", "page anchors": [],
+                        "anchor dpi": 72, "ocr backend": "pytesseract", "batch size": 1}
+# characters of the reports, a "whitelist" that keeps tesseract from reading smudges as other symbols. it can not
+# have quotes, backslashes or white space since the config is split like a command line
+report_characters = string.ascii_letters + string.digits + ".,:;()/-%+<>#&*=?[]"
+word_shape_regex = re.compile(r"[(\"']*[A-Za-z][A-Za-z'-]*[)\"'.,:;!?]*")
+
+
+# footers, separators and distracting text of the pdf text layer, compiled once per process
+extra_text_regex = re.compile(r".*(?:Resuts For|Based on.*AJCC|Prepared.*PLEXIA.*|FINAL RESULTS|Based on.*AJCC|"
+                              r".*Page\s*\d\s*of\s*\d.*|https.*|For VCH|For VPP|For PHC).*")
+linebreaks_regex = re.compile(r"\n{1,}")
+
 
 def preprocess_remove_extra_text(input_report):
     """
@@ -22,46 +60,497 @@ def preprocess_remove_extra_text(input_report):
     :param input_report:        string;         the raw extracted text from pdf
     :return:                    string;         preprocessed string
     """
-
-    regex = r".*(?:Resuts For|Based on.*AJCC|Prepared.*PLEXIA.*|FINAL RESULTS|Based on.*AJCC|.*Page\s*\d\s*of\s*\d.*|https.*|For VCH|For VPP|For PHC).*"
-    utils.util_resolve_ocr_spaces(regex)
-    res = re.sub(regex, "", input_report)  # remove footer, separator, and distracting texts
-    res = re.sub(r"\n{1,}", "\n", res)  # remove redundant linebreak
+    res = extra_text_regex.sub("", input_report)  # remove footer, separator, and distracting texts
+    res = linebreaks_regex.sub("\n", res)  # remove redundant linebreak
     return res
 
 
-def convert_pdfs_to_texts(path_to_input: str, paths_to_pdfs: List[str], paths_to_texts: List[str]):
+def extract_text_layer(pdf_path: str, do_preprocessing: bool = True) -> str:
     """
-     Converts pdf reports into images that is finally converted to text by optical character recognition
+    Reads the text layer of a pdf with pdftotext. Runs inside the worker processes of extract_text_layers.
+
+    :param pdf_path:             path to the pdf
+    :param do_preprocessing:     whether or not you want to clean the text
+    :return:                     text of every page joined in order
+    """
+    with open(pdf_path, "rb") as pdf_file:
+        pdf_text = "".join(pdftotext.PDF(pdf_file))
+    return preprocess_remove_extra_text(pdf_text) if do_preprocessing else pdf_text
+
+
+def extract_text_layer_pages(pdf_path: str) -> List[str]:
+    """
+    :param pdf_path:             path to the pdf
+    :return:                     raw text layer of every page in order, empty strings for pages without one
+    """
+    with open(pdf_path, "rb") as pdf_file:
+        return list(pdftotext.PDF(pdf_file))
+
+
+def is_usable_text_layer(page_text: str, ocr_settings: dict = None) -> bool:
+    """
+    Cheap quality check of the text layer of a page. Scanned pages have no text layer or one made of garbage, so too
+    few of their tokens look like words.
+
+    :param page_text:            text layer of the page
+    :param ocr_settings:         see default_ocr_settings for the thresholds
+    :return:                     True if the text layer can be used instead of OCR
+    """
+    ocr_settings = get_ocr_settings(ocr_settings)
+    tokens = page_text.split()
+    num_words = sum(1 for token in tokens if word_shape_regex.fullmatch(token))
+    return num_words >= ocr_settings["text layer min words"] and \
+        num_words >= ocr_settings["text layer min word ratio"] * len(tokens)
+
+
+def try_extract_text_layer(pdf_path: str, do_preprocessing: bool = True) -> Union[str, None]:
+    """
+    :param pdf_path:             path to the pdf
+    :param do_preprocessing:     whether or not you want to clean the text
+    :return:                     text of the pdf, None if it is missing or can not be read
+    """
+    try:
+        return extract_text_layer(pdf_path, do_preprocessing)
+    except Exception:
+        return None
+
+
+def extract_text_layers(paths_to_pdfs: List[str], max_workers: int = None, do_preprocessing: bool = True,
+                        chunksize: int = 16) -> List[Union[str, None]]:
+    """
+    Reads the text layer of many pdfs at once with a pool of worker processes, so loading a large batch of reports is
+    bound by the disk instead of a single core.
+
+    :param paths_to_pdfs:        paths to the pdf files
+    :param max_workers:          number of worker processes, defaults to the number of cores. 1 reads in this process
+    :param do_preprocessing:     whether or not you want to clean the text, done inside the workers
+    :param chunksize:            number of pdfs sent to a worker at a time
+    :return:                     text of each pdf in the order of paths_to_pdfs, None if it could not be read
+    """
+    if max_workers == 1 or len(paths_to_pdfs) < 2:
+        return [try_extract_text_layer(pdf_path, do_preprocessing) for pdf_path in paths_to_pdfs]
+    with get_process_pool(max_workers) as pool:
+        return list(pool.map(try_extract_text_layer, paths_to_pdfs, [do_preprocessing] * len(paths_to_pdfs),
+                             chunksize=chunksize))
+
+
+def get_ocr_settings(ocr_settings: dict = None) -> dict:
+    """
+    :param ocr_settings:         OCR settings, can be missing some or all of the keys of default_ocr_settings
+    :return:                     the settings with every missing key taken from default_ocr_settings
+    """
+    return {**default_ocr_settings, **ocr_settings} if ocr_settings else default_ocr_settings
+
+
+def make_ocr_settings_grid(options: Dict[str, list], ocr_settings: dict = None) -> List[dict]:
+    """
+    :param options:              OCR setting mapped to the values to try, for example {"dpi": [150, 200, 300]}
+    :param ocr_settings:         the settings not in options, see default_ocr_settings
+    :return:                     OCR settings for every combination of the values in options
+    """
+    ocr_settings = get_ocr_settings(ocr_settings)
+    return [{**ocr_settings, **dict(zip(options.keys(), values))} for values in itertools.product(*options.values())]
+
+
+def get_tesseract_config(ocr_settings: dict) -> str:
+    """
+    :param ocr_settings:         OCR settings, see default_ocr_settings
+    :return:                     the command line config passed to tesseract
+    """
+    config = [ocr_settings["tesseract config"]] if ocr_settings["tesseract config"] else []
+    if ocr_settings["psm"] is not None:
+        config.append("--psm {}".format(ocr_settings["psm"]))
+    if ocr_settings["oem"] is not None:
+        config.append("--oem {}".format(ocr_settings["oem"]))
+    if ocr_settings["whitelist"]:
+        config.append("-c tessedit_char_whitelist={}".format(ocr_settings["whitelist"]))
+    return " ".join(config)
+
+
+def get_pdf_page_count(pdf_path: str) -> int:
+    """
+    :param pdf_path:      path to the pdf
+    :return:              number of pages in the pdf
+    """
+    return int(pdfinfo_from_path(pdf_path)["Pages"])
+
+
+def write_text_file(path_to_txt: str, text: str):
+    """
+    Writes to a temporary file first and then renames it, so a crash never leaves a half-written text file behind.
+
+    :param path_to_txt:          path to the text file
+    :param text:                 the text to write
+    """
+    temporary_path = path_to_txt + ".part"
+    with io.open(temporary_path, 'w', encoding='utf8') as f:
+        f.write(text)
+    os.replace(temporary_path, path_to_txt)
+
+
+def needs_text_file(pdf_path: str, text_path: str, ocr_cache: OCRCache = None, ocr_settings: dict = None,
+                    refresh_text_files: bool = False) -> bool:
+    """
+    :param pdf_path:             path to the pdf
+    :param text_path:            path to the text file that is read in for it
+    :param ocr_cache:            cache of previous OCR results, not used if None
+    :param ocr_settings:         pdf2image and tesseract parameters, see default_ocr_settings
+    :param refresh_text_files:   write the text file again even if it was not written by the OCR cache
+    :return:                     True if the pdf has to be turned into its text file. a text file that exists is only
+                                 written again if the OCR cache wrote it and its pdf or the settings changed since
+    """
+    if pdf_path == text_path or not os.path.exists(pdf_path):
+        return False
+    if refresh_text_files or not os.path.exists(text_path):
+        return True
+    return bool(ocr_cache) and ocr_cache.is_stale_text_file(text_path, pdf_path, get_ocr_settings(ocr_settings))
+
+
+class OCRBackend(abc.ABC):
+    """
+    Turns rendered page images into text. Backends are picked by the "ocr backend" OCR setting, see ocr_backends.
+    """
+
+    @abc.abstractmethod
+    def images_to_strings(self, images: Iterable[Image.Image], config: str) -> List[str]:
+        """
+        :param images:               page images, the backend closes each image once it is done with it
+        :param config:               the command line config passed to tesseract
+        :return:                     the text of each image in order
+        """
+
+
+class PytesseractBackend(OCRBackend):
+    """
+    Calls tesseract once per page through pytesseract, the page is passed straight from memory.
+    """
+
+    def images_to_strings(self, images: Iterable[Image.Image], config: str) -> List[str]:
+        texts = []
+        for image in images:
+            texts.append(pytesseract.image_to_string(image, config=config))
+            image.close()
+        return texts
+
+
+class BatchTesseractBackend(OCRBackend):
+    """
+    Calls tesseract once for a whole batch of pages with a list file, so the tesseract process is started and its
+    language data is loaded once per batch instead of once per page. tesseract ends every page with a form feed, which
+    is used to split the output back into pages.
+    """
+
+    def images_to_strings(self, images: Iterable[Image.Image], config: str) -> List[str]:
+        with tempfile.TemporaryDirectory() as folder:
+            image_paths = []
+            for image in images:
+                image_paths.append(os.path.join(folder, "page_{}.png".format(len(image_paths))))
+                image.save(image_paths[-1])
+                image.close()
+            list_path = os.path.join(folder, "pages.txt")
+            with open(list_path, "w") as f:
+                f.write("\n".join(image_paths) + "\n")
+            output = subprocess.run([pytesseract.pytesseract.tesseract_cmd, list_path, "stdout"] + shlex.split(config),
+                                    stdout=subprocess.PIPE, stderr=subprocess.PIPE, check=True).stdout.decode("utf8")
+        # keep the form feed at the end of each page, like the output of pytesseract
+        pages = output.split("\f")
+        if len(pages) < len(image_paths):
+            raise ValueError("tesseract returned {} pages for {} images".format(len(pages), len(image_paths)))
+        return [page + "\f" for page in pages[:len(image_paths)]]
+
+
+# the backends that can be picked with the "ocr backend" OCR setting
+ocr_backends = {"pytesseract": PytesseractBackend(), "tesseract batch": BatchTesseractBackend()}
+
+
+def render_pdf_page(path_to_input: str, pdf_path: str, page_number: int, ocr_settings: dict = None,
+                    save_page_images: bool = False) -> Image.Image:
+    """
+    :param path_to_input:        path to input folder, page images are saved under images/ if save_page_images
+    :param pdf_path:             path to the pdf
+    :param page_number:          the page to render, starting at 1
+    :param ocr_settings:         pdf2image and tesseract parameters, see default_ocr_settings
+    :param save_page_images:     debug mode, also save the rendered page as a jpg
+    :return:                     the page image
+    """
+    ocr_settings = get_ocr_settings(ocr_settings)
+    page = convert_from_path(pdf_path, dpi=ocr_settings["dpi"], first_page=page_number, last_page=page_number,
+                             grayscale=ocr_settings["grayscale"])[0]
+    if ocr_settings["binarize threshold"] is not None:
+        threshold = ocr_settings["binarize threshold"]
+        binarized_page = page.convert("L").point(lambda pixel: 255 if pixel > threshold else 0, mode="1")
+        page.close()
+        page = binarized_page
+    if save_page_images:
+        sub_dir = str(path_to_input + "images/" + pdf_path.split('/')[-1].replace('.pdf', '')[0:20] + "/")
+        if not os.path.exists(sub_dir):
+            os.makedirs(sub_dir, exist_ok=True)
+        filename = "pg_" + str(page_number) + '_' + pdf_path.split('/')[-1].replace('.pdf', '.jpg')
+        page.save(sub_dir + filename)
+    return page
+
+
+def ocr_pdf_pages(path_to_input: str, pdf_path: str, page_numbers: List[int], ocr_settings: dict = None,
+                  save_page_images: bool = False) -> List[Tuple[str, float]]:
+    """
+    Renders pages of a pdf one at a time and converts them to text with the OCR backend of the settings. Runs inside
+    the worker processes of convert_pdfs_to_texts.
+
+    :param path_to_input:        path to input folder, page images are saved under images/ if save_page_images
+    :param pdf_path:             path to the pdf
+    :param page_numbers:         the pages to convert, starting at 1
+    :param ocr_settings:         pdf2image and tesseract parameters, see default_ocr_settings
+    :param save_page_images:     debug mode, also save the rendered pages as jpgs
+    :return:                     the text of each page and the seconds it took, the batch's time is split evenly
+    """
+    ocr_settings = get_ocr_settings(ocr_settings)
+    start_time = time.perf_counter()
+    pages = (render_pdf_page(path_to_input, pdf_path, page_number, ocr_settings, save_page_images)
+             for page_number in page_numbers)
+    texts = ocr_backends[ocr_settings["ocr backend"]].images_to_strings(pages, get_tesseract_config(ocr_settings))
+    seconds = (time.perf_counter() - start_time) / len(page_numbers)
+    return [(unicode(text + "\n"), seconds) for text in texts]
+
+
+def ocr_pdf_page(path_to_input: str, pdf_path: str, page_number: int, ocr_settings: dict = None,
+                 save_page_images: bool = False) -> Tuple[str, float]:
+    """
+    Renders a single page of a pdf and converts it to text by optical character recognition.
+
+    :param path_to_input:        path to input folder, page images are saved under images/ if save_page_images
+    :param pdf_path:             path to the pdf
+    :param page_number:          the page to convert, starting at 1
+    :param ocr_settings:         pdf2image and tesseract parameters, see default_ocr_settings
+    :param save_page_images:     debug mode, also save the rendered page as a jpg
+    :return:                     the text of the page and the seconds it took
+    """
+    return ocr_pdf_pages(path_to_input, pdf_path, [page_number], ocr_settings, save_page_images)[0]
+
+
+def ocr_pages(path_to_input: str, paths_to_pdfs: List[str], pages_per_report: Dict[int, List[int]],
+              max_workers: int = None, ocr_settings: dict = None, save_page_images: bool = False,
+              pool: ProcessPoolExecutor = None) -> Iterator[Tuple[int, int, str, float]]:
+    """
+    OCRs the pages of many reports. The pages of a report are split into batches of "batch size" pages. With one
+    worker the batches are done in order inside this process, otherwise they are spread over a pool of worker
+    processes and yielded as they finish.
+
+    :param path_to_input:        path to input folder
+    :param paths_to_pdfs:        paths to the pdf files
+    :param pages_per_report:     index of a pdf in paths_to_pdfs mapped to the page numbers to OCR, starting at 1
+    :param max_workers:          number of worker processes, defaults to the number of cores
+    :param ocr_settings:         pdf2image and tesseract parameters, see default_ocr_settings
+    :param save_page_images:     debug mode, also save the rendered pages as jpgs
+    :param pool:                 pool of worker processes to use instead of starting one, see get_process_pool
+    :return:                     (pdf index, page number, text, seconds), text is None if the page could not be read
+    """
+    batch_size = get_ocr_settings(ocr_settings)["batch size"]
+    tasks = [(index, page_numbers[i:i + batch_size]) for index, page_numbers in pages_per_report.items()
+             for i in range(0, len(page_numbers), batch_size)]
+    if max_workers == 1 and pool is None:
+        for index, page_numbers in tasks:
+            try:
+                results = ocr_pdf_pages(path_to_input, paths_to_pdfs[index], page_numbers, ocr_settings,
+                                        save_page_images)
+            except Exception:
+                results = [(None, 0)] * len(page_numbers)
+            for page_number, (text, seconds) in zip(page_numbers, results):
+                yield index, page_number, text, seconds
+        return
+
+    # a pool that is passed in is left running for the next call
+    with contextlib.nullcontext(pool) if pool else get_process_pool(max_workers) as ocr_pool:
+        futures = {ocr_pool.submit(ocr_pdf_pages, path_to_input, paths_to_pdfs[index], page_numbers, ocr_settings,
+                                   save_page_images): (index, page_numbers) for index, page_numbers in tasks}
+        for future in as_completed(futures):
+            index, page_numbers = futures[future]
+            try:
+                results = future.result()
+            except Exception:
+                results = [(None, 0)] * len(page_numbers)
+            for page_number, (text, seconds) in zip(page_numbers, results):
+                yield index, page_number, text, seconds
+
+
+def pages_from_first_anchor(page_texts: List[Union[str, None]], page_numbers: List[int],
+                            anchor_searches: List[Union[SpacedSearch, Pattern]]) -> List[int]:
+    """
+    A synoptic section can run on for any number of pages after its anchor, and the low resolution pass can miss the
+    anchor of a later section, so every page after the first anchor is kept.
+
+    :param page_texts:           text of each page of a report, None for the pages that were not read
+    :param page_numbers:         the page numbers to choose from, starting at 1
+    :param anchor_searches:      searches of the page anchors, see get_searches
+    :return:                     the page numbers from the first page with an anchor on, all of them if there is none
+    """
+    anchored = [page_number for page_number, text in enumerate(page_texts, 1)
+                if text and any(anchor_search.search(text) for anchor_search in anchor_searches)]
+    if not anchored:
+        return page_numbers
+    return [page_number for page_number in page_numbers if page_number >= anchored[0]]
+
+
+def select_anchored_pages(path_to_input: str, paths_to_pdfs: List[str], pages_per_report: Dict[int, List[int]],
+                          texts_per_report: Dict[int, List[Union[str, None]]], max_workers: int = None,
+                          ocr_settings: dict = None, pool: ProcessPoolExecutor = None) -> Dict[int, List[int]]:
+    """
+    First pass of targeted OCR. The pages waiting for OCR are OCR'd at low resolution to find the pages with a
+    synoptic anchor, the text layer is used for the other pages. The pages from the first anchored page to the end of
+    the report are kept for full OCR, see pages_from_first_anchor. The pages that are skipped are left empty in
+    texts_per_report.
+
+    :param path_to_input:        path to input folder
+    :param paths_to_pdfs:        paths to the pdf files
+    :param pages_per_report:     index of a pdf in paths_to_pdfs mapped to the page numbers to OCR, starting at 1
+    :param texts_per_report:     index of a pdf mapped to the text of each page, None for the pages to OCR
+    :param max_workers:          number of worker processes, defaults to the number of cores
+    :param ocr_settings:         OCR settings with "page anchors", see default_ocr_settings
+    :param pool:                 pool of worker processes to use instead of starting one, see get_process_pool
+    :return:                     index of a pdf mapped to the page numbers to OCR at full resolution
+    """
+    ocr_settings = get_ocr_settings(ocr_settings)
+    # each anchor is looked for on its own, most without spaces in a view of the page, see SpacedSearch
+    anchor_searches = get_searches([re.compile(add_asterisk(anchor), re.IGNORECASE)
+                                    for anchor in ocr_settings["page anchors"]])
+    low_resolution_settings = {**ocr_settings, "dpi": ocr_settings["anchor dpi"]}
+    draft_texts = {index: list(texts_per_report[index]) for index in pages_per_report}
+    for index, page_number, text, _ in ocr_pages(path_to_input, paths_to_pdfs, pages_per_report, max_workers,
+                                                 low_resolution_settings, pool=pool):
+        draft_texts[index][page_number - 1] = text
+
+    selected_pages_per_report = {}
+    for index, page_numbers in pages_per_report.items():
+        selected_pages_per_report[index] = pages_from_first_anchor(draft_texts[index], page_numbers, anchor_searches)
+        for page_number in set(page_numbers) - set(selected_pages_per_report[index]):
+            texts_per_report[index][page_number - 1] = ""
+    return selected_pages_per_report
+
+
+def convert_pdfs_to_texts(path_to_input: str, paths_to_pdfs: List[str], paths_to_texts: List[str],
+                          max_workers: int = None, print_debug: bool = True, ocr_cache: OCRCache = None,
+                          ocr_settings: dict = None, save_page_images: bool = False,
+                          pool: ProcessPoolExecutor = None) -> dict:
+    """
+     Converts pdf reports into images that is finally converted to text by optical character recognition.
+     Every page of every report is sent to a pool of worker processes, the pages are put back together in order and
+     each report's text file is written once all of its pages are done. Reports found in the OCR cache are written
+     straight from the cache. Pages with a usable embedded text layer are not OCR'd, see is_usable_text_layer, and
+     with page anchors only the pages around the synoptic sections are, see select_anchored_pages.
 
      :param paths_to_texts:       path to where the generated text of the pdf reports should be put
      :param paths_to_pdfs:        paths to the pdf files
      :param path_to_input:        path to input folder
-
+     :param max_workers:          number of worker processes, defaults to the number of cores
+     :param print_debug:          print debug statements in Terminal if True
+     :param ocr_cache:            cache of previous OCR results, not used if None
+     :param ocr_settings:         pdf2image and tesseract parameters, see default_ocr_settings
+     :param save_page_images:     debug mode, also save the rendered pages as jpgs under images/
+     :param pool:                 pool of worker processes to use instead of starting one, see get_process_pool
+     :return:                     stats of the run: reports, cached reports, pages, text layer pages, skipped pages,
+                                  seconds, serial seconds and speedup
      """
     if not os.path.exists(path_to_input):
         os.makedirs(path_to_input)
 
-    pdf_path_and_text_path = zip(paths_to_pdfs, paths_to_texts)
-    for pdf_path, output_filename in pdf_path_and_text_path:
+    ocr_settings = get_ocr_settings(ocr_settings)
+    start_time = time.perf_counter()
+    pages_per_report = {}
+    texts_per_report = {}
+    cache_keys = {}
+
+    def write_report(index: int, pages: List[str]):
+        """
+        :param index:        index of the pdf in paths_to_pdfs
+        :param pages:        text of every page of the report
+        """
+        write_text_file(paths_to_texts[index], "".join(pages))
+        if ocr_cache:
+            ocr_cache.record_text_file(paths_to_texts[index], paths_to_pdfs[index], ocr_settings)
+
+    num_cached = 0
+    num_text_layer_pages = 0
+    for index, pdf_path in enumerate(paths_to_pdfs):
         try:
-            pages = convert_from_path(pdf_path)
-            pg_cntr = 1
-
-            sub_dir = str(path_to_input + "images/" + pdf_path.split('/')[-1].replace('.pdf', '')[0:20] + "/")
-            if not os.path.exists(sub_dir):
-                os.makedirs(sub_dir)
-
-            for page in pages:
-                if pg_cntr <= 20:
-                    filename = "pg_" + str(pg_cntr) + '_' + pdf_path.split('/')[-1].replace('.pdf', '.jpg')
-                    page.save(sub_dir + filename)
-                    with io.open(output_filename, 'a+', encoding='utf8') as f:
-                        f.write(unicode(pytesseract.image_to_string(sub_dir + filename) + "\n"))
-                    pg_cntr += 1
-        except:
+            if ocr_cache:
+                cache_keys[index] = ocr_cache.make_key(pdf_path, ocr_settings)
+                cached_pages = ocr_cache.get(cache_keys[index])
+                if cached_pages is not None:
+                    write_report(index, cached_pages)
+                    num_cached += 1
+                    continue
+            text_layer = []
+            if ocr_settings["use text layer"]:
+                try:
+                    text_layer = extract_text_layer_pages(pdf_path)[:ocr_settings["max pages"]]
+                except Exception:
+                    pass
+            num_pages = len(text_layer) if text_layer else get_pdf_page_count(pdf_path)
+            num_pages = min(num_pages, ocr_settings["max pages"]) if ocr_settings["max pages"] else num_pages
+            pages = [page_text if page_text and is_usable_text_layer(page_text, ocr_settings) else None
+                     for page_text in text_layer] if text_layer else [None] * num_pages
+            num_text_layer_pages += sum(1 for page in pages if page is not None)
+            texts_per_report[index] = pages
+            pages_per_report[index] = [page_number for page_number in range(1, num_pages + 1)
+                                       if pages[page_number - 1] is None]
+        except Exception:
             print("Can't read in this report: ", pdf_path)
-            pass
+
+    num_pages_to_ocr = sum(len(page_numbers) for page_numbers in pages_per_report.values())
+    with contextlib.ExitStack() as stack:
+        if pool is None and max_workers != 1 and num_pages_to_ocr:
+            # the low and the full resolution pass share one pool
+            pool = stack.enter_context(get_process_pool(max_workers))
+        if ocr_settings["page anchors"] and pages_per_report:
+            pages_per_report = select_anchored_pages(path_to_input, paths_to_pdfs, pages_per_report, texts_per_report,
+                                                     max_workers, ocr_settings, pool)
+
+        # reports whose every page has a usable text layer, or was skipped, need no OCR
+        for index in [index for index, page_numbers in pages_per_report.items() if not page_numbers]:
+            write_report(index, texts_per_report[index])
+            if ocr_cache:
+                ocr_cache.put(cache_keys[index], texts_per_report[index])
+
+        failed_reports = set()
+        serial_seconds = 0
+        for index, page_number, text, seconds in ocr_pages(path_to_input, paths_to_pdfs, pages_per_report, max_workers,
+                                                           ocr_settings, save_page_images, pool):
+            if text is None:
+                failed_reports.add(index)
+                continue
+            serial_seconds += seconds
+            pages = texts_per_report[index]
+            pages[page_number - 1] = text
+            # write the report once, in page order, as soon as its last page is done
+            if index not in failed_reports and all(page is not None for page in pages):
+                write_report(index, pages)
+                if ocr_cache:
+                    ocr_cache.put(cache_keys[index], pages)
+
+    for index in sorted(failed_reports):
+        print("Can't read in this report: ", paths_to_pdfs[index])
+
+    seconds = time.perf_counter() - start_time
+    stats = {"reports": len(pages_per_report) - len(failed_reports),
+             "cached reports": num_cached,
+             "pages": sum(len(pages) for pages in texts_per_report.values()),
+             "text layer pages": num_text_layer_pages,
+             "skipped pages": num_pages_to_ocr - sum(len(page_numbers) for page_numbers in pages_per_report.values()),
+             "seconds": seconds,
+             "serial seconds": serial_seconds,
+             "speedup": serial_seconds / seconds if seconds else 1}
+    if print_debug and num_cached:
+        print("{} reports were already in the OCR cache.".format(num_cached))
+    if print_debug and stats["skipped pages"]:
+        print("{} pages without a synoptic anchor were not OCR'd at full resolution.".format(stats["skipped pages"]))
+    if print_debug and num_text_layer_pages:
+        print("{} of {} pages had a usable text layer and were not OCR'd.".format(num_text_layer_pages,
+                                                                                  stats["pages"]))
+    num_ocr_pages = sum(len(page_numbers) for page_numbers in pages_per_report.values())
+    if print_debug and num_ocr_pages:
+        print("OCR of {} pages from {} reports took {:.1f}s with {} workers, {:.1f}s of work ({:.1f}x speedup).".format(
+            num_ocr_pages, stats["reports"], seconds, max_workers or os.cpu_count(), serial_seconds,
+            stats["speedup"]))
+    return stats
 
 
 def load_in_reports(start: int, end: int, paths_to_r: List[str], do_preprocessing: bool = True) -> List[Report]:
@@ -87,15 +576,7 @@ def load_in_reports(start: int, end: int, paths_to_r: List[str], do_preprocessin
                 emr_file_text.close()
             elif text_path[-3:] == "pdf":
                 # extract text
-                pdfFileObj = open(text_path, "rb")
-                pdf_text_obj = pdftotext.PDF(pdfFileObj)
-                pdf_text_str = ""
-                # process each page
-                for page_num in range(len(pdf_text_obj)):
-                    raw_text = pdf_text_obj[page_num]
-                    pdf_text_str += raw_text
-                if do_preprocessing:
-                    pdf_text_str = preprocess_remove_extra_text(pdf_text_str)
+                pdf_text_str = extract_text_layer(text_path, do_preprocessing)
                 # append result for this iteration
                 emr_study_id.append(Report(text=pdf_text_str, report_id=str(num), report_type=ReportType.NUMERICAL))
             else:
@@ -128,15 +609,7 @@ def load_in_report(report_path: str, num: str, do_preprocessing: bool = True) ->
         return report
     elif report_path[-3:] == "pdf":
         # extract text
-        pdfFileObj = open(report_path, "rb")
-        pdf_text_obj = pdftotext.PDF(pdfFileObj)
-        pdf_text_str = ""
-        # process each page
-        for page_num in range(len(pdf_text_obj)):
-            raw_text = pdf_text_obj[page_num]
-            pdf_text_str += raw_text
-        if do_preprocessing:
-            pdf_text_str = preprocess_remove_extra_text(pdf_text_str)
+        pdf_text_str = extract_text_layer(report_path, do_preprocessing)
         # append result for this iteration
         report = Report(text=pdf_text_str, report_id=num, report_type=ReportType.NUMERICAL)
         return report
@@ -144,13 +617,21 @@ def load_in_report(report_path: str, num: str, do_preprocessing: bool = True) ->
         print("File must be in either pdf format or text format for extraction!")
 
 
-def convert_pdf_to_text(path_to_input, path_to_pdf, path_to_txt):
+def convert_pdf_to_text(path_to_input, path_to_pdf, path_to_txt, max_workers: int = 1,
+                        ocr_cache: OCRCache = None, ocr_settings: dict = None, save_page_images: bool = False,
+                        pool: ProcessPoolExecutor = None):
     """
      Converts pdf reports into images that is finally converted to text by optical character recognition
 
      :param path_to_txt:          path to where the generated text of the pdf reports should be put
      :param path_to_pdf:          path of the pdf to be converted to text
      :param path_to_input:        path to inputs
+     :param max_workers:          number of worker processes the pages are spread over, 1 streams the pages in order
+                                  inside this process
+     :param ocr_cache:            cache of previous OCR results, not used if None
+     :param ocr_settings:         pdf2image and tesseract parameters, see default_ocr_settings
+     :param save_page_images:     debug mode, also save the rendered pages as jpgs under images/
+     :param pool:                 pool of worker processes to use instead of starting one, see get_process_pool
      """
     if not os.path.exists(path_to_input):
         os.makedirs(path_to_input)
@@ -158,50 +639,161 @@ def convert_pdf_to_text(path_to_input, path_to_pdf, path_to_txt):
     if not os.path.exists(path_to_pdf):
         raise FileNotFoundError
 
-    try:
-        pages = convert_from_path(path_to_pdf)
-        pg_cntr = 1
-
-        sub_dir = str(path_to_input + "images/" + path_to_pdf.split('/')[-1].replace('.pdf', '')[0:20] + "/")
-        if not os.path.exists(sub_dir):
-            os.makedirs(sub_dir)
-
-        for page in pages:
-            if pg_cntr <= 20:
-                filename = "pg_" + str(pg_cntr) + '_' + path_to_pdf.split('/')[-1].replace('.pdf', '.jpg')
-                page.save(sub_dir + filename)
-                with io.open(path_to_txt, 'a+', encoding='utf8') as f:
-                    f.write(unicode(pytesseract.image_to_string(sub_dir + filename) + "\n"))
-                pg_cntr += 1
-    except:
-        print("Can't read in this report: ", path_to_pdf)
-        pass
+    convert_pdfs_to_texts(path_to_input, [path_to_pdf], [path_to_txt], max_workers=max_workers, print_debug=False,
+                          ocr_cache=ocr_cache, ocr_settings=ocr_settings, save_page_images=save_page_images, pool=pool)
 
 
 def load_reports_into_pipeline(path_to_input: str, paths_to_pdfs: List[str],
-                               paths_to_reports_to_read_in: List[str], start: int) -> List[Report]:
+                               paths_to_reports_to_read_in: List[str], start: int,
+                               ocr_workers: int = None, print_debug: bool = True, ocr_cache: OCRCache = None,
+                               ocr_settings: dict = None, save_page_images: bool = False,
+                               report_ids: List[int] = None, refresh_text_files: bool = False) -> List[Report]:
     """
 
     :param path_to_input:                 path to input folder
     :param paths_to_pdfs:                 paths to report pdfs
     :param paths_to_reports_to_read_in:   paths that you want to eventually read in (pdf or txt)
     :param start:                         first report id
+    :param ocr_workers:                   number of worker processes used to OCR reports without a text file and
+                                          to read the text layer of pdfs that are read in directly
+    :param print_debug:                   print debug statements in Terminal if True
+    :param ocr_cache:                     cache of previous OCR results. if given, the text files it wrote are
+                                          written again when their pdf or the OCR settings changed
+    :param ocr_settings:                  pdf2image and tesseract parameters, see default_ocr_settings
+    :param save_page_images:              debug mode, also save the rendered pages as jpgs under images/
+    :param report_ids:                    id of each report, if None the ids count up from start
+    :param refresh_text_files:            write the text file of every pdf again, also the ones the cache did not write
     :return:                              reports with text field initialized
     """
+    # OCR every report that does not have a text file yet in one parallel batch, pages with a usable text layer are
+    # taken from the pdf as they are
+    missing = [(pdf_path, text_path) for pdf_path, text_path in zip(paths_to_pdfs, paths_to_reports_to_read_in)
+               if needs_text_file(pdf_path, text_path, ocr_cache, ocr_settings, refresh_text_files)]
+    if missing:
+        convert_pdfs_to_texts(path_to_input, [pdf_path for pdf_path, _ in missing],
+                              [text_path for _, text_path in missing], max_workers=ocr_workers,
+                              print_debug=print_debug, ocr_cache=ocr_cache, ocr_settings=ocr_settings,
+                              save_page_images=save_page_images)
+
+    # read the text layer of every pdf that is read in directly (NUMERICAL reports) in one parallel batch
+    text_layer_paths = [path for path in paths_to_reports_to_read_in if path[-3:] == "pdf"]
+    text_layers = dict(zip(text_layer_paths, extract_text_layers(text_layer_paths, max_workers=ocr_workers)))
+
     reports_loaded_in_str = []
     pdf_text_paths = zip(paths_to_pdfs, paths_to_reports_to_read_in)
     for num, pdf_text_paths in enumerate(pdf_text_paths):
-        report_id = str(num + start)
+        report_id = str(report_ids[num] if report_ids else num + start)
         pdf_path = pdf_text_paths[0]
         text_path = pdf_text_paths[1]
         try:
-            loaded_report = load_in_report(text_path, report_id)
+            if text_path in text_layers:
+                if text_layers[text_path] is None:
+                    raise FileNotFoundError
+                loaded_report = Report(text=text_layers[text_path], report_id=report_id,
+                                       report_type=ReportType.NUMERICAL)
+            else:
+                loaded_report = load_in_report(text_path, report_id)
             reports_loaded_in_str.append(loaded_report)
         except:
-            try:
-                convert_pdf_to_text(path_to_input, pdf_path, text_path)
-                loaded_report = load_in_report(text_path, report_id)
-                reports_loaded_in_str.append(loaded_report)
-            except:
-                print(pdf_path, "does not exist. Will not import.")
+            print(pdf_path, "does not exist. Will not import.")
     return reports_loaded_in_str
+
+
+def iter_reports_into_pipeline(path_to_input: str, paths_to_pdfs: List[str], paths_to_reports_to_read_in: List[str],
+                               start: int, read_ahead: int = 8, ocr_workers: int = None, ocr_cache: OCRCache = None,
+                               ocr_settings: dict = None, save_page_images: bool = False,
+                               report_ids: List[int] = None, refresh_text_files: bool = False) -> Iterator[Report]:
+    """
+    Lazy version of load_reports_into_pipeline. A background thread reads (and OCRs if needed) the reports in order
+    and at most read_ahead reports wait in memory, so later stages can start on the first reports while the rest are
+    still being loaded. The reports are OCR'd with one pool of worker processes, started before the thread, and the
+    next read_ahead reports are sent to it while a report is waited for, so the pool is kept busy by short reports
+    too. If the consumer stops early, the reports being OCR'd are finished before the pool is shut down.
+
+    :param path_to_input:                 path to input folder
+    :param paths_to_pdfs:                 paths to report pdfs
+    :param paths_to_reports_to_read_in:   paths that you want to eventually read in (pdf or txt)
+    :param start:                         first report id
+    :param read_ahead:                    maximum number of loaded reports waiting to be consumed, and of reports
+                                          being OCR'd at once
+    :param ocr_workers:                   number of worker processes the pages of the reports are OCR'd with
+    :param ocr_cache:                     cache of previous OCR results, not used if None
+    :param ocr_settings:                  pdf2image and tesseract parameters, see default_ocr_settings
+    :param save_page_images:              debug mode, also save the rendered pages as jpgs under images/
+    :param report_ids:                    id of each report, if None the ids count up from start
+    :param refresh_text_files:            write the text file of every pdf again, also the ones the cache did not write
+    :return:                              reports with text field initialized
+    """
+    finished = object()
+    loaded_reports = queue.Queue(maxsize=read_ahead)
+    stopped = threading.Event()
+    to_convert = [needs_text_file(pdf_path, text_path, ocr_cache, ocr_settings, refresh_text_files)
+                  for pdf_path, text_path in zip(paths_to_pdfs, paths_to_reports_to_read_in)]
+    # started here and not from the reader thread, and shared by every report instead of one pool per report
+    pool = get_process_pool(ocr_workers, start_workers=True) if ocr_workers != 1 and any(to_convert) else None
+    # without a pool every report is OCR'd in the reader thread, one at a time
+    window = max(read_ahead, 1) if pool else 1
+
+    def put(item) -> bool:
+        """
+        :param item:      report to hand over, or finished
+        :return:          False if the consumer has stopped iterating
+        """
+        while not stopped.is_set():
+            try:
+                loaded_reports.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def convert(num: int):
+        """
+        :param num:       index of the report in paths_to_pdfs
+        """
+        convert_pdf_to_text(path_to_input, paths_to_pdfs[num], paths_to_reports_to_read_in[num],
+                            max_workers=ocr_workers, ocr_cache=ocr_cache, ocr_settings=ocr_settings,
+                            save_page_images=save_page_images, pool=pool)
+
+    def read_reports():
+        converters = ThreadPoolExecutor(max_workers=window)
+        conversions = {}
+        try:
+            for num, (pdf_path, text_path) in enumerate(zip(paths_to_pdfs, paths_to_reports_to_read_in)):
+                # the next reports are OCR'd while this one is waited for
+                for ahead in range(num, min(num + window, len(paths_to_pdfs))):
+                    if to_convert[ahead] and ahead not in conversions and not stopped.is_set():
+                        conversions[ahead] = converters.submit(convert, ahead)
+                if stopped.is_set():
+                    return
+                report_id = str(report_ids[num] if report_ids else num + start)
+                try:
+                    if num in conversions:
+                        conversions.pop(num).result()
+                    loaded_report = load_in_report(text_path, report_id)
+                except FileNotFoundError:
+                    print(pdf_path, "does not exist. Will not import.")
+                    continue
+                except (OSError, UnicodeDecodeError) as error:
+                    print("Can't read in this report: ", pdf_path, error)
+                    continue
+                if loaded_report and not put(loaded_report):
+                    return
+            put(finished)
+        finally:
+            # the reports already being OCR'd are finished, so the pool is not shut down under them
+            converters.shutdown(wait=True, cancel_futures=True)
+
+    reader = threading.Thread(target=read_reports, daemon=True)
+    reader.start()
+    try:
+        while True:
+            report = loaded_reports.get()
+            if report is finished:
+                return
+            yield report
+    finally:
+        stopped.set()
+        reader.join()
+        if pool:
+            pool.shutdown()
\ No newline at end of file
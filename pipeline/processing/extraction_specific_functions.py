@@ -6,7 +6,8 @@ be in a certain form:
 def function_name(report: str, result: dict, generic_pairs: dict):
     do stuff
 
-report is the entire synoptic section as as string
+report is the entire synoptic section as as string, tokenize_section(report) gives the tokens the other extraction
+stages of the section made from it: its lines, its header records, its case folded text and its view without spaces
 result are extractions that have been matched with the features of interest
 generic_pairs are extractions that have been extracted based on a `column : value` pattern and do not have a matching
 feature of interest.
@@ -14,6 +15,11 @@ feature of interest.
 
 import re
 
+from pipeline.utils.section_tokens import tokenize_section
+from pipeline.utils.text_views import get_spaced_search
+
+negative_for_dcis_search = get_spaced_search(re.compile(r"(?i)- *N *e *g *a *t *i *v *e  *f *o *r  *D *C *I *S"))
+
 
 def duplicate_lymph_nodes(report: str, result: dict, generic_pairs: dict):
     """
@@ -57,8 +63,7 @@ def no_lymph_node(report: str, result: dict, generic_pairs: dict):
     :param result:
     :param generic_pairs:
     """
-    spaceless_synoptic_report = report.replace(" ", "")
-    if "Nolymphnodespresent" in spaceless_synoptic_report:
+    if "Nolymphnodespresent" in tokenize_section(report).view(fold_case=False).text:
         result["number of lymph nodes examined (sentinel and nonsentinel)"] = "0"
         result["number of sentinel nodes examined"] = "0"
         result["micro / macro metastasis"] = None
@@ -86,8 +91,8 @@ def negative_for_dcis(report: str, result: dict, generic_pairs: dict):
     :param result:
     :param generic_pairs:
     """
-    cleaned_report = report.lower().strip()
-    match1 = re.search(r"(?i)- *N *e *g *a *t *i *v *e  *f *o *r  *D *C *I *S", cleaned_report)
+    # looks in the same view without spaces as tokenize_section(report).view()
+    match1 = negative_for_dcis_search.search(report)
 
     if match1:
         result["distance from closest margin"] = None
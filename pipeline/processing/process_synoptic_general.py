@@ -2,16 +2,27 @@
 2021 Yifu (https://github.com/chen-yifu) and Lucy (https://github.com/lhao03)
 This file includes code that that extracts values from the synpotic section of a report.
 """
+import os
 import re
 import string
+import time
 from collections import defaultdict
-from typing import Dict, List, Tuple, Union
+from functools import lru_cache
+from typing import Dict, List, Tuple, Union, Pattern
 from nltk import edit_distance
 from nltk.corpus import stopwords
 from pipeline.processing.columns import load_excluded_columns_as_list
 from pipeline.processing.clean_text import cleanse_column, cleanse_value
 from pipeline.utils.column import Column
+from pipeline.utils.column_prefilter import ColumnPrefilter
+from pipeline.utils.keyword_index import SynopticHeaderIndex
+from pipeline.utils.pair_scanner import GenericPairScanner, get_generic_pair_scanner
+from pipeline.utils.section_tokens import tokenize_section
+from pipeline.utils.regex_timeout import RegexTimeout, count_regex_timeouts, default_regex_time_budget, \
+    log_regex_timeout, run_with_time_budget
 from pipeline.utils.report import Report
+from pipeline.utils.synoptic_signature import SynopticSignature
+from pipeline.utils.utils import get_current_time
 import pandas as pd
 from pipeline.utils.report_type import ReportType
 
@@ -19,16 +30,45 @@ table = str.maketrans(dict.fromkeys(string.punctuation))
 stop_words = set(stopwords.words('english'))
 
 
-def get_extraction_specific_regex(unfiltered_str: str, synoptic_report_regex: str) -> dict:
+@lru_cache(maxsize=None)
+def compile_multiline(regex: str) -> Pattern:
+    """
+    :param regex:                          a regular pattern
+    :return:                               the pattern compiled with re.MULTILINE, once per process
+    """
+    return re.compile(regex, re.MULTILINE)
+
+
+def get_multiline_pattern(regex: Union[str, Pattern]) -> Pattern:
+    """
+    :param regex:                          a regular pattern, or one that is already compiled with re.MULTILINE
+    :return:                               the compiled pattern
+    """
+    return regex if isinstance(regex, Pattern) else compile_multiline(regex)
+
+
+def get_extraction_specific_regex(unfiltered_str: str,
+                                  synoptic_report_regex: Union[str, Pattern, SynopticHeaderIndex, ColumnPrefilter],
+                                  time_budget: float = None) -> dict:
     """
     Extracts information from the report using the generated regex. Removes captures that are None or "". Does not clean the data.
 
     :param unfiltered_str:                 the report to be looked at
-    :param synoptic_report_regex:          the regex pattern to be used
+    :param synoptic_report_regex:          the regex pattern to be used, if compiled it must have re.MULTILINE. or the
+                                           keyword index of the columns, which runs in this process without a budget,
+                                           or the prefilter that picks the pattern of the columns in the report
+    :param time_budget:                    seconds the pattern may take, raises RegexTimeout if it takes longer
     :return:
     """
-    matches = re.finditer(synoptic_report_regex, unfiltered_str, re.MULTILINE)
-    pairs = [(m.groupdict()) for m in matches]
+    if isinstance(synoptic_report_regex, SynopticHeaderIndex):
+        # the case of the section is folded once for every stage that looks at it
+        pairs = synoptic_report_regex.find_groupdicts(unfiltered_str, tokenize_section(unfiltered_str).folded_text)
+    elif isinstance(synoptic_report_regex, ColumnPrefilter):
+        pattern = synoptic_report_regex.select(unfiltered_str, tokenize_section(unfiltered_str).folded_text)
+        pairs = run_with_time_budget(pattern, unfiltered_str, "groupdicts", time_budget)
+    else:
+        pairs = run_with_time_budget(get_multiline_pattern(synoptic_report_regex), unfiltered_str, "groupdicts",
+                                     time_budget)
     filtered_pairs = {}
     for unfiltered_dict in pairs:
         unfiltered_dict = {k: v for k, v in unfiltered_dict.items() if v is not None}
@@ -97,10 +137,13 @@ def find_nearest_alternative(original_col: str, possible_candidates: List[str],
 
 def process_synoptic_section(synoptic_report_str: str, report_id: str, report_type: ReportType, pickle_path: str,
                              paths: dict, column_mappings: Dict[str, Column], list_of_dict_with_stats: List[dict],
-                             regex_mappings: Dict[str, List[str]], specific_regex: str, general_regex: str,
+                             regex_mappings: Dict[str, List[str]],
+                             specific_regex: Union[str, Pattern, SynopticHeaderIndex, ColumnPrefilter],
+                             general_regex: Union[str, Pattern, GenericPairScanner],
                              tools: dict = {}, print_debug: bool = True, extraction_tools: list = [],
                              max_edit_distance_missing=5, max_edit_distance_autocorrect=5,
-                             substitution_cost=2, skip_threshold=0.95) -> dict:
+                             substitution_cost=2, skip_threshold=0.95, separator: str = ":",
+                             time_budget: float = default_regex_time_budget) -> dict:
     """
     :param extraction_tools:
     :param paths:
@@ -108,8 +151,9 @@ def process_synoptic_section(synoptic_report_str: str, report_id: str, report_ty
     :param column_mappings:                    human columns and report columns where that information can be found
     :param report_type:                        enum of either TEXT or NUMERICAL
     :param substitution_cost:                  cost for a letter substitution
-    :param specific_regex:                     regular pattern that was generated earlier by synoptic_capture_regex
-    :param general_regex:                      general regular pattern based on the separator
+    :param specific_regex:                     regular pattern that was generated earlier by synoptic_capture_regex,
+                                               or the keyword index made by compile_synoptic_header_index
+    :param general_regex:                      general regular pattern based on the separator, or its GenericPairScanner
     :param regex_mappings:                     the variables that were made earlier for regular pattern mapped to their columns
     :param tools:                              functions that columns may need to use for cleaning
     :param synoptic_report_str:                synoptic report section
@@ -120,6 +164,10 @@ def process_synoptic_section(synoptic_report_str: str, report_id: str, report_ty
     :param max_edit_distance_missing:          maximum edit distance allowed when finding missing columns
     :param max_edit_distance_autocorrect:      maximum edit distance allowed when auto-correcting columns
     :param skip_threshold:                     between 0 and 1, specifies the percentage of max missing columns
+    :param separator:                          what separates the column and value, used by the line based fallback
+    :param time_budget:                        seconds each pattern may take on the report before the line based
+                                               extraction is used instead, None for no budget. the specific regex
+                                               falls back to the pairs of GenericPairScanner.find_specific_pairs
     :return:                                   extracted data, represented by dictionary {column: value}
     """
     # checking if is text or numerical
@@ -168,17 +216,26 @@ def process_synoptic_section(synoptic_report_str: str, report_id: str, report_ty
 
         return result_so_far
 
-    def get_generic_extraction_regex(unfiltered_str: str, regex: str, is_text: bool = False, tools: dict = {}) -> dict:
+    def get_generic_extraction_regex(unfiltered_str: str, regex: Union[str, Pattern, GenericPairScanner],
+                                     is_text: bool = False, tools: dict = {}) -> dict:
         """
         Extracts information from the generic capture regex. Cleans out values that are None or "" and performs cleaning on the column and value.
 
         :param tools:               dictionary of functions that certain columns may need to use
         :param is_text:             whether or not the report is ReportType.TEXT or NUMERICAL
         :param unfiltered_str:      the report that the regex is to be used on
-        :param regex:               the generic regex to be used
+        :param regex:               the generic regex to be used, or the scanner made for it by get_generic_pair_scanner
         :return:                    dictionary of the cleaned pairs
         """
-        matches = re.finditer(regex, unfiltered_str, re.MULTILINE)
+        if isinstance(regex, GenericPairScanner):
+            matches = regex.find_pairs(tokenize_section(unfiltered_str))
+        else:
+            try:
+                matches = run_with_time_budget(get_multiline_pattern(regex), unfiltered_str, "groupdicts", time_budget)
+            except RegexTimeout as timeout:
+                # the pairs of the generic regex of the separator stand in for the pattern
+                log_regex_timeout(timeout, report_id)
+                matches = GenericPairScanner(separator).find_pairs(tokenize_section(unfiltered_str))
         generic_pairs = {}
         for m in matches:
             cleaned_column, to_append = cleanse_column(m["column"], is_text)
@@ -216,7 +273,13 @@ def process_synoptic_section(synoptic_report_str: str, report_id: str, report_ty
     synoptic_report_str = "- " + synoptic_report_str
 
     # autogenerated regex based on columns
-    specific_pairs = get_extraction_specific_regex(synoptic_report_str, specific_regex)
+    try:
+        specific_pairs = get_extraction_specific_regex(synoptic_report_str, specific_regex, time_budget)
+    except RegexTimeout as timeout:
+        # the column-value pairs of the lines are matched to the columns of the regex instead
+        log_regex_timeout(timeout, report_id)
+        specific_pairs = GenericPairScanner(separator).find_specific_pairs(tokenize_section(synoptic_report_str),
+                                                                           regex_mappings)
 
     result = defaultdict(str)
 
@@ -281,11 +344,14 @@ def process_synoptic_section(synoptic_report_str: str, report_id: str, report_ty
     return result
 
 
-def process_synoptics_and_ids(unfiltered_reports: List[Report], column_mappings: Dict[str, Column], specific_regex: str,
-                              general_regex: str, regex_mappings: Dict[str, List[str]], pickle_path: str, paths: dict,
+def process_synoptics_and_ids(unfiltered_reports: List[Report], column_mappings: Dict[str, Column],
+                              specific_regex: Union[str, Pattern, SynopticHeaderIndex, ColumnPrefilter],
+                              general_regex: Union[str, Pattern], regex_mappings: Dict[str, List[str]], pickle_path: str, paths: dict,
                               autocorrect_tools: dict = {}, print_debug=True, max_edit_distance_missing: int = 5,
                               max_edit_distance_autocorrect: int = 5, substitution_cost: int = 2,
-                              extraction_tools: list = []) -> Tuple[List[Report], pd.DataFrame]:
+                              extraction_tools: list = [], separator: str = ":",
+                              time_budget: float = default_regex_time_budget, skip_threshold: float = 0.95,
+                              skip_non_synoptic: bool = False) -> Tuple[List[Report], pd.DataFrame]:
     """
     process and extract data from a list of synoptic reports by using regular expression
 
@@ -298,10 +364,19 @@ def process_synoptics_and_ids(unfiltered_reports: List[Report], column_mappings:
     :param regex_mappings:                 the mappings of columns to their regex variables
     :param general_regex:                  a regular pattern that extracts column and values
     :param autocorrect_tools:                          a dictionary of column names mapped to functions to act on any values of that column
-    :param specific_regex:                 the regex pattern generated earlier in the pipeline based on the user input columns
+    :param specific_regex:                 the regex pattern generated earlier in the pipeline based on the user input columns,
+                                           or the keyword index of those columns
     :param unfiltered_reports:             synoptic sections and study IDs
     :param column_mappings:                first str is col name from PDF, second str is col from Excel
     :param print_debug:                    print debug statements in Terminal if True
+    :param separator:                      what separates the column and value
+    :param time_budget:                    seconds each pattern may take on a report, None for no budget
+    :param skip_threshold:                 proportion of the columns that may be missing from a section before it is
+                                           not synoptic
+    :param skip_non_synoptic:              whether to skip the sections that have too few column headers to be
+                                           synoptic before anything is extracted from them, see SynopticSignature.
+                                           a skipped report is kept as a row without values and the skipped
+                                           sections are saved as skipped_sections_<time>.csv in the output csv folder
     :return:                               extracted data of the form (col_name: value)
     :return:                               the auto-correct information to be shown
     """
@@ -312,9 +387,27 @@ def process_synoptics_and_ids(unfiltered_reports: List[Report], column_mappings:
         print(s)
 
     list_of_dict_with_stats = []
+    # compiled once for all the reports
+    if not isinstance(specific_regex, (SynopticHeaderIndex, ColumnPrefilter)):
+        specific_regex = get_multiline_pattern(specific_regex)
+    # the generic regex runs as a line scanner, other general patterns run as regex
+    general_regex = get_generic_pair_scanner(general_regex) or get_multiline_pattern(general_regex)
+    signature = SynopticSignature(column_mappings) if skip_non_synoptic else None
+    num_processed = 0
+    seconds_processing = 0
+    start_time_of_run = time.time()
 
     for report in unfiltered_reports:
         cleaned_text = report.text.strip().replace(" is ", ":")
+        if signature is not None:
+            columns_found = signature.count_columns(cleaned_text)
+            if not signature.is_synoptic(columns_found, skip_threshold):
+                signature.log_skipped_section(report.report_id, columns_found)
+                # the report stays in the results as a row without values, like a section nothing was found in
+                report.extractions = {"study": report.report_id, "laterality": report.laterality}
+                result.append(report)
+                continue
+        start_time = time.perf_counter()
         report.extractions = process_synoptic_section(cleaned_text, report.report_id, report.report_type,
                                                       paths=paths,
                                                       pickle_path=pickle_path,
@@ -327,13 +420,36 @@ def process_synoptics_and_ids(unfiltered_reports: List[Report], column_mappings:
                                                       max_edit_distance_missing=max_edit_distance_missing,
                                                       max_edit_distance_autocorrect=max_edit_distance_autocorrect,
                                                       substitution_cost=substitution_cost,
-                                                      extraction_tools=extraction_tools)
+                                                      extraction_tools=extraction_tools,
+                                                      separator=separator,
+                                                      time_budget=time_budget,
+                                                      skip_threshold=skip_threshold)
+        seconds_processing += time.perf_counter() - start_time
+        num_processed += 1
 
         report.extractions.update({"laterality": report.laterality})
         result.append(report)
         print(report.report_id)
         print(report.extractions)
 
+    if signature is not None and signature.skipped_sections:
+        num_skipped = len(signature.skipped_sections)
+        # the skipped sections would have taken about as long as the others
+        seconds_saved = num_skipped * seconds_processing / max(num_processed, 1)
+        print("Skipped {} of {} sections that have too few column headers to be synoptic, saving about {:.2f} "
+              "seconds.".format(num_skipped, len(result), seconds_saved))
+        if "path to output csv" in paths:
+            os.makedirs(paths["path to output csv"], exist_ok=True)
+            skipped_path = os.path.join(paths["path to output csv"],
+                                        "skipped_sections_{}.csv".format(get_current_time()))
+            pd.DataFrame(signature.skipped_sections).to_csv(skipped_path, index=False)
+            print("The skipped sections are listed in {}".format(skipped_path))
+
+    num_timeouts = count_regex_timeouts(since=start_time_of_run)
+    if num_timeouts:
+        print("{} regular patterns ran out of time, the latest are in regex_timeout.regex_timeouts.".format(
+            num_timeouts))
+
     # sort DataFrame by study ID
     df_with_stats = pd.DataFrame(list_of_dict_with_stats)
     df_with_stats.sort_values("Study ID")
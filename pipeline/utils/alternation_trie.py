@@ -0,0 +1,143 @@
+"""
+2021 Yifu (https://github.com/chen-yifu) and Lucy (https://github.com/lhao03)
+This file includes code that factors the shared prefixes of the column names of an alternation into a trie, so the
+regex engine checks a shared prefix once instead of once for every column name that starts with it.
+"""
+from typing import Dict, List, Union
+
+from pipeline.utils.keyword_index import optional_punctuation
+
+# characters that make_punc_regex_literal leaves as regular pattern syntax
+pattern_syntax = ".^$*+{}[]|"
+
+
+class TrieNode:
+    """
+    The column names that share a prefix. Its entries are kept in the order of the alternation, an entry is either the
+    end of a column name (None) or the next token of column names and the node after it.
+    """
+
+    def __init__(self):
+        self.entries = []
+        self.weight = 0
+
+    def is_exclusive(self, token: Union[str, None], other: Union[str, None]) -> bool:
+        """
+        :param token:         a token of an entry, None for the end of a column name
+        :param other:         a token of another entry
+        :return:              True if the entries can not both match at the same position, even with re.IGNORECASE,
+                              so their order in the alternation does not change what it matches
+        """
+        if token is None or other is None or len(token) != 1 or len(other) != 1:
+            return False
+        if not token.isascii() or not other.isascii():
+            return False
+        return token.lower() != other.lower()
+
+    def add(self, tokens: List[str], weight: int = 0):
+        """
+        Adds a column name behind the ones added before. It shares the entry of an earlier column name with the same
+        next token if every entry in between is exclusive with it, otherwise it gets an entry of its own.
+
+        :param tokens:        the column name as tokens of make_punc_regex_literal
+        :param weight:        number of times the column name was seen in reports
+        """
+        self.weight += weight
+        token = tokens[0] if tokens else None
+        for entry in reversed(self.entries):
+            entry_token = entry[0] if entry else None
+            if entry_token == token:
+                if token is not None:
+                    entry[1].add(tokens[1:], weight)
+                # a column name that is already in the alternation never matches where the first one does not
+                return
+            if not self.is_exclusive(entry_token, token):
+                break
+        if token is None:
+            self.entries.append(None)
+            return
+        node = TrieNode()
+        node.add(tokens[1:], weight)
+        self.entries.append([token, node])
+
+    def order_entries(self):
+        """
+        Sorts every run of entries that are exclusive with each other by how often their column names were seen, so
+        the engine tries the most common column names first.
+        """
+        ordered = []
+        run = []
+        for entry in self.entries + [None]:
+            if entry is not None:
+                entry[1].order_entries()
+            if entry is not None and all(self.is_exclusive(entry[0], other[0]) for other in run):
+                run.append(entry)
+                continue
+            ordered.extend(sorted(run, key=lambda e: -e[1].weight))
+            run = []
+            if entry is not None:
+                run.append(entry)
+            else:
+                ordered.append(None)
+        # the None added to end the last run is not an entry
+        self.entries = ordered[:-1]
+
+    def to_regex(self) -> str:
+        """
+        :return:              regular pattern of the column names of the node, the entries joined by ORs
+        """
+        return "|".join("" if entry is None else entry[0] + entry[1].to_group() for entry in self.entries)
+
+    def to_group(self) -> str:
+        """
+        :return:              to_regex in a non capturing group if it has more than one entry
+        """
+        if len(self.entries) == 1:
+            return self.to_regex()
+        return "(?:" + self.to_regex() + ")"
+
+
+def tokenize_column(col: str) -> Union[List[str], None]:
+    """
+    :param col:           a column name
+    :return:              the tokens of the column name as make_punc_regex_literal writes them, None if the column name
+                          has regular pattern syntax
+    """
+    tokens = []
+    for char in col:
+        if char in pattern_syntax:
+            return None
+        tokens.append("\\" + char + "*" if char in optional_punctuation else char)
+    return tokens
+
+
+def factor_alternation(cols: List[str], weights: Union[List[int], None] = None) -> str:
+    """
+    Gives a pattern that matches the same as make_punc_regex_literal("|".join(cols)), with the shared prefixes of the
+    column names factored out, e.g. number of (?:lymph|sentinel) nodes for number of lymph nodes and number of
+    sentinel nodes.
+
+    :param cols:          the column names, in the order of the alternation
+    :param weights:       number of times each column name was seen in reports, None to keep the order
+    :return:              regular pattern
+    """
+    token_lists = [tokenize_column(col) for col in cols]
+    if any(tokens is None for tokens in token_lists):
+        return "".join("\\" + char + "*" if char in optional_punctuation else char for char in "|".join(cols))
+    root = TrieNode()
+    weights = weights if weights is not None else [0] * len(cols)
+    for tokens, weight in zip(token_lists, weights):
+        root.add(tokens, weight)
+    if any(weights):
+        root.order_entries()
+    return root.to_regex()
+
+
+def count_column_hits(texts: List[str], cols: List[str]) -> Dict[str, int]:
+    """
+    :param texts:         the reports, or the synoptic sections of the reports
+    :param cols:          the column names
+    :return:              the column names mapped to the number of texts they are in, ignoring case
+    """
+    lowered_texts = [text.lower() for text in texts]
+    return {col: sum(col.lower() in text for text in lowered_texts) for col in cols}
@@ -0,0 +1,104 @@
+"""
+2021 Yifu (https://github.com/chen-yifu) and Lucy (https://github.com/lhao03)
+This file includes code that finds which columns have a header in a synoptic section with one keyword pass, and runs
+the generated regex with only the alternatives of those columns. The pattern of every set of columns is compiled once.
+"""
+import collections
+import re
+from typing import Dict, List, Pattern, Set, Union
+
+from pipeline.utils.keyword_index import KeywordIndex, fold_text, split_alternatives, split_header
+
+# pattern of a set of columns with no alternative that can match
+no_match_pattern = "(?!)"
+
+
+class ColumnPrefilter:
+    """
+    Gives the same matches as the regex of synoptic_capture_regex_. Every alternative of the regex starts with a column
+    and every column has a run of literal characters every match of it has, see split_header. An alternative whose
+    runs are all missing from the section can not match anywhere in it, so it is left out of the pattern the section
+    is matched with. Which alternatives are kept is a bitmap, the pattern of every bitmap is compiled once.
+    """
+
+    def __init__(self, branches: List[dict], ignore_caps: bool = True, max_patterns: int = 256):
+        """
+        :param branches:      the alternatives made by synoptic_capture_branches
+        :param ignore_caps:   same as for synoptic_capture_regex_
+        :param max_patterns:  number of compiled patterns to keep, the one compiled first is dropped after that
+        """
+        self.ignore_caps = ignore_caps
+        self.max_patterns = max_patterns
+        self.flags = re.MULTILINE | (re.IGNORECASE if ignore_caps else 0)
+        alternatives = split_alternatives(branches)
+        self.alternatives = ["".join(branch["regex"] for branch in alternative) for alternative in alternatives]
+        # bits of the alternatives that are kept whatever is in the section, like the empty ones
+        self.always_kept = 0
+        self.keyword_index = KeywordIndex()
+        # keyword id mapped to the bits of the alternatives it is the run of a column of
+        self.keyword_bits: Dict[int, int] = collections.defaultdict(int)
+        keyword_ids = {}
+        for alternative_index, alternative in enumerate(alternatives):
+            bit = 1 << alternative_index
+            literals = self.get_literals(alternative)
+            if literals is None:
+                self.always_kept |= bit
+                continue
+            for literal in literals:
+                if literal not in keyword_ids:
+                    keyword_ids[literal] = self.keyword_index.add(literal)
+                self.keyword_bits[keyword_ids[literal]] |= bit
+        self.keyword_index.build()
+        # bitmap mapped to the compiled pattern of its alternatives
+        self.patterns: Dict[int, Pattern] = {}
+
+    def get_literals(self, alternative: List[dict]) -> Union[Set[str], None]:
+        """
+        :param alternative:   the branches of an alternative
+        :return:              the runs one of which is in every match of the alternative, folded if the case is
+                              ignored, None if the alternative may match without one
+        """
+        if not alternative:
+            return None
+        literals = set()
+        for header in alternative[0]["headers"]:
+            parts = split_header(header)
+            if parts is None or (self.ignore_caps and not parts[1].isascii()):
+                return None
+            literals.add(parts[1].lower() if self.ignore_caps else parts[1])
+        return literals or None
+
+    def find_bitmap(self, text: str, folded_text: str = None) -> int:
+        """
+        :param text:          the synoptic section
+        :param folded_text:   the section made by fold_text if it was already made, like by SectionTokens
+        :return:              bitmap of the alternatives that may match in the section
+        """
+        if self.ignore_caps:
+            searched_text = folded_text if folded_text is not None else fold_text(text)
+        else:
+            searched_text = text
+        bitmap = self.always_kept
+        for _, keyword_id in self.keyword_index.find_all(searched_text):
+            bitmap |= self.keyword_bits[keyword_id]
+        return bitmap
+
+    def get_pattern(self, bitmap: int) -> Pattern:
+        """
+        :param bitmap:        bitmap of the alternatives to keep
+        :return:              the regex with only those alternatives, in the same order
+        """
+        if bitmap not in self.patterns:
+            if len(self.patterns) >= self.max_patterns:
+                del self.patterns[next(iter(self.patterns))]
+            kept = [alternative for index, alternative in enumerate(self.alternatives) if bitmap >> index & 1]
+            self.patterns[bitmap] = re.compile("|".join(kept) if kept else no_match_pattern, self.flags)
+        return self.patterns[bitmap]
+
+    def select(self, text: str, folded_text: str = None) -> Pattern:
+        """
+        :param text:          the synoptic section
+        :param folded_text:   see find_bitmap
+        :return:              the pattern that gives the same matches in the section as the whole regex
+        """
+        return self.get_pattern(self.find_bitmap(text, folded_text))
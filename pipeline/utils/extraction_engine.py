@@ -0,0 +1,16 @@
+"""
+2021 Yifu (https://github.com/chen-yifu) and Lucy (https://github.com/lhao03)
+This file includes code that represents the enumeration ExtractionEngine.
+"""
+from enum import Enum
+
+
+class ExtractionEngine(Enum):
+    """
+    REGEX finds the columns with the generated regular pattern
+    KEYWORD_INDEX finds them all in one pass with a keyword automaton and only tries the pattern of the columns found
+    COLUMN_PREFILTER runs the generated regular pattern with only the columns whose headers are in the report
+    """
+    REGEX = "regex"
+    KEYWORD_INDEX = "keyword index"
+    COLUMN_PREFILTER = "column prefilter"
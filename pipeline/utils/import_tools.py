@@ -2,6 +2,7 @@
 2021 Yifu (https://github.com/chen-yifu) and Lucy (https://github.com/lhao03)
 This file includes code that imports utils needed by pipeline to run.
 """
+import json
 import string
 from typing import Dict, List, Tuple, Set
 
@@ -64,7 +65,17 @@ def get_input_paths(start: int, end: int, path_to_reports: str, report_str: str)
     """
     # make general list of paths
     nums_list = [n for n in range(start, end + 1)]
-    return [path_to_reports + report_str.format(i) for i in nums_list]
+    return get_input_paths_from_ids(nums_list, path_to_reports, report_str)
+
+
+def get_input_paths_from_ids(report_ids: List[int], path_to_reports: str, report_str: str) -> List[str]:
+    """
+    :param report_ids:            the report ids, do not need to be consecutive
+    :param path_to_reports:       general path to all the reports
+    :param report_str:            the report str for example {} OR_Redacted.text or {} Path_Redacted.pdf
+    :return:                      list of paths
+    """
+    return [path_to_reports + report_str.format(i) for i in report_ids]
 
 
 def import_pdf_human_cols_tuples(pdf_human_csv: str, keep_punc: bool = False) -> List[Tuple[str, str]]:
@@ -182,3 +193,23 @@ def get_acronyms(encodings: List[str]) -> Set[str]:
         if all_upper:
             acronyms.add(encoding)
     return acronyms
+
+
+def import_ocr_settings(ocr_settings_path: str) -> dict:
+    """
+    :param ocr_settings_path:   path to the json with the OCR settings chosen for a report type
+    :return:                    the OCR settings, empty if none were saved so the defaults are used
+    """
+    if not os.path.exists(ocr_settings_path):
+        return {}
+    with open(ocr_settings_path, "r") as f:
+        return json.load(f)
+
+
+def save_ocr_settings(ocr_settings_path: str, ocr_settings: dict):
+    """
+    :param ocr_settings_path:   path to the json with the OCR settings chosen for a report type
+    :param ocr_settings:        the OCR settings, see default_ocr_settings in scanned_pdf_to_text
+    """
+    with open(ocr_settings_path, "w") as f:
+        json.dump(ocr_settings, f, indent=1, sort_keys=True)
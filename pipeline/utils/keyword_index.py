@@ -0,0 +1,247 @@
+"""
+2021 Yifu (https://github.com/chen-yifu) and Lucy (https://github.com/lhao03)
+This file includes code that finds the column headers of a synoptic section with one Aho-Corasick automaton over all
+columns, instead of trying the alternative of every column at every position of the section.
+"""
+import collections
+import functools
+import re
+import string
+from typing import Dict, Iterator, List, Tuple, Union
+
+# characters that make_punc_regex_literal turns into \X*, any number of them (or none) may be in the report
+optional_punctuation = "?()\\/"
+
+
+class KeywordIndex:
+    """
+    Aho-Corasick automaton, finds every occurrence of every keyword in one pass over a text.
+    """
+
+    def __init__(self):
+        self.transitions = [{}]
+        self.fail = [0]
+        self.outputs = [[]]
+        self.keywords = []
+        self.alphabet = set()
+
+    def add(self, keyword: str) -> int:
+        """
+        :param keyword:       a non empty string to look for
+        :return:              id of the keyword
+        """
+        state = 0
+        for char in keyword:
+            if char not in self.transitions[state]:
+                self.transitions.append({})
+                self.fail.append(0)
+                self.outputs.append([])
+                self.transitions[state][char] = len(self.transitions) - 1
+            state = self.transitions[state][char]
+        self.outputs[state].append(len(self.keywords))
+        self.keywords.append(keyword)
+        self.alphabet.update(keyword)
+        return len(self.keywords) - 1
+
+    def build(self):
+        """
+        Links every state to the longest proper suffix that is also in the automaton, call after the last add.
+        """
+        queue = collections.deque(self.transitions[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self.transitions[state].items():
+                queue.append(next_state)
+                fail = self.fail[state]
+                while fail and char not in self.transitions[fail]:
+                    fail = self.fail[fail]
+                self.fail[next_state] = self.transitions[fail].get(char, 0)
+                self.outputs[next_state] = self.outputs[next_state] + self.outputs[self.fail[next_state]]
+
+    def find_all(self, text: str) -> Iterator[Tuple[int, int]]:
+        """
+        :param text:          text to look in
+        :return:              (start, keyword id) of every occurrence, ordered by where they end
+        """
+        transitions, fail, outputs, keywords, alphabet = self.transitions, self.fail, self.outputs, self.keywords, \
+            self.alphabet
+        state = 0
+        for index, char in enumerate(text):
+            if char not in alphabet:
+                state = 0
+                continue
+            while state and char not in transitions[state]:
+                state = fail[state]
+            state = transitions[state].get(char, 0)
+            for keyword_id in outputs[state]:
+                yield index - len(keywords[keyword_id]) + 1, keyword_id
+
+
+@functools.lru_cache(maxsize=None)
+def fold_char(char: str) -> str:
+    """
+    :param char:          a character that is not ascii
+    :return:              the ascii letter it matches with re.IGNORECASE, like the Kelvin sign for k, or the character
+    """
+    for letter in string.ascii_lowercase:
+        if re.fullmatch("(?i)" + letter, char):
+            return letter
+    return char
+
+
+def fold_text(text: str) -> str:
+    """
+    :param text:          text to look in
+    :return:              text of the same length where every character that matches an ascii letter with
+                          re.IGNORECASE is that letter in lower case
+    """
+    if text.isascii():
+        return text.lower()
+    return "".join(char.lower() if char.isascii() else fold_char(char) for char in text)
+
+
+def split_header(header: str) -> Union[Tuple[str, str], None]:
+    """
+    :param header:        a column as made by make_punc_regex_literal
+    :return:              the punctuation that may be in front of its first run of literal characters and that run,
+                          None if the column uses other regular pattern syntax the run can not be found for
+    """
+    leading = ""
+    literal = ""
+    index = 0
+    while index < len(header):
+        char = header[index]
+        if char == "\\":
+            if header[index + 1:index + 3] in [c + "*" for c in optional_punctuation]:
+                if literal:
+                    break
+                leading += header[index + 1]
+                index += 3
+                continue
+            return None
+        if char in "|()[]":
+            return None
+        if char in ".^$*+?{}":
+            # the character in front of a quantifier that allows none of it is not part of the run
+            literal = literal[:-1] if char in "*?{" else literal
+            break
+        literal += char
+        index += 1
+    if not literal or re.search(r"(?<!\\)[|(\[]", header[index:]):
+        return None
+    return leading, literal
+
+
+def split_alternatives(branches: List[dict]) -> List[List[dict]]:
+    """
+    synoptic_capture_regex_ puts an OR behind the alternative of a column with its value on the same line and in front
+    of one with its value on the next line. This gives the alternatives of the regex the way re sees them, the empty
+    ones that come from two ORs in a row or the OR at the end too.
+
+    :param branches:      the alternatives made by synoptic_capture_branches
+    :return:              the alternatives of the regex in order, each as the branches it is made of, [] if empty
+    """
+    alternatives = [[]]
+    for branch in branches:
+        if branch["val on next line"]:
+            alternatives.append([branch])
+        else:
+            alternatives[-1].append(branch)
+            alternatives.append([])
+    return alternatives
+
+
+class SynopticHeaderIndex:
+    """
+    Gives the same matches as the regex of synoptic_capture_regex_ with one pass of a KeywordIndex over the section.
+    The first literal run of every column is put in the automaton. Where a run is found, only the alternative of its
+    column is tried, at the positions that alternative could start at, in the order of the regex, and its value is
+    captured with the alternative's own regular pattern. More columns only add keywords, not work per position.
+    """
+
+    def __init__(self, branches: List[dict], anchor: str = "", ignore_caps: bool = True):
+        """
+        :param branches:      the alternatives made by synoptic_capture_branches
+        :param anchor:        the anchor of the alternatives that are anchored, it must start with ^ and stay on
+                              the line
+        :param ignore_caps:   same as for synoptic_capture_regex_
+        """
+        flags = re.MULTILINE | (re.IGNORECASE if ignore_caps else 0)
+        # the empty alternatives only give the empty matches that are left out of find_groupdicts
+        alternatives = [alternative for alternative in split_alternatives(branches) if alternative]
+        self.ignore_caps = ignore_caps
+        self.patterns = [re.compile("".join(branch["regex"] for branch in alternative), flags)
+                         for alternative in alternatives]
+        self.variables = [[branch["variable"] for branch in alternative] for alternative in alternatives]
+        self.anchored = [alternative[0]["anchored"] for alternative in alternatives]
+        self.keyword_index = KeywordIndex()
+        # keyword id mapped to the (alternative, punctuation that may be in front of the keyword) it was found for
+        self.keyword_branches: Dict[int, List[Tuple[int, str]]] = collections.defaultdict(list)
+        keyword_ids = {}
+        for branch_index, alternative in enumerate(alternatives):
+            for header in alternative[0]["headers"]:
+                leading, literal = split_header(header)
+                literal = literal.lower() if ignore_caps else literal
+                if literal not in keyword_ids:
+                    keyword_ids[literal] = self.keyword_index.add(literal)
+                self.keyword_branches[keyword_ids[literal]].append((branch_index, leading))
+        self.keyword_index.build()
+
+    def find_starts(self, text: str, folded_text: str = None) -> List[Tuple[int, int]]:
+        """
+        :param text:          the synoptic section
+        :param folded_text:   the section made by fold_text if it was already made, like by SectionTokens
+        :return:              sorted (position, alternative) of every position an alternative could match at
+        """
+        starts = set()
+        if self.ignore_caps:
+            searched_text = folded_text if folded_text is not None else fold_text(text)
+        else:
+            searched_text = text
+        for keyword_start, keyword_id in self.keyword_index.find_all(searched_text):
+            for branch_index, leading in self.keyword_branches[keyword_id]:
+                if self.anchored[branch_index]:
+                    starts.add((text.rfind("\n", 0, keyword_start) + 1, branch_index))
+                    continue
+                start = keyword_start
+                starts.add((start, branch_index))
+                while start > 0 and text[start - 1] in leading:
+                    start -= 1
+                    starts.add((start, branch_index))
+        return sorted(starts)
+
+    def find_groupdicts(self, text: str, folded_text: str = None) -> List[Dict[str, str]]:
+        """
+        :param text:          the synoptic section
+        :param folded_text:   see find_starts
+        :return:              {variable: value} of every match, like the groupdicts of the regex without the Nones
+        """
+        pairs = []
+        position = 0
+        for start, branch_index in self.find_starts(text, folded_text):
+            if start < position:
+                continue
+            match = self.patterns[branch_index].match(text, start)
+            if match:
+                pairs.append({variable: match[variable] for variable in self.variables[branch_index]
+                              if match[variable] is not None})
+                position = match.end()
+        return pairs
+
+
+def get_synoptic_header_index(branches: List[dict], anchor: str = "",
+                              ignore_caps: bool = True) -> Union[SynopticHeaderIndex, None]:
+    """
+    :param branches:      the alternatives made by synoptic_capture_branches
+    :param anchor:        the anchor of synoptic_capture_regex_
+    :param ignore_caps:   same as for synoptic_capture_regex_
+    :return:              the index, None if a column or the anchor uses regular pattern syntax it can not handle
+    """
+    if anchor and (not anchor.startswith("^") or re.search(r"\\[sSnWDB]|(?<!\\)[.|]|\[\^", anchor)):
+        return None
+    for branch in branches:
+        for header in branch["headers"]:
+            parts = split_header(header)
+            if parts is None or (ignore_caps and not parts[1].isascii()):
+                return None
+    return SynopticHeaderIndex(branches, anchor, ignore_caps)
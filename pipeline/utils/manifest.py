@@ -0,0 +1,116 @@
+"""
+2021 Yifu (https://github.com/chen-yifu) and Lucy (https://github.com/lhao03)
+This file includes code that keeps a manifest of the input folder, so a run only needs to process the reports that are
+new or changed since the last successful run.
+"""
+import json
+import os
+import re
+from typing import Dict, List
+
+import pandas as pd
+
+from pipeline.utils.utils import hash_file
+
+
+def find_report_ids(path_to_reports: str, report_ending: str) -> List[int]:
+    """
+    :param path_to_reports:       folder with the reports
+    :param report_ending:         the file endings of the reports, for example V.pdf
+    :return:                      sorted ids of every report in the folder named {id}{report_ending}
+    """
+    if not os.path.exists(path_to_reports):
+        return []
+    file_regex = re.compile(r"(?P<id>\d+){}$".format(re.escape(report_ending)))
+    matches = [file_regex.match(file_name) for file_name in os.listdir(path_to_reports)]
+    return sorted(int(m["id"]) for m in matches if m)
+
+
+def load_manifest(manifest_path: str) -> Dict[str, dict]:
+    """
+    :param manifest_path:         path to the manifest json
+    :return:                      report id mapped to its file, size, mtime and hash. empty if there is no manifest
+    """
+    if not os.path.exists(manifest_path):
+        return {}
+    with open(manifest_path, "r") as f:
+        return json.load(f)
+
+
+def save_manifest(manifest_path: str, manifest: Dict[str, dict]):
+    """
+    :param manifest_path:         path to the manifest json
+    :param manifest:              report id mapped to its file, size, mtime and hash
+    """
+    folder = os.path.dirname(manifest_path)
+    if folder and not os.path.exists(folder):
+        os.makedirs(folder, exist_ok=True)
+    temporary_path = manifest_path + ".part"
+    with open(temporary_path, "w") as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+    os.replace(temporary_path, manifest_path)
+
+
+def scan_input_folder(path_to_reports: str, report_ending: str, report_ids: List[int],
+                      previous_manifest: Dict[str, dict] = None) -> Dict[str, dict]:
+    """
+    Records the id, file name, size, mtime and content hash of every report. The hash of a file whose size and mtime
+    did not change since the previous manifest is reused instead of being read again.
+
+    :param path_to_reports:       folder with the reports
+    :param report_ending:         the file endings of the reports, for example V.pdf
+    :param report_ids:            ids of the reports to record
+    :param previous_manifest:     manifest of the last successful run
+    :return:                      report id mapped to its file, size, mtime and hash
+    """
+    previous_manifest = previous_manifest if previous_manifest else {}
+    manifest = {}
+    for report_id in report_ids:
+        file_name = "{}{}".format(report_id, report_ending)
+        path = path_to_reports + file_name
+        if not os.path.exists(path):
+            continue
+        stat = os.stat(path)
+        entry = {"id": report_id, "file": file_name, "size": stat.st_size, "mtime": stat.st_mtime}
+        previous = previous_manifest.get(str(report_id))
+        if previous and previous["size"] == entry["size"] and previous["mtime"] == entry["mtime"]:
+            entry["hash"] = previous["hash"]
+        else:
+            entry["hash"] = hash_file(path)
+        manifest[str(report_id)] = entry
+    return manifest
+
+
+def find_changed_report_ids(manifest: Dict[str, dict], previous_manifest: Dict[str, dict]) -> List[int]:
+    """
+    :param manifest:              manifest of the input folder as it is now
+    :param previous_manifest:     manifest of the last successful run
+    :return:                      sorted ids of the reports that are new or whose content changed
+    """
+    return sorted(entry["id"] for report_id, entry in manifest.items()
+                  if report_id not in previous_manifest or previous_manifest[report_id]["hash"] != entry["hash"])
+
+
+def merge_with_prior_results(new_results: pd.DataFrame, merged_results_path: str, report_ids: List[int],
+                             id_col: str = "Study #") -> pd.DataFrame:
+    """
+    Replaces the rows of the reassessed reports in the merged results of earlier runs with the new rows and saves it.
+
+    :param new_results:           results of the reports processed in this run
+    :param merged_results_path:   path to the csv with the merged results of all runs
+    :param report_ids:            ids of the reports processed in this run, their old rows are dropped
+    :param id_col:                column with the report ids, for example 101V or 101VL
+    :return:                      the merged results
+    """
+    if os.path.exists(merged_results_path):
+        prior_results = pd.read_csv(merged_results_path, dtype=str)
+        prior_ids = prior_results[id_col].astype(str).str.extract(r"^(\d+)", expand=False)
+        prior_results = prior_results[~prior_ids.isin([str(report_id) for report_id in report_ids])]
+        merged_results = pd.concat([prior_results, new_results], ignore_index=True)
+    else:
+        merged_results = new_results
+    sort_ids = merged_results[id_col].astype(str).str.extract(r"^(\d+)", expand=False).astype(float)
+    merged_results = merged_results.assign(sort_id=sort_ids).sort_values("sort_id", kind="stable")
+    merged_results = merged_results.drop(columns="sort_id").reset_index(drop=True)
+    merged_results.to_csv(merged_results_path, index=False)
+    return merged_results
@@ -0,0 +1,99 @@
+"""
+2021 Yifu (https://github.com/chen-yifu) and Lucy (https://github.com/lhao03)
+This file includes code that gives the column-value pairs of the generic regex from the header records of a synoptic
+section, without the negative lookahead that scans the rest of the line at every character of every value.
+"""
+import functools
+import re
+from typing import Dict, List, Pattern, Union
+
+from pipeline.utils.section_tokens import SectionTokens, get_section_tokens, normalize_column
+
+# (?P<column>.*){separator}(?P<value>((?!.+({separator}|—)\?*)[\s\S])*) made in run_pipeline
+generic_pattern_regex = re.compile(r"\(\?P<column>\.\*\)(?P<separator>.+?)\(\?P<value>\(\(\?!\.\+\("
+                                   r"(?P=separator)\|—\)\\\?\*\)\[\\s\\S\]\)\*\)")
+
+
+class GenericPairScanner:
+    """
+    Gives the same pairs as re.finditer of the generic regex, from the header records of the section, see
+    SectionTokens.headers.
+    """
+
+    def __init__(self, separator: str):
+        """
+        :param separator:     what separates the column and value, taken literally
+        """
+        self.separator = separator
+
+    def find_pairs(self, text: Union[str, SectionTokens]) -> List[Dict[str, str]]:
+        """
+        :param text:          the synoptic section, or its tokens
+        :return:              {"column": ..., "value": ...} of every pair, like the groupdicts of the generic regex
+        """
+        return [{"column": record["anchor"] + record["header"], "value": record["value"]}
+                for record in get_section_tokens(text).headers(self.separator)]
+
+    def find_specific_pairs(self, text: Union[str, SectionTokens], regex_mappings: Dict[str, List[str]]) -> \
+            Dict[str, str]:
+        """
+        Stand-in for the regex made by synoptic_capture_regex when it runs out of time. The headers that are one of the
+        report columns of a regex variable are given to that variable, the first header of a variable with a value is
+        kept.
+
+        :param text:            the synoptic section, or its tokens
+        :param regex_mappings:  the regex variables mapped to their report columns
+        :return:                the regex variables mapped to their values, like get_extraction_specific_regex
+        """
+        lookup = get_section_tokens(text).header_lookup(self.separator)
+        # a report column belongs to the first variable it is mapped to
+        variables = {}
+        for variable, report_columns in regex_mappings.items():
+            for report_column in report_columns:
+                variables.setdefault(normalize_column(report_column), variable)
+        records = {}
+        for report_column, variable in variables.items():
+            record = lookup.get(report_column)
+            if record is not None and (variable not in records or
+                                       record["header span"] < records[variable]["header span"]):
+                records[variable] = record
+        return {variable: record["value"] for variable, record in
+                sorted(records.items(), key=lambda item: item[1]["header span"])}
+
+
+def get_literal(pattern: str) -> Union[str, None]:
+    """
+    :param pattern:       a regular pattern
+    :return:              the text the pattern matches if it only matches that text, None otherwise
+    """
+    if not re.fullmatch(r"(?:[^\\.^$*+?{}\[\]|()]|\\[^\w\s])+", pattern):
+        return None
+    return re.sub(r"\\(.)", r"\1", pattern)
+
+
+@functools.lru_cache(maxsize=None)
+def get_scanner_for_pattern(pattern: str) -> Union[GenericPairScanner, None]:
+    """
+    :param pattern:       a regular pattern
+    :return:              a scanner that gives the same pairs as the pattern, None if it is not the generic regex
+    """
+    parts = generic_pattern_regex.fullmatch(pattern)
+    if parts is None:
+        return None
+    separator = get_literal(parts["separator"])
+    if separator is None or "\n" in separator:
+        return None
+    return GenericPairScanner(separator)
+
+
+def get_generic_pair_scanner(regex: Union[str, Pattern]) -> Union[GenericPairScanner, None]:
+    """
+    :param regex:         the generic regex, as it is or compiled with re.MULTILINE at most
+    :return:              a scanner that gives the same pairs as the regex, None if it is not the generic regex
+    """
+    if isinstance(regex, Pattern):
+        if regex.flags & ~(re.MULTILINE | re.UNICODE):
+            return None
+        regex = regex.pattern
+    return get_scanner_for_pattern(regex)
+
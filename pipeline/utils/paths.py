@@ -28,6 +28,7 @@ def get_paths(report_type: str, other_paths=None) -> dict:
     path_to_output_csv = get_full_path("data/output/{}_results/csv_files/".format(report_type))
     path_to_output_excel = get_full_path("data/output/{}_results/excel_files/".format(report_type))
     path_to_training = path_to_output + "training/"
+    path_to_cache = get_full_path("data/cache/{}_reports/".format(report_type))
 
     # files
 
@@ -37,10 +38,17 @@ def get_paths(report_type: str, other_paths=None) -> dict:
     path_to_autocorrect = path_to_utils + "{}_excluded_autocorrect_column_pairs.data".format(report_type)
     path_to_regex_rules = path_to_utils + "{}_regex_rules.csv".format(report_type)
     path_to_thresholds = path_to_utils + "{}_thresholds.csv".format(report_type)
+    path_to_ocr_settings = path_to_utils + "{}_ocr_settings.json".format(report_type)
+
+    # cache
+    path_to_ocr_cache = path_to_cache + "ocr_cache.sqlite3"
+    path_to_manifest = path_to_cache + "manifest.json"
+    path_to_vocabulary_counts = path_to_cache + "vocabulary_counts.pickle"
 
     # output
     csv_path_raw = path_to_output_csv + "raw_{}.csv".format(timestamp)
     csv_path_coded = path_to_output_csv + "coded_{}.csv".format(timestamp)
+    csv_path_merged = path_to_output_csv + "coded_merged.csv"
 
     # add other paths
     paths.update(other_paths)
@@ -51,10 +59,16 @@ def get_paths(report_type: str, other_paths=None) -> dict:
          "path to thresholds": path_to_thresholds, "path to mappings": path_to_mappings, "csv path raw": csv_path_raw,
          "path to utils": path_to_utils, "csv path coded": csv_path_coded, "path to code book": path_to_code_book,
          "path to input": path_to_input, "path to training folder": path_to_training,
-         "path to autocorrect": path_to_autocorrect, "path to regex rules": path_to_regex_rules})
+         "path to autocorrect": path_to_autocorrect, "path to regex rules": path_to_regex_rules,
+         "path to cache": path_to_cache, "path to ocr cache": path_to_ocr_cache,
+         "path to manifest": path_to_manifest, "csv path merged": csv_path_merged,
+         "path to ocr settings": path_to_ocr_settings, "path to vocabulary counts": path_to_vocabulary_counts})
 
+    # files the pipeline creates itself
+    generated_paths = ["csv path raw", "csv path coded", "csv path merged", "path to ocr cache", "path to manifest",
+                       "path to ocr settings", "path to vocabulary counts"]
     for path_name, actual_path in paths.items():
-        if not os.path.exists(actual_path) and path_name not in ["csv path raw", "csv path coded"]:
+        if not os.path.exists(actual_path) and path_name not in generated_paths:
             print("Warning, {} does not exist and may be needed to run the pipeline.".format(actual_path))
             if actual_path[-1] == "/":
                 os.makedirs(actual_path)
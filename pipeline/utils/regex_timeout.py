@@ -0,0 +1,192 @@
+"""
+2021 Yifu (https://github.com/chen-yifu) and Lucy (https://github.com/lhao03)
+This file includes code that runs regular patterns under a time budget. Python can not interrupt a running pattern, so
+the patterns run in a separate worker process that is killed and started again when a report takes too long.
+"""
+import collections
+import multiprocessing
+import os
+import re
+import time
+from typing import Deque, Dict, Pattern, Tuple, Union
+
+# seconds a single pattern may take on one report, None runs the patterns without a budget
+default_regex_time_budget = None
+
+# number of compiled patterns a worker keeps, the one sent first is dropped after that
+max_worker_patterns = 256
+
+# the latest patterns that ran out of time, as {"report": ..., "pattern": ..., "seconds": ..., "time": ...}
+regex_timeouts: Deque[dict] = collections.deque(maxlen=1000)
+
+
+class RegexTimeout(Exception):
+    """
+    Raised when a pattern takes longer than its time budget on a text.
+    """
+
+    def __init__(self, pattern: str, time_budget: float):
+        """
+        :param pattern:       the pattern that ran out of time
+        :param time_budget:   seconds it was allowed to take
+        """
+        super().__init__("regular pattern took longer than {} seconds: {}".format(time_budget, pattern))
+        self.pattern = pattern
+        self.time_budget = time_budget
+
+
+def run_pattern(pattern: Pattern, text: str, mode: str) -> list:
+    """
+    :param pattern:       compiled pattern
+    :param text:          text to use the pattern on
+    :param mode:          "findall" for re.findall, "findall lines" for re.findall on every line on its own,
+                          "groupdicts" for the groupdict of every match of re.finditer
+    :return:              the matches
+    """
+    if mode == "findall":
+        return pattern.findall(text)
+    if mode == "findall lines":
+        return [match for line in text.splitlines() for match in pattern.findall(line)]
+    if mode == "groupdicts":
+        return [m.groupdict() for m in pattern.finditer(text)]
+    raise ValueError("Unknown mode {}".format(mode))
+
+
+def run_regex_worker(connection):
+    """
+    Loop of the worker process, runs the patterns it is sent until the connection is closed. A pattern is sent with
+    its source the first time and compiled once, after that only its id is sent.
+
+    :param connection:    end of the pipe to the pipeline
+    """
+    patterns: Dict[int, Pattern] = {}
+    while True:
+        try:
+            pattern_id, source, dropped_id, text, mode = connection.recv()
+        except EOFError:
+            return
+        patterns.pop(dropped_id, None)
+        try:
+            if source is not None:
+                patterns[pattern_id] = re.compile(*source)
+            connection.send(("ok", run_pattern(patterns[pattern_id], text, mode)))
+        except Exception as e:
+            if source is not None:
+                # the pipeline forgets the pattern on an error, it is sent with its source again the next time
+                patterns.pop(pattern_id, None)
+            connection.send(("error", e))
+
+
+class RegexWorker:
+    """
+    A worker process that is kept alive between patterns, so a report only costs sending its text to the worker.
+    """
+
+    def __init__(self, max_patterns: int = max_worker_patterns):
+        """
+        :param max_patterns:  number of compiled patterns the worker keeps
+        """
+        self.process = None
+        self.connection = None
+        self._pid = None
+        self.max_patterns = max_patterns
+        # pattern and flags mapped to the id of the pattern compiled in the worker, in the order they were sent
+        self.pattern_ids: Dict[Tuple[str, int], int] = {}
+        self.next_pattern_id = 0
+
+    def start(self):
+        """
+        Starts the worker with the start method of the platform, see get_process_pool.
+        """
+        context = multiprocessing.get_context()
+        self.connection, child_connection = context.Pipe()
+        self.process = context.Process(target=run_regex_worker, args=(child_connection,), daemon=True)
+        self.process.start()
+        child_connection.close()
+        self._pid = os.getpid()
+
+    def stop(self):
+        """
+        Kills the worker, a new one is started by the next run.
+        """
+        if self.process is not None and self._pid == os.getpid():
+            self.process.kill()
+            self.process.join()
+            self.connection.close()
+        self.process = None
+        self.connection = None
+        self.pattern_ids = {}
+
+    def run(self, pattern: Pattern, text: str, mode: str, time_budget: float) -> list:
+        """
+        :param pattern:       compiled pattern
+        :param text:          text to use the pattern on
+        :param mode:          see run_pattern
+        :param time_budget:   seconds the pattern may take
+        :return:              the matches
+        """
+        # a forked copy of the pipeline can not use the worker of its parent
+        if self.process is None or self._pid != os.getpid() or not self.process.is_alive():
+            self.stop()
+            self.start()
+        key = (pattern.pattern, pattern.flags)
+        source, dropped_id = None, None
+        if key not in self.pattern_ids:
+            if len(self.pattern_ids) >= self.max_patterns:
+                dropped_id = self.pattern_ids.pop(next(iter(self.pattern_ids)))
+            source = key
+            self.pattern_ids[key] = self.next_pattern_id
+            self.next_pattern_id += 1
+        self.connection.send((self.pattern_ids[key], source, dropped_id, text, mode))
+        if not self.connection.poll(time_budget):
+            self.stop()
+            raise RegexTimeout(pattern.pattern, time_budget)
+        status, result = self.connection.recv()
+        if status == "error":
+            if source is not None:
+                del self.pattern_ids[key]
+            raise result
+        return result
+
+
+# one worker per process, started the first time a pattern runs under a budget
+regex_worker = RegexWorker()
+
+
+def run_with_time_budget(pattern: Union[str, Pattern], text: str, mode: str = "findall",
+                         time_budget: float = default_regex_time_budget) -> list:
+    """
+    Runs the pattern in the worker process, or in this process if there is no budget. Daemonic processes, like the
+    workers of a process pool, can not start a worker of their own and also run the pattern without a budget.
+
+    :param pattern:       the pattern, if compiled its flags are kept
+    :param text:          text to use the pattern on
+    :param mode:          see run_pattern
+    :param time_budget:   seconds the pattern may take, None for no budget
+    :return:              the matches
+    """
+    pattern = pattern if isinstance(pattern, Pattern) else re.compile(pattern)
+    if time_budget is None or multiprocessing.current_process().daemon:
+        return run_pattern(pattern, text, mode)
+    return regex_worker.run(pattern, text, mode, time_budget)
+
+
+def log_regex_timeout(timeout: RegexTimeout, report_id: str = ""):
+    """
+    :param timeout:       the timeout that was raised
+    :param report_id:     the study id of the report the pattern ran out of time on
+    """
+    regex_timeouts.append({"report": report_id, "pattern": timeout.pattern, "seconds": timeout.time_budget,
+                           "time": time.time()})
+    report = "report {}".format(report_id) if report_id else "a report"
+    print("Regular pattern ran out of time on {}, falling back to line based extraction. Pattern: {}".format(
+        report, timeout.pattern))
+
+
+def count_regex_timeouts(since: float = 0) -> int:
+    """
+    :param since:         time.time() to count from
+    :return:              number of the latest patterns in regex_timeouts that ran out of time after since
+    """
+    return sum(timeout["time"] >= since for timeout in regex_timeouts)
+
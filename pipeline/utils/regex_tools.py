@@ -2,34 +2,55 @@
 2021 Yifu (https://github.com/chen-yifu) and Lucy (https://github.com/lhao03)
 This file includes code that generates regular patterns.
 """
-import random
+import hashlib
+import json
 import re
-from typing import List, Tuple, Union, Dict
+from typing import List, Tuple, Union, Dict, Pattern
+from pipeline.utils.alternation_trie import factor_alternation
 from pipeline.utils.column import Column
+from pipeline.utils.column_prefilter import ColumnPrefilter
 from pipeline.utils.import_tools import table
+from pipeline.utils.keyword_index import SynopticHeaderIndex, get_synoptic_header_index, optional_punctuation
+from pipeline.utils.regex_timeout import RegexTimeout, default_regex_time_budget, log_regex_timeout, \
+    run_with_time_budget
+from pipeline.utils.utils import get_next_col_name
+from pipeline.utils.section_splitter import MarkerScan, get_section_splitter
 
 
-def regex_extract(regex: str, text: str) -> list:
+def regex_extract(regex: str, text: str, time_budget: float = default_regex_time_budget) -> list:
     """
-    Helper function to execute extraction based on inputted regex pattern.
+    Helper function to execute extraction based on inputted regex pattern. If the pattern runs out of time, it is used
+    on every line on its own instead, and if that runs out of time too nothing is extracted.
 
     :param regex:           regular pattern you want to use on text
     :param text:            text to have extractions done on
+    :param time_budget:     seconds the pattern may take, None for no budget
     :return:
     """
-    return re.findall(re.compile(regex), text)
-
-
-def extract_section(regexs: List[Tuple[str, str]], text: str) -> list:
+    section_splitter = get_section_splitter(regex)
+    if section_splitter:
+        return section_splitter.findall(text)
+    try:
+        return run_with_time_budget(regex, text, "findall", time_budget)
+    except RegexTimeout as timeout:
+        log_regex_timeout(timeout)
+    try:
+        return run_with_time_budget(regex, text, "findall lines", time_budget)
+    except RegexTimeout:
+        return []
+
+
+def extract_section(regexs: List[Tuple[str, str]], text: str, time_budget: float = default_regex_time_budget) -> list:
     """
     General function that takes in a list of regex and returns the first one that returns a result.
 
     :param text:          string to use regex on
     :param regexs:        list of tuple(regex,to_append) and the list should be entered in priority
+    :param time_budget:   seconds each pattern may take, None for no budget
     :return:              the first extraction to be found. If to_append is not "", then it will append that string to the found extraction. if no extraction is found, [] is returned
     """
     for regex, to_append in regexs:
-        extraction_result = regex_extract(regex, text)
+        extraction_result = regex_extract(regex, text, time_budget)
         if len(extraction_result) != 0:
             if to_append == "":
                 return extraction_result
@@ -38,6 +59,55 @@ def extract_section(regexs: List[Tuple[str, str]], text: str) -> list:
     return []
 
 
+class FirstSectionScan:
+    """
+    Gives the first section extract_section finds for each of several lists of patterns. The start markers the lists
+    share are only looked for once, and each section pattern is only used from where its marker first occurs. Patterns
+    that are not section patterns are used as they are.
+    """
+
+    def __init__(self, lists_of_regexs: List[List[Tuple[str, str]]]):
+        """
+        :param lists_of_regexs:   lists of tuple(regex,to_append), each in priority like for extract_section
+        """
+        self.lists_of_regexs = lists_of_regexs
+        self.splitters = {regex: get_section_splitter(regex) for regexs in lists_of_regexs for regex, _ in regexs}
+        # the same start marker is only looked for once
+        self.marker_indexes = {}
+        markers = {}
+        for regex, splitter in self.splitters.items():
+            if splitter:
+                marker_key = (splitter.start.pattern, splitter.start.flags)
+                markers.setdefault(marker_key, splitter.start)
+                self.marker_indexes[regex] = list(markers).index(marker_key)
+        self.marker_scan = MarkerScan(list(markers.values()))
+
+    def first_sections(self, text: str, time_budget: float = default_regex_time_budget) -> List[Union[str, None]]:
+        """
+        :param text:          string to use regex on
+        :param time_budget:   seconds each pattern that is not a section pattern may take, None for no budget
+        :return:              for each list, the first extraction extract_section finds with to_append added and the
+                              capture taken out of a tuple, None if it finds nothing
+        """
+        positions = self.marker_scan.positions(text)
+        sections = []
+        for regexs in self.lists_of_regexs:
+            section = None
+            for regex, to_append in regexs:
+                splitter = self.splitters[regex]
+                if splitter is None:
+                    extraction_result = regex_extract(regex, text, time_budget)
+                    section = extraction_result[0] if extraction_result else None
+                elif positions[self.marker_indexes[regex]] is not None:
+                    section = splitter.first(text, positions[self.marker_indexes[regex]])
+                if section is not None:
+                    section = to_append + section if to_append != "" else section
+                    section = section[0] if isinstance(section, tuple) else section
+                    break
+            sections.append(section)
+        return sections
+
+
 def add_asterisk_and_ors(list_of_words: List[Union[str, List[str]]]) -> str:
     """
     Helper function to convert a list of string into regular pattern with OR between the words.
@@ -98,7 +168,8 @@ def to_camel_or_underscore(col: str, seen: set) -> Tuple[str, set]:
     - incision and its relation to tumour -> incisionAndItsRelationToTumour (if it is longer than 32 chars with spaces it becomes camelCase instead of underscore.
 
     :param col:          the column to change into a variable name
-    :param seen:         set with previously generated variable names, regular pattern does not allow duplicate variable names
+    :param seen:         set with previously generated variable names, regular pattern does not allow duplicate variable names.
+                         a name that was seen before gets the next free number added, so the names are always the same
     :return:
     """
     col = col.strip()
@@ -130,8 +201,7 @@ def to_camel_or_underscore(col: str, seen: set) -> Tuple[str, set]:
         seen.add(camelCase)
         return camelCase, seen
     else:
-        while camelCase in seen:
-            camelCase += str(random.randint(0, 9))
+        camelCase = get_next_col_name(camelCase, seen)
         seen.add(camelCase)
         return camelCase, seen
 
@@ -146,9 +216,8 @@ def make_punc_regex_literal(str_with_punc: str) -> str:
     :return:
     """
     fixed_str = ""
-    punc = ("?", "(", ")", "\\", "/")
     for l in str_with_punc:
-        if l in punc:
+        if l in optional_punctuation:
             fixed_str += "\\" + l + "*"
         else:
             fixed_str += l
@@ -349,19 +418,27 @@ def capture_double_regex(starting_word: List[Union[str, List[str]]],
     return modified_regex
 
 
-def synoptic_capture_regex_(columns: Dict[str, Column], val_on_same_line_cols_to_add: List[str] = [],
-                            val_on_next_line_cols_to_add: List[str] = [], anchor: str = "",
-                            ignore_caps: bool = True, separator: str = ":") -> Tuple[str, Dict[str, List[str]]]:
+def synoptic_capture_branches(columns: Dict[str, Column], val_on_same_line_cols_to_add: List[str] = [],
+                              val_on_next_line_cols_to_add: List[str] = [], anchor: str = "",
+                              separator: str = ":", column_hits: Dict[str, int] = {},
+                              factor_columns: bool = True) -> Tuple[List[dict], Dict[str, List[str]]]:
     """
-    Based on a regex pattern template, turns a list of columns into a regex that can capture the values associated with
-    those columns.
+    Turns a list of columns into the alternatives of the regex made by synoptic_capture_regex_, each capturing the
+    value of one column.
     :param val_on_next_line_cols_to_add:
     :param val_on_same_line_cols_to_add:
-    :param ignore_caps:
     :param columns:                       the columns that you want to capture
     :param anchor:                        What position is being matched before the column: https://regex101.com/r/JGWIKB/1
     :param separator:                     The punctuation or letters that separates a column and value. Default is :
-    :return:                              A regex pattern
+    :param column_hits:                   report columns mapped to how often they were seen, see count_column_hits.
+                                          The columns that are seen most are tried first where that gives the same
+                                          matches
+    :param factor_columns:                whether to factor the shared prefixes of the report columns of an
+                                          alternation, see factor_alternation
+    :return:                              the alternatives in order, as {"regex": ..., "variable": ..., "headers": the
+                                          column patterns the alternative starts with, "anchored": True if it starts
+                                          with the anchor, "val on next line": ...}, and the variables mapped to
+                                          their columns
     """
     val_on_same_line_cols_to_add = {col: Column(human_col=col, primary_report_col=[col]) for
                                     col in val_on_same_line_cols_to_add}
@@ -370,33 +447,45 @@ def synoptic_capture_regex_(columns: Dict[str, Column], val_on_same_line_cols_to
     columns.update(val_on_same_line_cols_to_add)
     columns.update(val_on_next_line_cols_to_add)
     col_keys = list(columns.keys())
-    template_regex = r""
+    branches = []
     mappings_to_regex_vals = {}
     seen = set()
     cols_len = len(col_keys)
+
+    def join_columns(cols: List[str], weights: List[int] = None) -> str:
+        """
+        :param cols:      report columns
+        :param weights:   how often each column was seen
+        :return:          the columns joined by ORs as a regular pattern
+        """
+        if factor_columns:
+            return factor_alternation(cols, weights)
+        return make_punc_regex_literal("|".join(cols))
+
     for index in range(cols_len):
         current_col = columns[col_keys[index]]  # grabs the associated pdf columns in Column object
         regex_rules = current_col.regular_pattern_rules
 
-        def process_columns_to_regex_str(cols: List[str]) -> str:
+        def process_columns_to_regex_str(cols: List[str]) -> Tuple[str, List[str]]:
             """
             :param cols:
+            :return:      the columns as one regular pattern, and every column as a regular pattern
             """
+            weights = [column_hits.get(c, 0) for c in cols]
             # adding separator into regex
             if regex_rules["add separator to col name"]:
                 # ["col1","col2"] -> ["col1:","col2:"]
                 cols = [c + separator for c in cols]
-            cols_str = make_punc_regex_literal("|".join(cols))
+            cols_str = join_columns(cols, weights)
+            headers = [make_punc_regex_literal(c) for c in cols]
             if len(cols) > 1:
-                return "(" + cols_str + ")"
-            return cols_str
+                return "(" + cols_str + ")", headers
+            return cols_str, headers
 
-        def create_regex_str(col: str, col_var: str, end_cap: str, front_cap: str = r"{col}(?P<{col_var}>",
-                             no_or: bool = False) -> str:
+        def create_regex_str(col: str, col_var: str, end_cap: str, front_cap: str = r"{col}(?P<{col_var}>") -> str:
             """
             Generic function to create a capture regular pattern. See examples in above links under synoptic_capture_regex
 
-            :param no_or:     whether or not to add a OR (|) to the end of the regular pattern
             :param col:       column we are capturing
             :param col_var:   the column but as a variable, previously generated
             :param end_cap:   the end of the regular pattern, variations can be seen under synoptic_capture_regex
@@ -404,7 +493,7 @@ def synoptic_capture_regex_(columns: Dict[str, Column], val_on_same_line_cols_to
             :return:          regular pattern
             """
             front_cap = front_cap.format(col=col, col_var=col_var)
-            return front_cap + end_cap if no_or else front_cap + end_cap + "|"
+            return front_cap + end_cap
 
         if regex_rules["val on next line"]:
             # this is for any columns that have the column on the first line and value on the second line
@@ -413,7 +502,8 @@ def synoptic_capture_regex_(columns: Dict[str, Column], val_on_same_line_cols_to
             multi_col_str = make_punc_regex_literal(col.lower())
             multi_line_regex = r"{column}\s*-*(?P<{multi_col_var}>.+)".format(column=multi_col_str,
                                                                               multi_col_var=multi_col_var)
-            template_regex += "|" + multi_line_regex
+            branches.append({"regex": multi_line_regex, "variable": multi_col_var, "headers": [multi_col_str],
+                             "anchored": False, "val on next line": True})
             mappings_to_regex_vals[multi_col_var] = [col.lower()]
 
         else:
@@ -424,12 +514,12 @@ def synoptic_capture_regex_(columns: Dict[str, Column], val_on_same_line_cols_to
 
             # adding symbolic OR between words and making punctuation regexible
             # ["col1","col2"] -> "(col1|col2)"
-            primary_curr_col_str = process_columns_to_regex_str(primary_curr_cols)
-            alternative_curr_col_str = process_columns_to_regex_str(alternative_curr_cols)
+            primary_curr_col_str, primary_headers = process_columns_to_regex_str(primary_curr_cols)
+            alternative_curr_col_str, alternative_headers = process_columns_to_regex_str(alternative_curr_cols)
 
             if index + 1 < cols_len:
                 primary_next_cols = columns[col_keys[index + 1]].primary_report_col
-                primary_next_col_str = make_punc_regex_literal("|".join(primary_next_cols))
+                primary_next_col_str = join_columns(primary_next_cols)
 
                 # if we want to capture up to a keyword
                 if regex_rules["capture up to keyword"]:
@@ -450,23 +540,172 @@ def synoptic_capture_regex_(columns: Dict[str, Column], val_on_same_line_cols_to
                 primary_curr_col_str = r"{anchor}({curr_col})".format(anchor=anchor, curr_col=primary_curr_col_str)
 
             primary_col_regex = create_regex_str(primary_curr_col_str, primary_variablefied, end_cap)
+            branches.append({"regex": primary_col_regex, "variable": primary_variablefied, "headers": primary_headers,
+                             "anchored": bool(regex_rules["add anchor"] and anchor), "val on next line": False})
 
             # make alternative column regex if needed
-            alternative_col_reg = r""
             if len(alternative_curr_cols) != 0:
                 alternative_variablefied, seen = to_camel_or_underscore(alternative_curr_cols[0], seen)
                 end_cap = r"((?!.+{sep}\?*)[\s\S])*)".format(sep=separator)
                 alternative_col_reg = create_regex_str(alternative_curr_col_str, alternative_variablefied, end_cap)
+                branches.append({"regex": alternative_col_reg, "variable": alternative_variablefied,
+                                 "headers": alternative_headers, "anchored": False, "val on next line": False})
                 mappings_to_regex_vals[alternative_variablefied] = alternative_curr_cols
 
-            template_regex += primary_col_regex + alternative_col_reg
-
             # adding variable name so we can use for later
             mappings_to_regex_vals[primary_variablefied] = primary_curr_cols
 
+    return branches, mappings_to_regex_vals
+
+
+def synoptic_capture_regex_(columns: Dict[str, Column], val_on_same_line_cols_to_add: List[str] = [],
+                            val_on_next_line_cols_to_add: List[str] = [], anchor: str = "",
+                            ignore_caps: bool = True, separator: str = ":", column_hits: Dict[str, int] = {},
+                            factor_columns: bool = True) -> Tuple[str, Dict[str, List[str]]]:
+    """
+    Based on a regex pattern template, turns a list of columns into a regex that can capture the values associated with
+    those columns.
+    :param val_on_next_line_cols_to_add:
+    :param val_on_same_line_cols_to_add:
+    :param ignore_caps:
+    :param columns:                       the columns that you want to capture
+    :param anchor:                        What position is being matched before the column: https://regex101.com/r/JGWIKB/1
+    :param separator:                     The punctuation or letters that separates a column and value. Default is :
+    :param column_hits:                   see synoptic_capture_branches
+    :param factor_columns:                see synoptic_capture_branches
+    :return:                              A regex pattern
+    """
+    branches, mappings_to_regex_vals = synoptic_capture_branches(columns, val_on_same_line_cols_to_add,
+                                                                 val_on_next_line_cols_to_add, anchor, separator,
+                                                                 column_hits, factor_columns)
+    template_regex = r""
+    for branch in branches:
+        # the columns with their value on the next line are added in front of an OR, the others behind one
+        if branch["val on next line"]:
+            template_regex += "|" + branch["regex"]
+        else:
+            template_regex += branch["regex"] + "|"
+
     return "(?i)" + template_regex if ignore_caps else template_regex, mappings_to_regex_vals
 
 
+# number of column configs each synoptic cache keeps, the one built first is dropped after that
+max_cached_configs = 4
+# compiled synoptic regular patterns and their variable mappings, keyed by get_synoptic_regex_key
+synoptic_regex_cache: Dict[str, Tuple[Pattern, Dict[str, List[str]]]] = {}
+
+
+def get_synoptic_regex_key(columns: Dict[str, Column], val_on_same_line_cols_to_add: List[str] = [],
+                           val_on_next_line_cols_to_add: List[str] = [], anchor: str = "", ignore_caps: bool = True,
+                           separator: str = ":") -> str:
+    """
+    The column hits are left out, they change with the reports of every run but only change the order of alternatives
+    that can not match at the same position. A pattern built with the hits of an earlier run gives the same matches.
+
+    :return:                              hash of everything synoptic_capture_regex_ builds the pattern from
+    """
+    config = {"columns": [[col.human_col, col.primary_report_col, col.alternative_report_col,
+                           col.regular_pattern_rules] for col in columns.values()],
+              "val on same line cols to add": val_on_same_line_cols_to_add,
+              "val on next line cols to add": val_on_next_line_cols_to_add,
+              "anchor": anchor, "ignore caps": ignore_caps, "separator": separator}
+    return hashlib.sha256(json.dumps(config, default=str).encode("utf8")).hexdigest()
+
+
+def get_cached_config(cache: dict, key: str, build) -> tuple:
+    """
+    :param cache:                         one of the synoptic caches
+    :param key:                           see get_synoptic_regex_key
+    :param build:                         function that builds the entry if it is not in the cache
+    :return:                              the entry of the key
+    """
+    if key not in cache:
+        if len(cache) >= max_cached_configs:
+            del cache[next(iter(cache))]
+        cache[key] = build()
+    return cache[key]
+
+
+def compile_synoptic_capture_regex(columns: Dict[str, Column], val_on_same_line_cols_to_add: List[str] = [],
+                                   val_on_next_line_cols_to_add: List[str] = [], anchor: str = "",
+                                   ignore_caps: bool = True, separator: str = ":",
+                                   column_hits: Dict[str, int] = {}) -> Tuple[Pattern, Dict[str, List[str]]]:
+    """
+    Builds and compiles the pattern of synoptic_capture_regex_ once per column config. It is compiled with re.MULTILINE
+    like the extraction in process_synoptic_section expects. See synoptic_capture_regex_ for the parameters, the
+    column hits are only used when the pattern is built.
+
+    :return:                              the compiled pattern and the variables mapped to their columns
+    """
+    def build() -> Tuple[Pattern, Dict[str, List[str]]]:
+        synoptic_regex, regex_variable_mappings = synoptic_capture_regex_(
+            dict(columns), val_on_same_line_cols_to_add=val_on_same_line_cols_to_add,
+            val_on_next_line_cols_to_add=val_on_next_line_cols_to_add, anchor=anchor, ignore_caps=ignore_caps,
+            separator=separator, column_hits=column_hits)
+        return re.compile(synoptic_regex, re.MULTILINE), regex_variable_mappings
+
+    key = get_synoptic_regex_key(columns, val_on_same_line_cols_to_add, val_on_next_line_cols_to_add, anchor,
+                                 ignore_caps, separator)
+    synoptic_pattern, regex_variable_mappings = get_cached_config(synoptic_regex_cache, key, build)
+    return synoptic_pattern, dict(regex_variable_mappings)
+
+
+# keyword indexes of the synoptic columns and their variable mappings, keyed by get_synoptic_regex_key
+synoptic_index_cache: Dict[str, Tuple[Union[SynopticHeaderIndex, None], Dict[str, List[str]]]] = {}
+
+
+def compile_synoptic_header_index(columns: Dict[str, Column], val_on_same_line_cols_to_add: List[str] = [],
+                                  val_on_next_line_cols_to_add: List[str] = [], anchor: str = "",
+                                  ignore_caps: bool = True, separator: str = ":",
+                                  column_hits: Dict[str, int] = {}) -> \
+        Tuple[Union[SynopticHeaderIndex, None], Dict[str, List[str]]]:
+    """
+    Builds the keyword index that gives the same matches as the pattern of compile_synoptic_capture_regex, once per
+    column config. See synoptic_capture_regex_ for the parameters.
+
+    :return:                              the index, None if a column or the anchor can not be indexed, and the
+                                          variables mapped to their columns
+    """
+    def build() -> Tuple[Union[SynopticHeaderIndex, None], Dict[str, List[str]]]:
+        branches, regex_variable_mappings = synoptic_capture_branches(
+            dict(columns), val_on_same_line_cols_to_add=val_on_same_line_cols_to_add,
+            val_on_next_line_cols_to_add=val_on_next_line_cols_to_add, anchor=anchor, separator=separator,
+            column_hits=column_hits)
+        return get_synoptic_header_index(branches, anchor, ignore_caps), regex_variable_mappings
+
+    key = get_synoptic_regex_key(columns, val_on_same_line_cols_to_add, val_on_next_line_cols_to_add, anchor,
+                                 ignore_caps, separator)
+    synoptic_index, regex_variable_mappings = get_cached_config(synoptic_index_cache, key, build)
+    return synoptic_index, dict(regex_variable_mappings)
+
+
+# column prefilters of the synoptic regex and their variable mappings, keyed by get_synoptic_regex_key
+synoptic_prefilter_cache: Dict[str, Tuple[ColumnPrefilter, Dict[str, List[str]]]] = {}
+
+
+def compile_synoptic_column_prefilter(columns: Dict[str, Column], val_on_same_line_cols_to_add: List[str] = [],
+                                      val_on_next_line_cols_to_add: List[str] = [], anchor: str = "",
+                                      ignore_caps: bool = True, separator: str = ":",
+                                      column_hits: Dict[str, int] = {}) -> Tuple[ColumnPrefilter, Dict[str, List[str]]]:
+    """
+    Builds the prefilter that runs the pattern of compile_synoptic_capture_regex with only the alternatives of the
+    columns found in a section, once per column config. See synoptic_capture_regex_ for the parameters.
+
+    :return:                              the prefilter and the variables mapped to their columns
+    """
+    def build() -> Tuple[ColumnPrefilter, Dict[str, List[str]]]:
+        branches, regex_variable_mappings = synoptic_capture_branches(
+            dict(columns), val_on_same_line_cols_to_add=val_on_same_line_cols_to_add,
+            val_on_next_line_cols_to_add=val_on_next_line_cols_to_add, anchor=anchor, separator=separator,
+            column_hits=column_hits)
+        return ColumnPrefilter(branches, ignore_caps), regex_variable_mappings
+
+    key = get_synoptic_regex_key(columns, val_on_same_line_cols_to_add, val_on_next_line_cols_to_add, anchor,
+                                 ignore_caps, separator)
+    column_prefilter, regex_variable_mappings = get_cached_config(synoptic_prefilter_cache, key, build)
+    return column_prefilter, dict(regex_variable_mappings)
+
+
 # exporting regular patterns for use in pipeline (not all of them are being used):
 
 # regex patterns for operative reports
@@ -517,6 +756,12 @@ pathology_synoptic_regex = [(capture_double_regex(["Synoptic Report: "], ["- End
 export_operative_regex = [preoperative_rational_regex, operative_breast_regex, operative_axilla_regex]
 export_pathology_regex = [pathology_synoptic_regex]
 
+# words that mark the pages with synoptic sections or laterality, only these pages are OCR'd at full resolution
+operative_page_anchors = ["PREOPERATIVE", "OPERATIVE DETAILS", "PROCEDURE COMPLETION", "Indication", "Breast procedure",
+                          "Axillary procedure", "Unplanned events", "CLINICAL PREAMBLE", "OPERATION PERFORMED",
+                          "Pertain", "RIGHT BREAST", "LEFT BREAST", "RIGHT SIDE", "LEFT SIDE"]
+pathology_page_anchors = ["Synoptic Report", "End of Synoptic"]
+
 # https://regex101.com/r/XWffCF/1
 
 
@@ -0,0 +1,202 @@
+"""
+2021 Yifu (https://github.com/chen-yifu) and Lucy (https://github.com/lhao03)
+This file includes code that extracts the sections between a start and an end marker without the tempered dot of the
+section regular patterns, which tests the end marker again at every character of the section.
+"""
+import functools
+import re
+from typing import Dict, Iterator, List, Pattern, Union
+
+from pipeline.utils.keyword_index import fold_text
+from pipeline.utils.text_views import get_spaced_search
+
+# start(?P<capture>(?:(?!end)[\s\S])+) made by capture_double_regex, or start(?P<capture>((?!end)[\s\S])*)
+section_pattern_regex = re.compile(r"(?P<flags>\(\?i\))?(?P<start>.+?)\(\?P<capture>(?:"
+                                   r"\(\?:\(\?!(?P<end_one_or_more>.+)\)\[\\s\\S\]\)\+|"
+                                   r"\(\(\?!(?P<end_zero_or_more>.+)\)\[\\s\\S\]\)\*)\)", re.DOTALL)
+
+
+def has_top_level_alternation(pattern: str) -> bool:
+    """
+    :param pattern:       a regular pattern
+    :return:              True if the pattern has a | that is not inside a group or a set
+    """
+    depth = 0
+    in_set = False
+    escaped = False
+    for char in pattern:
+        if escaped:
+            escaped = False
+        elif char == "\\":
+            escaped = True
+        elif in_set:
+            in_set = char != "]"
+        elif char == "[":
+            in_set = True
+        elif char == "(":
+            depth += 1
+        elif char == ")":
+            depth -= 1
+        elif char == "|" and depth == 0:
+            return True
+    return False
+
+
+class SectionSplitter:
+    """
+    Finds the start marker with one search and the end marker with another, so each section costs a single scan.
+    Returns the same as re.findall of the whole section pattern. The few matches that would make the pattern backtrack
+    into the start marker, or match nothing, are handed to the full pattern.
+    """
+
+    def __init__(self, pattern: str, start: str, end: str, flags: int, one_or_more: bool):
+        """
+        :param pattern:       the whole section pattern
+        :param start:         pattern of the start marker
+        :param end:           pattern of the end marker
+        :param flags:         re flags of the whole pattern
+        :param one_or_more:   True if the section is at least one character long, False if it can be empty
+        """
+        self.pattern = re.compile(pattern)
+        self.start = re.compile(start, flags)
+        self.end = re.compile(end, flags)
+        # markers like c *a *t are looked for without spaces in a view of the text, see SpacedSearch
+        self.start_search = get_spaced_search(self.start) or self.start
+        self.end_search = get_spaced_search(self.end) or self.end
+        self.one_or_more = one_or_more
+
+    def findall(self, text: str) -> list:
+        """
+        :param text:          text to extract the sections from
+        :return:              same as re.findall(pattern, text)
+        """
+        return list(self.iter_sections(text))
+
+    def first(self, text: str, pos: int = 0):
+        """
+        :param text:          text to extract the section from
+        :param pos:           where to start looking, at or before the first start marker gives the same result as 0
+        :return:              same as the first item of re.findall(pattern, text), None if there is none
+        """
+        return next(self.iter_sections(text, pos), None)
+
+    def iter_sections(self, text: str, pos: int = 0) -> Iterator[Union[str, tuple]]:
+        """
+        :param text:          text to extract the sections from
+        :param pos:           where to start looking
+        :return:              the items of re.findall(pattern, text[pos:]) one at a time
+        """
+        while pos <= len(text):
+            start_match = self.start_search.search(text, pos)
+            if start_match is None:
+                break
+            section_start = start_match.end()
+            end_match = self.end_search.search(text, section_start)
+            section_end = end_match.start() if end_match else len(text)
+            if self.one_or_more:
+                if section_end == section_start:
+                    # the full pattern would try shorter start markers or later starts, let it find this match
+                    match = self.pattern.search(text, pos)
+                    if match is None:
+                        break
+                    yield match.group("capture")
+                    pos = match.end()
+                    continue
+                yield text[section_start:section_end]
+            else:
+                if section_end == start_match.start():
+                    # an empty match, findall has its own rules for those
+                    yield from self.pattern.findall(text, pos)
+                    return
+                last_char = text[section_end - 1] if section_end > section_start else ""
+                yield text[section_start:section_end], last_char
+            pos = section_end
+
+
+def fold_marker(marker: Pattern) -> Union[Pattern, None]:
+    """
+    :param marker:        a compiled start marker
+    :return:              the marker in lower case without re.IGNORECASE, it matches the text made by fold_text where
+                          the marker matches the text. None if the marker does not ignore case or can not be folded
+    """
+    pattern = marker.pattern
+    if not marker.flags & re.IGNORECASE or not pattern.isascii() or "[" in pattern or "(?" in pattern or \
+            re.search(r"\\[A-Z]", pattern):
+        return None
+    return re.compile(pattern.lower(), marker.flags & ~re.IGNORECASE)
+
+
+class MarkerScan:
+    """
+    Finds where start markers first occur. A pattern that begins with its marker can not match in front of that
+    position, so searching for it from there gives the same match. Markers that begin with letters that may have spaces
+    between them are looked for with a SpacedSearch. Other markers that ignore case are looked for in a copy of the
+    text with its case folded, made once per text, where re can use its fast search for their first letters instead of
+    trying every position.
+    """
+
+    def __init__(self, markers: List[Pattern]):
+        """
+        :param markers:       compiled start markers without groups, their flags are kept
+        """
+        self.markers = markers
+        self.spaced_searches = [get_spaced_search(marker) for marker in markers]
+        self.folded_markers = [fold_marker(marker) for marker in markers]
+
+    def positions(self, text: str) -> "MarkerPositions":
+        """
+        :param text:          text to look in
+        :return:              where each marker first matches, looked for when it is first asked for
+        """
+        return MarkerPositions(self, text)
+
+
+class MarkerPositions:
+    """
+    Where the markers of a MarkerScan first occur in one text, positions[index] is None if the marker is not in it.
+    """
+
+    def __init__(self, marker_scan: MarkerScan, text: str):
+        """
+        :param marker_scan:   the markers
+        :param text:          text to look in
+        """
+        self.marker_scan = marker_scan
+        self.text = text
+        self.folded_text = None
+        self.found: Dict[int, Union[int, None]] = {}
+
+    def __getitem__(self, index: int) -> Union[int, None]:
+        if index not in self.found:
+            spaced_search = self.marker_scan.spaced_searches[index]
+            folded_marker = self.marker_scan.folded_markers[index]
+            if spaced_search is not None:
+                match = spaced_search.search(self.text)
+            elif folded_marker is None:
+                match = self.marker_scan.markers[index].search(self.text)
+            else:
+                if self.folded_text is None:
+                    self.folded_text = fold_text(self.text)
+                match = folded_marker.search(self.folded_text)
+            self.found[index] = match.start() if match else None
+        return self.found[index]
+
+
+@functools.lru_cache(maxsize=None)
+def get_section_splitter(pattern: str) -> Union[SectionSplitter, None]:
+    """
+    :param pattern:       a regular pattern
+    :return:              a splitter that gives the same results as the pattern, None if it is not a section pattern
+    """
+    parts = section_pattern_regex.fullmatch(pattern)
+    if parts is None:
+        return None
+    start = parts["start"]
+    end = parts["end_one_or_more"] if parts["end_one_or_more"] is not None else parts["end_zero_or_more"]
+    flags = re.IGNORECASE if parts["flags"] else 0
+    try:
+        if re.compile(start).groups or re.compile(end).groups or has_top_level_alternation(start):
+            return None
+        return SectionSplitter(pattern, start, end, flags, one_or_more=parts["end_one_or_more"] is not None)
+    except re.error:
+        return None
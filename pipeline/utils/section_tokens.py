@@ -0,0 +1,163 @@
+"""
+2021 Yifu (https://github.com/chen-yifu) and Lucy (https://github.com/lhao03)
+This file includes code that splits a synoptic section once into its lines and its header records, the column-value
+pairs of the generic regex with their line, anchor, header, separator, value lines and spans. The case folded section
+and the section without spaces are made once too. The generic pairs, the specific pairs the regex falls back to and
+the extraction tools of a section look these up instead of scanning the section again.
+"""
+import functools
+import itertools
+from typing import Dict, List, Tuple, Union
+
+from pipeline.utils.keyword_index import fold_text
+from pipeline.utils.text_views import TextView, get_text_view
+
+# characters in front of a header, like "- " of "- Tumour Site: Left"
+anchor_characters = " \t-*•"
+
+
+class SectionTokens:
+    """
+    The lines of a synoptic section. What depends on the separator is found the first time it is asked for and kept,
+    the case folded section too.
+    """
+
+    def __init__(self, text: str):
+        """
+        :param text:          the synoptic section
+        """
+        self.text = text
+        self.line_texts = text.split("\n")
+        self.line_starts = list(itertools.accumulate((len(line) + 1 for line in self.line_texts[:-1]), initial=0))
+        self.separator_positions: Dict[str, List[Tuple[int, int]]] = {}
+        self.header_records: Dict[str, List[dict]] = {}
+        self.header_lookups: Dict[str, Dict[str, dict]] = {}
+        self._folded_text = None
+
+    @property
+    def folded_text(self) -> str:
+        """
+        :return:              the section with its case folded like fold_text
+        """
+        if self._folded_text is None:
+            self._folded_text = fold_text(self.text)
+        return self._folded_text
+
+    def view(self, fold_case: bool = True) -> TextView:
+        """
+        :param fold_case:     whether to fold the case of the view like fold_text
+        :return:              the section without spaces, the same view the SpacedSearches of the section look in
+        """
+        return get_text_view(self.text, fold_case)
+
+    def separators(self, separator: str) -> List[Tuple[int, int]]:
+        """
+        :param separator:     what separates the column and value
+        :return:              for every line, where the last separator starts and where the last separator or — starts,
+                              in the line, -1 if there is none
+        """
+        if separator not in self.separator_positions:
+            positions = []
+            for line in self.line_texts:
+                separator_start = line.rfind(separator)
+                positions.append((separator_start, max(separator_start, line.rfind("—"))))
+            self.separator_positions[separator] = positions
+        return self.separator_positions[separator]
+
+    def headers(self, separator: str = ":") -> List[dict]:
+        """
+        The pairs of the generic regex of the separator, in the order re.finditer gives them. A pair starts on the
+        first line that still has a separator, its column runs up to the last separator on the line. Its value stops at
+        the first character that is followed by a separator or a — later on its own line, so it takes in the lines
+        after it until one has a separator or a — after its first character.
+
+        :param separator:     what separates the column and value, taken literally
+        :return:              {"line": line number of the header, "anchor": ..., "header": column without its anchor,
+                              "separator": ..., "value": ..., "value lines": the value split at its newlines,
+                              "header span": ..., "value span": ...} of every pair, the spans are positions in the
+                              section and the anchor and header together are the column of the generic regex
+        """
+        if separator in self.header_records:
+            return self.header_records[separator]
+        lines = self.line_texts
+        # where the last separator and the last separator or — of every line start
+        separators = self.separators(separator)
+        records = []
+        # the search goes on from column position of line line_index
+        line_index = 0
+        position = 0
+        while line_index < len(lines):
+            line = lines[line_index]
+            column_end, last_stop = separators[line_index]
+            if column_end < position:
+                line_index += 1
+                position = 0
+                continue
+            header_line = line_index
+            line_start = self.line_starts[line_index]
+            column_start = position
+            column = line[column_start:column_end]
+            header_start = column_end - len(column.lstrip(anchor_characters))
+            value_start = column_end + len(separator)
+            if last_stop > value_start:
+                value_lines = [""]
+                position = value_start
+            else:
+                value_lines = [line[value_start:]]
+                line_index += 1
+                while line_index < len(lines) and separators[line_index][1] <= 0:
+                    value_lines.append(lines[line_index])
+                    line_index += 1
+                if line_index < len(lines):
+                    # the newline in front of the line the value stops at is part of the value
+                    value_lines.append("")
+                position = 0
+            value = "\n".join(value_lines)
+            records.append({"line": header_line, "anchor": line[column_start:header_start],
+                            "header": line[header_start:column_end], "separator": separator, "value": value,
+                            "value lines": value_lines,
+                            "header span": (line_start + header_start, line_start + column_end),
+                            "value span": (line_start + value_start, line_start + value_start + len(value))})
+        self.header_records[separator] = records
+        return records
+
+    def header_lookup(self, separator: str = ":") -> Dict[str, dict]:
+        """
+        :param separator:     what separates the column and value
+        :return:              every header made by normalize_column, mapped to its first record with a value that is
+                              not only white space
+        """
+        if separator not in self.header_lookups:
+            lookup = {}
+            for record in self.headers(separator):
+                if record["value"].strip():
+                    lookup.setdefault(normalize_column(record["header"]), record)
+            self.header_lookups[separator] = lookup
+        return self.header_lookups[separator]
+
+
+def normalize_column(column: str) -> str:
+    """
+    :param column:        a column as it is in the report or in the column mappings
+    :return:              the column in lower case without the bullet, asterisks or extra white space around it
+    """
+    return " ".join(column.lower().strip(anchor_characters).split())
+
+
+@functools.lru_cache(maxsize=32)
+def tokenize_section(text: str) -> SectionTokens:
+    """
+    Splits the section once, the extraction stages of the same section all get the same tokens.
+
+    :param text:          the synoptic section
+    :return:              the tokens
+    """
+    return SectionTokens(text)
+
+
+def get_section_tokens(text: Union[str, SectionTokens]) -> SectionTokens:
+    """
+    :param text:          the synoptic section, or its tokens
+    :return:              the tokens
+    """
+    return text if isinstance(text, SectionTokens) else tokenize_section(text)
@@ -0,0 +1,69 @@
+"""
+2021 Yifu (https://github.com/chen-yifu) and Lucy (https://github.com/lhao03)
+This file includes code that checks whether a section looks synoptic before it is extracted from, by counting how many
+columns have a header in it with one pass of a keyword index.
+"""
+import collections
+from typing import Dict, List, Set
+
+from pipeline.utils.column import Column
+from pipeline.utils.keyword_index import KeywordIndex, fold_text
+from pipeline.utils.text_views import get_text_view
+
+
+class SynopticSignature:
+    """
+    Counts the columns that have one of their report columns in a section. The report columns are looked for without
+    spaces and case in the view of the section without them, so OCR spaces in a header still count it.
+    """
+
+    def __init__(self, columns: Dict[str, Column]):
+        """
+        :param columns:       human columns mapped to the columns to look for
+        """
+        self.num_columns = len(columns)
+        # every section that was skipped, as {"report": ..., "columns found": ..., "columns": ...}
+        self.skipped_sections: List[dict] = []
+        self.keyword_index = KeywordIndex()
+        # keyword id mapped to the columns it is a report column of
+        self.keyword_columns: Dict[int, Set[int]] = collections.defaultdict(set)
+        keyword_ids = {}
+        for column_index, column in enumerate(columns.values()):
+            for report_col in column.primary_report_col + column.alternative_report_col:
+                keyword = fold_text(report_col.replace(" ", ""))
+                if not keyword:
+                    continue
+                if keyword not in keyword_ids:
+                    keyword_ids[keyword] = self.keyword_index.add(keyword)
+                self.keyword_columns[keyword_ids[keyword]].add(column_index)
+        self.keyword_index.build()
+
+    def count_columns(self, text: str) -> int:
+        """
+        :param text:          the section
+        :return:              number of columns with a report column in the section
+        """
+        found = set()
+        for _, keyword_id in self.keyword_index.find_all(get_text_view(text).text):
+            found.update(self.keyword_columns[keyword_id])
+        return len(found)
+
+    def is_synoptic(self, columns_found: int, skip_threshold: float = 0.95) -> bool:
+        """
+        :param columns_found:   what count_columns gave for the section
+        :param skip_threshold:  a section is not synoptic if more than this proportion of the columns is not in it, like
+                                percentage_missing of process_synoptic_section
+        :return:                True if enough columns are in the section
+        """
+        if not self.num_columns:
+            return True
+        return 1 - columns_found / self.num_columns <= skip_threshold
+
+    def log_skipped_section(self, report_id: str, columns_found: int):
+        """
+        :param report_id:       the study id of the skipped section
+        :param columns_found:   number of columns with a report column in the section
+        """
+        self.skipped_sections.append({"report": report_id, "columns found": columns_found,
+                                      "columns": self.num_columns})
+
@@ -0,0 +1,182 @@
+"""
+2021 Yifu (https://github.com/chen-yifu) and Lucy (https://github.com/lhao03)
+This file includes code that makes normalized views of a text, in lower case and without spaces, that map back to the
+text. The patterns that allow OCR spaces between every letter, like c *a *t, are then found with a plain search for
+their letters in the view instead of trying the pattern at every position of the text.
+"""
+import bisect
+import functools
+import re
+from typing import Iterator, List, Pattern, Union
+
+from pipeline.utils.keyword_index import fold_text
+
+# punctuation that stands for itself in a pattern without being escaped
+plain_punctuation = " :;,-'\"/&=<>!%#@~`_"
+
+
+class TextView:
+    """
+    A text with some characters removed and its case folded if asked for, and where each of its characters is in the
+    text. Positions are mapped back from the nearest position mapped before, counting the removed characters in
+    between with str.count, so no map of every character is made.
+    """
+
+    def __init__(self, text: str, fold_case: bool = True, removed: str = " "):
+        """
+        :param text:          the text
+        :param fold_case:     whether to fold the case of the view like fold_text
+        :param removed:       the characters to leave out of the view
+        """
+        self.original = text
+        self.removed = removed
+        self.text = text.translate({ord(char): None for char in removed}) if removed else text
+        self.text = fold_text(self.text) if fold_case else self.text
+        self.removed_run = re.compile("[{}]*".format(re.escape(removed))) if removed else re.compile("")
+        # positions in the view and the text that are known to be the same character, in order
+        self.view_points = [0]
+        self.original_points = [0]
+
+    def count_removed(self, start: int, end: int) -> int:
+        """
+        :param start:         position in the text
+        :param end:           position in the text
+        :return:              number of removed characters in text[start:end]
+        """
+        return sum(self.original.count(char, start, end) for char in self.removed)
+
+    def to_original(self, index: int) -> int:
+        """
+        :param index:         position in the view
+        :return:              position of the same character in the text
+        """
+        point = bisect.bisect_right(self.view_points, index) - 1
+        view_pos, pos = self.view_points[point], self.original_points[point]
+        while view_pos < index:
+            step = index - view_pos
+            view_pos += step - self.count_removed(pos, pos + step)
+            pos += step
+        pos = self.removed_run.match(self.original, pos).end()
+        if self.view_points[point] != index:
+            self.view_points.insert(point + 1, index)
+            self.original_points.insert(point + 1, pos)
+        return pos
+
+    def to_view(self, pos: int) -> int:
+        """
+        :param pos:           position in the text
+        :return:              position in the view of the first character of the text at or after pos that is kept
+        """
+        point = bisect.bisect_right(self.original_points, pos) - 1
+        return self.view_points[point] + pos - self.original_points[point] - \
+            self.count_removed(self.original_points[point], pos)
+
+    def find_all(self, literal: str, pos: int = 0) -> Iterator[int]:
+        """
+        :param literal:       text to look for in the view
+        :param pos:           position in the text to start looking at
+        :return:              positions in the text of every occurrence of the literal in the view, overlapping ones too
+        """
+        index = self.text.find(literal, self.to_view(pos))
+        while index != -1:
+            yield self.to_original(index)
+            index = self.text.find(literal, index + 1)
+
+
+@functools.lru_cache(maxsize=32)
+def get_text_view(text: str, fold_case: bool = True, removed: str = " ") -> TextView:
+    """
+    Makes the view once per text, the patterns of a report all search the same view.
+
+    :param text:          the text
+    :param fold_case:     whether to fold the case of the view like fold_text
+    :param removed:       the characters to leave out of the view
+    :return:              the view
+    """
+    return TextView(text, fold_case, removed)
+
+
+def spaced_literal(pattern: str, fold_case: bool) -> Union[str, None]:
+    """
+    :param pattern:       a regular pattern
+    :param fold_case:     whether the pattern ignores case
+    :return:              the letters every match of the pattern begins with, without spaces and folded if the pattern
+                          ignores case, None if the pattern does not begin with a character it always matches
+    """
+    if "|" in pattern:
+        # an OR anywhere may be at the top level, the other alternatives do not begin with the literal
+        return None
+    literal = ""
+    index = 0
+    while index < len(pattern):
+        char = pattern[index]
+        if char == "\\" and index + 1 < len(pattern) and not pattern[index + 1].isalnum():
+            char = pattern[index + 1]
+            index += 1
+        elif not (char.isascii() and (char.isalnum() or char in plain_punctuation)):
+            break
+        quantifier = pattern[index + 1:index + 2]
+        if char == " ":
+            if not literal or quantifier == "{":
+                break
+            index += 2 if quantifier in ["*", "+", "?"] else 1
+            continue
+        if quantifier in ["*", "?", "{"]:
+            break
+        literal += char
+        if quantifier == "+":
+            break
+        index += 1
+    if len(literal) < 2:
+        return None
+    return literal.lower() if fold_case else literal
+
+
+class SpacedSearch:
+    """
+    Gives the same match as the search of a pattern that allows spaces between its letters. The letters it begins with
+    are looked for in the view of the text without spaces, and the pattern is only tried where they are.
+    """
+
+    def __init__(self, pattern: Pattern, literal: str):
+        """
+        :param pattern:       the compiled pattern
+        :param literal:       see spaced_literal
+        """
+        self.pattern = pattern
+        self.literal = literal
+        self.fold_case = bool(pattern.flags & re.IGNORECASE)
+
+    def search(self, text: str, pos: int = 0) -> Union[re.Match, None]:
+        """
+        :param text:          text to look in
+        :param pos:           where to start looking
+        :return:              same as pattern.search(text, pos)
+        """
+        for start in get_text_view(text, self.fold_case).find_all(self.literal, pos):
+            match = self.pattern.match(text, start)
+            if match:
+                return match
+        return None
+
+
+def get_spaced_search(pattern: Pattern) -> Union[SpacedSearch, None]:
+    """
+    :param pattern:       a compiled pattern
+    :return:              the search, None if the pattern does not begin with letters it always matches
+    """
+    if pattern.flags & re.VERBOSE:
+        return None
+    literal = spaced_literal(re.sub(r"^\(\?i\)", "", pattern.pattern), bool(pattern.flags & re.IGNORECASE))
+    if literal is None or (pattern.flags & re.IGNORECASE and not literal.isascii()):
+        return None
+    return SpacedSearch(pattern, literal)
+
+
+def get_searches(patterns: List[Pattern]) -> List[Union[SpacedSearch, Pattern]]:
+    """
+    :param patterns:      compiled patterns
+    :return:              the SpacedSearch of every pattern that has one, the pattern itself otherwise
+    """
+    return [get_spaced_search(pattern) or pattern for pattern in patterns]
+
@@ -3,11 +3,15 @@
 This file includes code that deals with utilities such as time and paths.
 """
 import collections
+import functools
+import hashlib
+import multiprocessing
 import os
 import re
+from concurrent.futures import ProcessPoolExecutor
 from copy import copy
 from datetime import datetime
-from typing import List
+from typing import List, FrozenSet
 
 from nltk.corpus import words
 from pathlib import Path
@@ -50,15 +54,32 @@ def find_all_vocabulary(list_of_strings, print_debug=True, min_freq=2):
     :param min_freq:
     :return:
     """
-    total_string = " ".join(list_of_strings)
-    total_words = total_string.split()
-    counter = collections.Counter(total_words)
+    counter = collections.Counter()
+    for text in list_of_strings:
+        counter.update(text.split())
+    return find_vocabulary_in_counts(counter, print_debug=print_debug, min_freq=min_freq)
+
+
+@functools.lru_cache(maxsize=1)
+def get_english_word_set() -> FrozenSet[str]:
+    """
+    :return:    the lower case words of the english dictionary, loaded once per process
+    """
+    return frozenset([w.lower() for w in words.words() if len(w) > 1] + ["a", "i"])
+
+
+def find_vocabulary_in_counts(counter: collections.Counter, print_debug=True, min_freq=2) -> List[str]:
+    """
+    :param counter:       how often each word occurs in the reports
+    :param print_debug:   print debug statements in Terminal if True
+    :param min_freq:      minimum number of times a word occurs
+    :return:              non-english words longer than 3 letters that occur at least min_freq times
+    """
     result = []
     for word, freq in counter.items():
         if freq >= min_freq and not any(l in word for l in punctuation) and all(l.isalpha() for l in word):
             result.append(word)
-    english_words = [w.lower() for w in words.words() if len(w) > 1] + ["a", "i"]
-    non_english_words = list(set([w.lower() for w in result]) - set(english_words))
+    non_english_words = list(set([w.lower() for w in result]) - get_english_word_set())
     non_english_words = [w for w in non_english_words if len(w) > 3]
     if print_debug:
         s = "Found these {} non-english words with" \
@@ -79,6 +100,57 @@ def get_english_dictionary_as_list():
     return res
 
 
+def hash_file(path: str, chunk_size: int = 1 << 20) -> str:
+    """
+    :param path:          path to the file
+    :param chunk_size:    number of bytes read at a time
+    :return:              sha256 hex digest of the file's content
+    """
+    sha = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+
+def get_process_pool(max_workers: int = None, initializer=None, initargs: tuple = (),
+                     start_workers: bool = False) -> ProcessPoolExecutor:
+    """
+    Creates a pool of worker processes with the start method of the platform, fork on Linux and spawn on macOS and
+    Windows, where forking a process that has loaded Tk can crash it. With spawn every worker imports the main module,
+    so scripts that use the pool must start the pipeline under if __name__ == "__main__", like main.py.
+
+    :param max_workers:     number of worker processes, defaults to the number of cores
+    :param initializer:     function called once in each worker when it starts
+    :param initargs:        arguments of initializer, pickled once per worker unless the workers are forked
+    :param start_workers:   start the workers now, in the calling thread, instead of with the first task. a pool that
+                            is used from another thread later is then not forked from that thread
+    :return:                the process pool
+    """
+    max_workers = max_workers or os.cpu_count() or 1
+    pool = ProcessPoolExecutor(max_workers=max_workers, initializer=initializer, initargs=initargs)
+    if start_workers and multiprocessing.get_start_method() == "fork":
+        # with fork the first task starts every worker at once, the other start methods are safe from any thread
+        pool.submit(os.getpid).result()
+    return pool
+
+
+def print_and_log(message: str, print_debug: bool = True, log_box=None, app=None):
+    """
+    :param message:         the message
+    :param print_debug:     print the message in Terminal if True
+    :param log_box:         tk.Text of the GUI the message is added to, not used if None
+    :param app:             the GUI, updated so the message shows up right away
+    """
+    if print_debug:
+        print(message)
+    if log_box is not None:
+        log_box.insert("end", message + "\n")
+        log_box.see("end")
+        if app is not None:
+            app.update()
+
+
 def get_next_col_name(col, keys):
     i = 2
     next_col = col + "{}".format(i)
@@ -0,0 +1,103 @@
+"""
+2021 Yifu (https://github.com/chen-yifu) and Lucy (https://github.com/lhao03)
+This file includes code that counts how often each word occurs in the reports, across runs, so the vocabulary common to
+the reports does not have to be counted again from every report.
+"""
+import collections
+import hashlib
+import os
+import pickle
+from typing import Dict, Iterable, Iterator, List, Tuple
+
+from pipeline.utils.report import Report
+from pipeline.utils.utils import find_vocabulary_in_counts
+
+
+# bump when the format of the saved counts changes, counts saved in another format are counted again
+counts_version = 2
+
+
+class VocabularyCounts:
+    """
+    Term frequencies of every report seen so far. Reports are told apart by their id, and the hash of their text tells
+    whether a report that is read in again changed. The counts of a report that changed are taken out before its new
+    text is counted, so every report is counted once with its latest text.
+    """
+
+    def __init__(self, counts_path: str = None):
+        """
+        :param counts_path:   path to the pickle the counts are saved in, loaded if it exists. not saved if None
+        """
+        self.counts_path = counts_path
+        self.counter = collections.Counter()
+        # report id mapped to the hash of its text and the counts of its words
+        self.documents: Dict[str, Tuple[str, Dict[str, int]]] = {}
+        if counts_path and os.path.exists(counts_path):
+            with open(counts_path, "rb") as f:
+                saved = pickle.load(f)
+            if saved.get("version") == counts_version:
+                self.counter = saved["counter"]
+                self.documents = saved["documents"]
+
+    @property
+    def num_documents(self) -> int:
+        """
+        :return:              number of different reports counted
+        """
+        return len(self.documents)
+
+    def add(self, text: str, document_id: str = None) -> bool:
+        """
+        :param text:          text of a report
+        :param document_id:   id of the report, the hash of its text if None
+        :return:              True if the report was counted, False if it was counted before with the same text
+        """
+        document_hash = hashlib.sha256(text.encode("utf8")).hexdigest()
+        document_id = str(document_id) if document_id is not None else document_hash
+        if document_id in self.documents:
+            old_hash, old_counts = self.documents[document_id]
+            if old_hash == document_hash:
+                return False
+            self.counter.subtract(old_counts)
+            for word in old_counts:
+                if self.counter[word] <= 0:
+                    del self.counter[word]
+        counts = collections.Counter(text.split())
+        self.documents[document_id] = (document_hash, dict(counts))
+        self.counter.update(counts)
+        return True
+
+    def count_reports(self, reports: Iterable[Report]) -> Iterator[Report]:
+        """
+        Counts the reports as they stream past.
+
+        :param reports:       the reports
+        :return:              the same reports
+        """
+        for report in reports:
+            self.add(report.text, report.report_id)
+            yield report
+
+    def find_vocabulary(self, min_freq: int = None, print_debug: bool = True) -> List[str]:
+        """
+        :param min_freq:      minimum number of times a word occurs, by default about half of the reports counted
+        :param print_debug:   print debug statements in Terminal if True
+        :return:              non-english words that are common to the reports
+        """
+        min_freq = min_freq if min_freq is not None else int((self.num_documents - 1) / 2) - 1
+        return find_vocabulary_in_counts(self.counter, print_debug=print_debug, min_freq=min_freq)
+
+    def save(self):
+        """
+        Writes the counts to a temporary file first and then renames it, so a crash never leaves half of them behind.
+        """
+        if not self.counts_path:
+            return
+        folder = os.path.dirname(self.counts_path)
+        if folder and not os.path.exists(folder):
+            os.makedirs(folder, exist_ok=True)
+        temporary_path = self.counts_path + ".part"
+        with open(temporary_path, "wb") as f:
+            pickle.dump({"version": counts_version, "counter": self.counter, "documents": self.documents}, f,
+                        protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temporary_path, self.counts_path)
@@ -0,0 +1,88 @@
+"""
+2021 Yifu (https://github.com/chen-yifu) and Lucy (https://github.com/lhao03)
+This file includes the generators of the random reports the tests compare the extraction against the regex with.
+"""
+import random
+import string
+from typing import Callable, Dict, List, Pattern
+
+import pytest
+
+# ways a column and its value are written in the synoptic sections of the reports
+section_line_formats = ["- {}: {}", "{}: {}", "  -- {} : {}", "{}{}", "note {}: {}"]
+
+
+@pytest.fixture
+def rng(request) -> random.Random:
+    """
+    A random generator seeded with the name of the test and its parameters, so every run of a test sees the same input.
+    """
+    return random.Random(request.node.name)
+
+
+@pytest.fixture
+def make_words(rng: random.Random) -> Callable[..., str]:
+    def make(count: int, letters: str = string.ascii_lowercase, min_length: int = 2, max_length: int = 9) -> str:
+        """
+        :param count:         number of words
+        :param letters:       letters of the words
+        :param min_length:    letters of the shortest word
+        :param max_length:    letters of the longest word
+        :return:              the words joined by spaces
+        """
+        return " ".join("".join(rng.choice(letters) for _ in range(rng.randint(min_length, max_length)))
+                        for _ in range(count))
+
+    return make
+
+
+@pytest.fixture
+def make_names(rng: random.Random, make_words: Callable[..., str]) -> Callable[[int], List[str]]:
+    def make(count: int) -> List[str]:
+        """
+        :param count:         number of column names
+        :return:              sorted column names of one to three words
+        """
+        names = set()
+        while len(names) < count:
+            names.add(make_words(rng.randint(1, 3), min_length=3, max_length=8))
+        return sorted(names)
+
+    return make
+
+
+@pytest.fixture
+def make_section(rng: random.Random) -> Callable[..., str]:
+    def make(names: List[str], num_lines: int, values: List[str] = None,
+             formats: List[str] = section_line_formats) -> str:
+        """
+        :param names:         the column names the lines start with, in upper, lower or title case
+        :param num_lines:     number of lines
+        :param values:        values of the columns, by default the column names, nothing and a few values
+        :param formats:       ways a column and its value are written
+        :return:              a synoptic section
+        """
+        values = values if values is not None else names + ["", "left", "2.5 cm"]
+        lines = []
+        for _ in range(num_lines):
+            name = rng.choice(names)
+            name = rng.choice([name, name.upper(), name.title()])
+            lines.append(rng.choice(formats).format(name, rng.choice(values)))
+        return "\n".join(lines)
+
+    return make
+
+
+@pytest.fixture
+def regex_pairs() -> Callable[..., List[Dict[str, str]]]:
+    def find(pattern: Pattern, text: str, keep_empty: bool = False) -> List[Dict[str, str]]:
+        """
+        :param pattern:       the synoptic regex
+        :param text:          a synoptic section
+        :param keep_empty:    keep the matches of the empty alternatives, which capture nothing
+        :return:              the groupdict of every match without the Nones
+        """
+        pairs = [{k: v for k, v in m.groupdict().items() if v is not None} for m in pattern.finditer(text)]
+        return pairs if keep_empty else [pair for pair in pairs if pair]
+
+    return find
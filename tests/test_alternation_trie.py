@@ -0,0 +1,55 @@
+"""
+2021 Yifu (https://github.com/chen-yifu) and Lucy (https://github.com/lhao03)
+This file includes tests of the synoptic regex with its column names factored into a trie against the flat one.
+"""
+import re
+import string
+
+import pytest
+
+from pipeline.utils.alternation_trie import count_column_hits
+from pipeline.utils.column import Column
+from pipeline.utils.regex_tools import synoptic_capture_regex_
+
+
+@pytest.fixture
+def make_synonym_columns(rng, make_words):
+    def make(synonym_count: int) -> dict:
+        """
+        :return:        columns with synonyms that share their prefixes, some with punctuation the regex makes optional
+        """
+        columns = {}
+        for prefix in ["number of", "tumour", "margin", "lymph node"]:
+            synonyms = set()
+            while len(synonyms) < synonym_count:
+                synonym = "{} {}".format(prefix, make_words(1, string.ascii_lowercase[:6], 1, 5))
+                if rng.random() < 0.5:
+                    synonym += " " + make_words(1, string.ascii_lowercase[:6], 1, 5)
+                if rng.random() < 0.2:
+                    synonym += rng.choice(["?", " (s)", "/site", " (x/y)"])
+                synonyms.add(synonym)
+            columns[prefix] = Column(human_col=prefix, primary_report_col=sorted(synonyms),
+                                     capture_up_to_separator=True)
+        return columns
+
+    return make
+
+
+@pytest.mark.parametrize("synonym_count", [1, 10, 50])
+def test_factored_regex_finds_the_same_values_as_the_flat_regex(synonym_count, rng, make_synonym_columns,
+                                                                make_section):
+    columns = make_synonym_columns(synonym_count)
+    synonyms = [synonym for column in columns.values() for synonym in column.primary_report_col]
+    # headers that stop or run on after a column name, so the trie has to keep its alternatives in order
+    headers = synonyms + [synonym[:rng.randint(1, len(synonym))] for synonym in synonyms] + \
+        [synonym + rng.choice(["x", " extra"]) for synonym in synonyms]
+    texts = [make_section(headers, 20, synonyms, ["- {}: {}", "{}: {}", " -- {}: {}"]) for _ in range(20)]
+    column_hits = count_column_hits(texts, synonyms)
+    for anchor in [r"^ *-* *", ""]:
+        found = []
+        for factor_columns in [False, True]:
+            synoptic_regex, _ = synoptic_capture_regex_(dict(columns), anchor=anchor, column_hits=column_hits,
+                                                        factor_columns=factor_columns)
+            synoptic_regex = re.compile(synoptic_regex, re.MULTILINE)
+            found.append([[m.groupdict() for m in synoptic_regex.finditer(text)] for text in texts])
+        assert found[0] == found[1]
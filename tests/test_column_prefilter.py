@@ -0,0 +1,46 @@
+"""
+2021 Yifu (https://github.com/chen-yifu) and Lucy (https://github.com/lhao03)
+This file includes tests of the column prefilter against the regex it stands in for.
+"""
+import pytest
+
+from pipeline.utils.column import Column
+from pipeline.utils.extraction_engine import ExtractionEngine
+from pipeline.utils.keyword_index import split_alternatives
+from pipeline.utils.regex_tools import compile_synoptic_capture_regex, compile_synoptic_column_prefilter
+
+
+@pytest.mark.parametrize("column_count", [5, 20, 80, 320])
+def test_prefilter_finds_the_same_values_as_the_regex(column_count, rng, make_names, make_words, make_section,
+                                                      regex_pairs):
+    names = make_names(column_count)
+    # a few columns have their value on the next line, so the regex has empty alternatives
+    next_line_names = names[:max(column_count // 10, 1)]
+    columns = {name: Column(human_col=name, primary_report_col=[name], capture_up_to_separator=True)
+               for name in names[len(next_line_names):]}
+    values = [make_words(1, max_length=9) for _ in range(50)]
+    # the kinds of sections have a few of the columns each, like the breast and axilla sections of an operative report
+    kinds = [rng.sample(names, min(5, column_count)) for _ in range(4)]
+    synoptic_regex, _ = compile_synoptic_capture_regex(columns, val_on_next_line_cols_to_add=next_line_names,
+                                                       anchor=r"^ *-* *")
+    column_prefilter, _ = compile_synoptic_column_prefilter(columns, val_on_next_line_cols_to_add=next_line_names,
+                                                            anchor=r"^ *-* *")
+    for _ in range(50):
+        section = make_section(rng.choice(kinds), 20, values, ["- {}: {}", "{}\n{}", "{} {}"])
+        assert regex_pairs(column_prefilter.select(section), section, keep_empty=True) == \
+            regex_pairs(synoptic_regex, section, keep_empty=True)
+
+
+def test_split_alternatives_keeps_the_empty_alternatives():
+    same_line = {"val on next line": False}
+    next_line = {"val on next line": True}
+    assert split_alternatives([same_line, next_line, same_line, next_line]) == \
+        [[same_line], [], [next_line, same_line], [], [next_line]]
+    assert split_alternatives([next_line, next_line]) == [[], [next_line], [next_line]]
+
+
+def test_unknown_extraction_engine_is_rejected():
+    assert ExtractionEngine("column prefilter") is ExtractionEngine.COLUMN_PREFILTER
+    assert ExtractionEngine(ExtractionEngine.REGEX) is ExtractionEngine.REGEX
+    with pytest.raises(ValueError):
+        ExtractionEngine("keyword_index")
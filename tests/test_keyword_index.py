@@ -0,0 +1,23 @@
+"""
+2021 Yifu (https://github.com/chen-yifu) and Lucy (https://github.com/lhao03)
+This file includes tests of the keyword index of the synoptic columns against the regex it stands in for.
+"""
+import pytest
+
+from pipeline.utils.column import Column
+from pipeline.utils.regex_tools import compile_synoptic_capture_regex, compile_synoptic_header_index
+
+
+@pytest.mark.parametrize("column_count", [1, 10, 40, 160])
+def test_header_index_finds_the_same_values_as_the_regex(column_count, make_names, make_section, regex_pairs):
+    names = make_names(column_count)
+    columns = {name: Column(human_col=name, primary_report_col=[name], capture_up_to_separator=True)
+               for name in names}
+    for anchor in [r"^ *-* *", ""]:
+        synoptic_regex, regex_mappings = compile_synoptic_capture_regex(columns, anchor=anchor)
+        synoptic_index, index_mappings = compile_synoptic_header_index(columns, anchor=anchor)
+        assert synoptic_index is not None
+        assert index_mappings == regex_mappings
+        for _ in range(20):
+            section = make_section(names, 30)
+            assert synoptic_index.find_groupdicts(section) == regex_pairs(synoptic_regex, section)
@@ -0,0 +1,103 @@
+"""
+2021 Yifu (https://github.com/chen-yifu) and Lucy (https://github.com/lhao03)
+This file includes tests of the laterality of a report and the sections of each breast against the patterns they were
+found with before, which were searched from the start of the report one after the other.
+"""
+import re
+
+import pytest
+
+from pipeline.preprocessing.extract_synoptic import find_left_right_label, operative_sides_scan
+from pipeline.utils.regex_tools import left_operative_report, right_operative_report
+from pipeline.utils.report_type import ReportType
+
+phrases = ["PREOPERATIVE DIAGNOSIS", "CLINICAL PREAMBLE", "Clinical Preamble", "OPERATION PERFORMED",
+           "Part(s) Involved:\n", "PART (S) INVOLVED :\n", "Pertain to the", "RIGHT BREAST", "LEFT BREAST", "LEFT SIDE",
+           "RIGHT SIDE", "FOLLOW UP", "Right breast:", "Left breast:", "PREOPERATIVE EVALUATION",
+           "RATIONALE FOR SURGERY LEFT BREAST", "RATIONALE FOR SURGERY RIGHT BREAST"]
+sides = ["left", "right", "Left", "Right", "LEFT", "RIGHT", "l e f t", "r i g h t", "lef t"]
+
+
+def find_left_right_label_by_regex(string: str) -> str:
+    # find_left_right_label before the patterns were searched from where their phrase first occurs
+    preop_diag = r"PREOPERATIVE DIAGNOSIS[\s\S]*?(?P<laterality>l *e *f *t|r *i *g *h *t|Right|Left).*"
+    clinical_pream = r"(?i)CLINICAL PREAMBLE[\s\S]*?(?P<laterality>l *e *f *t|r *i *g *h *t|Right|Left).*"
+    op_perforemd = r"OPERATION PERFORMED[\s\S]*?(?P<laterality>l *e *f *t|r *i *g *h *t|Right|Left).*"
+    parts_involved = r"(?i)p *a *r *t *\( *s *\) *i *n *v *o *l *v *e *d *: *\n.*(?P<laterality>l *e *f *t *|r *i *g " \
+                     r"*h *t *).* "
+    match = None
+    for laterality_regex in [parts_involved, preop_diag, clinical_pream, op_perforemd]:
+        match = re.search(re.compile(laterality_regex), string)
+        try:
+            laterality = match.group("laterality").replace(" ", "").strip().lower()
+            if laterality == "left":
+                return "L"
+            elif laterality == "right":
+                return "R"
+            else:
+                raise AttributeError
+        except AttributeError:
+            continue
+    try:
+        laterality = match.group("laterality").replace(" ", "").strip()
+        return "L" if laterality.lower() == "left" else "R"
+    except AttributeError:
+        return "unknown"
+
+
+def first_section_by_regex(regexs: list, text: str) -> str:
+    # extract_section and the tuple handling of the operative split before the start markers were shared
+    for regex, to_append in regexs:
+        extraction_result = re.findall(re.compile(regex), text)
+        if len(extraction_result) != 0:
+            section = extraction_result[0] if to_append == "" else to_append + extraction_result[0]
+            return section[0] if isinstance(section, tuple) else section
+    return ""
+
+
+@pytest.fixture
+def make_laterality_text(rng, make_words):
+    def make(num_pieces: int) -> str:
+        """
+        :return:        laterality phrases and sides between words and line breaks, some phrases with OCR spaces
+        """
+        pieces = []
+        for _ in range(num_pieces):
+            choice = rng.random()
+            if choice < 0.3:
+                phrase = rng.choice(phrases)
+                pieces.append(" ".join(phrase) if rng.random() < 0.1 else phrase)
+            elif choice < 0.5:
+                pieces.append(rng.choice(sides))
+            elif choice < 0.85:
+                pieces.append(make_words(rng.randint(1, 5)))
+            else:
+                pieces.append("\n")
+        return "".join(piece + rng.choice(["", " ", " ", "\n"]) for piece in pieces)
+
+    return make
+
+
+@pytest.mark.parametrize("num_pieces", [0, 2, 8, 30, 100])
+def test_laterality_is_the_same_as_with_the_patterns(num_pieces, make_laterality_text):
+    labels = set()
+    for _ in range(300):
+        text = make_laterality_text(num_pieces)
+        label = find_left_right_label(text, ReportType.ALPHA, print_debug=False)
+        assert label == find_left_right_label_by_regex(text)
+        labels.add(label)
+    if num_pieces >= 8:
+        assert {"L", "R"} <= labels
+
+
+@pytest.mark.parametrize("num_pieces", [0, 2, 8, 30, 100])
+def test_operative_sides_are_the_same_as_with_the_patterns(num_pieces, make_laterality_text):
+    found = 0
+    for _ in range(300):
+        text = make_laterality_text(num_pieces)
+        left_text, right_text = operative_sides_scan.first_sections(text)
+        assert (left_text or "") == first_section_by_regex(left_operative_report, text)
+        assert (right_text or "") == first_section_by_regex(right_operative_report, text)
+        found += bool(left_text) + bool(right_text)
+    if num_pieces >= 8:
+        assert found
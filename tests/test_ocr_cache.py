@@ -0,0 +1,70 @@
+"""
+2021 Yifu (https://github.com/chen-yifu) and Lucy (https://github.com/lhao03)
+This file includes tests of the OCR cache.
+"""
+import os
+import pickle
+from concurrent.futures import ThreadPoolExecutor
+
+from pipeline.preprocessing.ocr_cache import OCRCache
+
+ocr_settings = {"dpi": 200}
+
+
+def make_files(tmp_path) -> tuple:
+    pdf_path = str(tmp_path / "1.pdf")
+    text_path = str(tmp_path / "1.txt")
+    with open(pdf_path, "wb") as f:
+        f.write(b"%PDF-1.4 report")
+    with open(text_path, "w") as f:
+        f.write("Tumour Site: Left\n")
+    return pdf_path, text_path
+
+
+def test_pages_round_trip(tmp_path):
+    pdf_path, _ = make_files(tmp_path)
+    ocr_cache = OCRCache(str(tmp_path / "cache" / "ocr_cache.sqlite3"))
+    key = ocr_cache.make_key(pdf_path, ocr_settings)
+    assert ocr_cache.get(key) is None
+    ocr_cache.put(key, ["page 1\f", "page 2\f"])
+    assert ocr_cache.get(key) == ["page 1\f", "page 2\f"]
+    assert key != ocr_cache.make_key(pdf_path, {"dpi": 300})
+
+
+def test_text_files_not_written_by_the_cache_are_left_alone(tmp_path):
+    pdf_path, text_path = make_files(tmp_path)
+    ocr_cache = OCRCache(str(tmp_path / "ocr_cache.sqlite3"))
+    assert not ocr_cache.is_stale_text_file(text_path, pdf_path, ocr_settings)
+    assert not ocr_cache.is_stale_text_file(text_path, pdf_path, {"dpi": 300})
+
+
+def test_text_files_written_by_the_cache_are_stale_when_settings_or_pdf_change(tmp_path):
+    pdf_path, text_path = make_files(tmp_path)
+    ocr_cache = OCRCache(str(tmp_path / "ocr_cache.sqlite3"))
+    ocr_cache.record_text_file(text_path, pdf_path, ocr_settings)
+    assert not ocr_cache.is_stale_text_file(text_path, pdf_path, ocr_settings)
+    assert ocr_cache.is_stale_text_file(text_path, pdf_path, {"dpi": 300})
+    with open(pdf_path, "ab") as f:
+        f.write(b" changed")
+    assert ocr_cache.is_stale_text_file(text_path, pdf_path, ocr_settings)
+
+
+def test_edited_text_files_are_left_alone(tmp_path):
+    pdf_path, text_path = make_files(tmp_path)
+    ocr_cache = OCRCache(str(tmp_path / "ocr_cache.sqlite3"))
+    ocr_cache.record_text_file(text_path, pdf_path, ocr_settings)
+    with open(text_path, "a") as f:
+        f.write("Corrected by hand\n")
+    os.utime(pdf_path, ns=(0, 0))
+    assert not ocr_cache.is_stale_text_file(text_path, pdf_path, {"dpi": 300})
+
+
+def test_cache_is_used_from_another_thread(tmp_path):
+    pdf_path, _ = make_files(tmp_path)
+    ocr_cache = OCRCache(str(tmp_path / "ocr_cache.sqlite3"))
+    key = ocr_cache.make_key(pdf_path, ocr_settings)
+    # the lazy loader reads and writes the cache from its reader thread, the cache was opened in this one
+    with ThreadPoolExecutor(max_workers=2) as threads:
+        threads.submit(ocr_cache.put, key, ["page 1\f"]).result()
+        assert threads.submit(ocr_cache.get, key).result() == ["page 1\f"]
+    assert pickle.loads(pickle.dumps(ocr_cache)).get(key) == ["page 1\f"]
@@ -0,0 +1,59 @@
+"""
+2021 Yifu (https://github.com/chen-yifu) and Lucy (https://github.com/lhao03)
+This file includes tests of the line scanner against the generic regex it stands in for.
+"""
+import re
+
+import pytest
+
+from pipeline.utils.pair_scanner import get_generic_pair_scanner
+
+
+def make_generic_regex(separator: str) -> str:
+    # the generic regex made in run_pipeline
+    return r"(?P<column>.*){}(?P<value>((?!.+({}|—)\?*)[\s\S])*)".format(separator, separator)
+
+
+@pytest.fixture
+def make_pair_section(rng, make_words):
+    def make(separator: str, num_lines: int) -> str:
+        """
+        :return:        lines with a column and a value, with more than one separator, with dashes or with neither
+        """
+        lines = []
+        for _ in range(num_lines):
+            choice = rng.random()
+            if choice < 0.4:
+                lines.append("{}{} {}".format(make_words(rng.randint(1, 3)), separator,
+                                              make_words(rng.randint(0, 6))))
+            elif choice < 0.5:
+                # more than one separator on a line
+                lines.append("{0}{1} {0}{1}{0}".format(make_words(rng.randint(1, 2)), separator))
+            elif choice < 0.6:
+                lines.append(rng.choice(["— ", "", "x—"]) + make_words(rng.randint(1, 4)) + rng.choice([" —", ""]))
+            elif choice < 0.65:
+                lines.append("")
+            else:
+                lines.append(make_words(rng.randint(1, 12)))
+        return "\n".join(lines)
+
+    return make
+
+
+@pytest.mark.parametrize("separator", [":", "=", " - "])
+def test_scanner_finds_the_same_pairs_as_the_generic_regex(separator, make_pair_section):
+    generic_regex = re.compile(make_generic_regex(separator), re.MULTILINE)
+    scanner = get_generic_pair_scanner(generic_regex)
+    assert scanner is not None
+    for num_lines in [1, 5, 20, 100]:
+        for _ in range(30):
+            section = make_pair_section(separator, num_lines)
+            expected = [{"column": m["column"], "value": m["value"]} for m in generic_regex.finditer(section)]
+            assert scanner.find_pairs(section) == expected
+
+
+def test_other_patterns_are_not_scanned():
+    assert get_generic_pair_scanner(make_generic_regex(":")) is not None
+    assert get_generic_pair_scanner(re.compile(make_generic_regex(":"), re.MULTILINE | re.IGNORECASE)) is None
+    assert get_generic_pair_scanner(make_generic_regex("[:=]")) is None
+    assert get_generic_pair_scanner(r"(?P<column>.*):(?P<value>.*)") is None
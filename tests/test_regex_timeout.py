@@ -0,0 +1,45 @@
+"""
+2021 Yifu (https://github.com/chen-yifu) and Lucy (https://github.com/lhao03)
+This file includes tests of running regular patterns under a time budget and of what is used when they run out of time.
+"""
+import re
+
+import pytest
+
+from pipeline.utils.pair_scanner import GenericPairScanner
+from pipeline.utils.regex_timeout import RegexTimeout, RegexWorker, count_regex_timeouts, log_regex_timeout
+
+
+def test_worker_compiles_each_pattern_once_and_drops_the_oldest():
+    regex_worker = RegexWorker(max_patterns=2)
+    try:
+        for _ in range(3):
+            for pattern in ["a", "a{2}", "a{3}"]:
+                assert regex_worker.run(re.compile(pattern), "aaaa", "findall", 5) == re.findall(pattern, "aaaa")
+        assert list(regex_worker.pattern_ids) == [("a{2}", re.UNICODE), ("a{3}", re.UNICODE)]
+        with pytest.raises(ValueError):
+            regex_worker.run(re.compile("b"), "b", "unknown mode", 5)
+        assert ("b", re.UNICODE) not in regex_worker.pattern_ids
+        assert regex_worker.run(re.compile("b"), "bb", "findall", 5) == ["b", "b"]
+    finally:
+        regex_worker.stop()
+
+
+def test_timeout_restarts_the_worker():
+    regex_worker = RegexWorker()
+    try:
+        with pytest.raises(RegexTimeout) as timeout:
+            regex_worker.run(re.compile(r"(a+)+$"), "a" * 40 + "b", "findall", 0.2)
+        log_regex_timeout(timeout.value, "1")
+        assert count_regex_timeouts() >= 1
+        assert not regex_worker.pattern_ids
+        assert regex_worker.run(re.compile("a"), "aa", "findall", 5) == ["a", "a"]
+    finally:
+        regex_worker.stop()
+
+
+def test_specific_pairs_are_matched_to_the_regex_variables():
+    section = "- Tumour Site: left\n* Histologic Type : ductal\ncarcinoma\nTumour Site: again\nOther: x"
+    regex_mappings = {"tumourSite": ["Tumour Site"], "histologic_type": ["histologic type"], "grade": ["Grade"]}
+    assert GenericPairScanner(":").find_specific_pairs(section, regex_mappings) == {
+        "tumourSite": " left\n", "histologic_type": " ductal\ncarcinoma\n"}
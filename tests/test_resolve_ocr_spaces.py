@@ -0,0 +1,113 @@
+"""
+2021 Yifu (https://github.com/chen-yifu) and Lucy (https://github.com/lhao03)
+This file includes tests of the merging of OCR fragments against the merger it replaced.
+"""
+import random
+import re
+import string
+
+from pipeline.preprocessing.resolve_ocr_spaces import resolve_ocr
+
+separators = [" ", " ", " ", "\n", ", ", ": ", " (", ") ", "-"]
+
+
+class CountingVocabulary(frozenset):
+    """
+    Vocabulary that counts how many times a word is looked up in it.
+    """
+    lookups = 0
+
+    def __contains__(self, word) -> bool:
+        CountingVocabulary.lookups += 1
+        return super().__contains__(word)
+
+
+def resolve_ocr_quadratic(raw_string: str, vocab: frozenset) -> str:
+    """
+    The merger before merge_fragments, with the vocabulary passed in instead of built on every call. It merges an out
+    of vocabulary word with every word after it until it finds a vocabulary word.
+    """
+    words_list = re.split(r"(?<=[ \n\W])|(?=[ \n\W])", raw_string)
+    result_words = []
+    skip = 0
+    for i, word in enumerate(words_list):
+        if not word.strip().isalpha():
+            result_words.append(word)
+            continue
+        if skip > 0:
+            skip -= 1
+        elif word.lower().strip() not in vocab:
+            candidate_word = ""
+            for next_word in words_list[i:]:
+                if not next_word.strip().isalpha():
+                    continue
+                candidate_word += next_word
+                skip += 1
+                if candidate_word.lower().strip() in vocab:
+                    skip -= 1
+                    break
+                else:
+                    if next_word.lower().strip() in vocab:
+                        skip = 0
+                        break
+                    else:
+                        continue
+
+            if candidate_word.lower().strip() in vocab:
+                result_words.append(candidate_word)
+            else:
+                result_words.append(word)
+                skip = 0
+
+        else:
+            if skip == 0:
+                result_words.append(word)
+    return "".join(result_words)
+
+
+def make_vocabulary(rng: random.Random, size: int = 300) -> frozenset:
+    letters = string.ascii_lowercase[:8]
+    return CountingVocabulary("".join(rng.choice(letters) for _ in range(rng.randint(3, 9))) for _ in range(size))
+
+
+def make_report(rng: random.Random, vocabulary: frozenset, num_words: int, noise: float = 0.4) -> str:
+    """
+    :return:        vocabulary words, some split into fragments or in capitals, and gibberish made of the same letters
+    """
+    words = sorted(vocabulary)
+    report = []
+    for _ in range(num_words):
+        word = rng.choice(words)
+        roll = rng.random()
+        if roll < noise / 2:
+            split_at = rng.randint(1, len(word) - 1)
+            word = word[:split_at] + rng.choice(["", " ", " "]) + word[split_at:]
+        elif roll < noise:
+            word = "".join(rng.choice(string.ascii_lowercase[:8]) for _ in range(rng.randint(1, 3)))
+        if rng.random() < 0.1:
+            word = word.upper() if rng.random() < 0.5 else word.capitalize()
+        report.append(word + rng.choice(separators))
+    return "".join(report)
+
+
+def test_same_result_as_quadratic_merger():
+    rng = random.Random(0)
+    for _ in range(200):
+        vocabulary = make_vocabulary(rng)
+        report = make_report(rng, vocabulary, rng.randint(1, 60))
+        assert resolve_ocr(report, vocabulary=vocabulary) == resolve_ocr_quadratic(report, vocabulary)
+
+
+def test_lookups_per_word_are_bounded():
+    rng = random.Random(1)
+    vocabulary = make_vocabulary(rng)
+    lookups_per_word = []
+    for num_words in [500, 4000]:
+        # fragments that are rarely merged into a vocabulary word, the quadratic merger looked at every word after each
+        report = " ".join(rng.choice(string.ascii_lowercase[:8]) for _ in range(num_words))
+        CountingVocabulary.lookups = 0
+        resolve_ocr(report, vocabulary=vocabulary)
+        lookups_per_word.append(CountingVocabulary.lookups / num_words)
+    longest_word = max(len(word) for word in vocabulary)
+    assert max(lookups_per_word) <= 2 * longest_word + 1
+    assert lookups_per_word[1] <= lookups_per_word[0] * 1.1
@@ -0,0 +1,100 @@
+"""
+2021 Yifu (https://github.com/chen-yifu) and Lucy (https://github.com/lhao03)
+This file includes tests of the section splitter against re.findall of the section patterns it stands in for.
+"""
+import re
+
+import pytest
+
+from pipeline.utils.regex_tools import capture_double_regex, export_operative_regex, export_pathology_regex, \
+    left_operative_report, right_operative_report
+from pipeline.utils.section_splitter import get_section_splitter
+
+exported_patterns = [regex for regexs in export_operative_regex + export_pathology_regex +
+                     [left_operative_report, right_operative_report] for regex, _ in regexs]
+markers = ["PREOPERATIVE RATIONAL FOR SURGERY", "OPERATIVE DETAILS BREAST", "OPERATIVE DETAILS AXILLA", "Indication",
+           "Breast procedure", "Axillary procedure", "Unplanned events", "PROCEDURE COMPLETION", "Pertain to the right",
+           "Pertain to the left", "RIGHT BREAST", "LEFT BREAST", "LEFT SIDE", "RIGHT SIDE", "FOLLOW UP",
+           "Right breast:", "Left breast:", "PREOPERATIVE EVALUATION", "RATIONALE FOR SURGERY LEFT BREAST",
+           "RATIONALE FOR SURGERY RIGHT BREAST", "Synoptic Report: ", "- End of Synoptic"]
+
+
+class CountingPattern:
+    """
+    The whole section pattern of a splitter, counts how often the splitter hands a match to it.
+    """
+
+    def __init__(self, pattern: re.Pattern):
+        self.pattern = pattern
+        self.calls = 0
+
+    def search(self, *args):
+        self.calls += 1
+        return self.pattern.search(*args)
+
+    def findall(self, *args):
+        self.calls += 1
+        return self.pattern.findall(*args)
+
+
+@pytest.fixture
+def make_marker_text(rng, make_words):
+    def make(num_pieces: int) -> str:
+        """
+        :return:        markers in another case or with OCR spaces, between words and line breaks, some right after
+                        each other so their section is empty
+        """
+        pieces = []
+        for _ in range(num_pieces):
+            choice = rng.random()
+            if choice < 0.5:
+                marker = rng.choice(markers)
+                marker = rng.choice([marker, marker.upper(), marker.lower()])
+                if rng.random() < 0.2:
+                    marker = " ".join(marker)
+                pieces.append(marker)
+            elif choice < 0.8:
+                pieces.append(make_words(rng.randint(1, 6)))
+            else:
+                pieces.append("\n")
+        return "".join(piece + rng.choice(["", "", " ", "\n"]) for piece in pieces)
+
+    return make
+
+
+@pytest.mark.parametrize("num_pieces", [0, 1, 5, 20, 60])
+def test_splitter_finds_the_same_sections_as_re(num_pieces, make_marker_text):
+    splitters = {pattern: get_section_splitter(pattern) for pattern in exported_patterns}
+    assert all(splitters.values())
+    for _ in range(200):
+        text = make_marker_text(num_pieces)
+        for pattern, splitter in splitters.items():
+            assert splitter.findall(text) == re.findall(pattern, text)
+
+
+def test_empty_section_is_handed_to_the_pattern():
+    # with one or more characters, an empty section makes re backtrack into the start marker
+    pattern = capture_double_regex(["Breast procedure"], ["Axillary procedure"])
+    splitter = get_section_splitter.__wrapped__(pattern)
+    splitter.pattern = CountingPattern(splitter.pattern)
+    for text in ["Breast procedureAxillary procedure", "Breast procedure Axillary procedure", "Breast procedures",
+                 "Breast procedureAxillary procedure, Breast procedure: left"]:
+        assert splitter.findall(text) == re.findall(pattern, text)
+    assert splitter.pattern.calls > 0
+
+
+def test_empty_match_is_handed_to_the_pattern():
+    # a start marker that can match nothing gives empty matches, findall has its own rules for those
+    pattern = r"(?i)x*(?P<capture>((?!END\?*)[\s\S])*)"
+    splitter = get_section_splitter.__wrapped__(pattern)
+    assert splitter is not None
+    splitter.pattern = CountingPattern(splitter.pattern)
+    for text in ["", "END", "ab END xx cd", "xxEND", "x\nEND x"]:
+        assert splitter.findall(text) == re.findall(pattern, text)
+    assert splitter.pattern.calls > 0
+
+
+def test_other_patterns_are_not_split():
+    assert get_section_splitter(r"(?P<column>.*):(?P<value>.*)") is None
+    assert get_section_splitter(r"(?i)cat|dog(?P<capture>(?:(?!fish)[\s\S])+)") is None
+    assert get_section_splitter(r"(c)at(?P<capture>(?:(?!fish)[\s\S])+)") is None
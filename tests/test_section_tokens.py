@@ -0,0 +1,70 @@
+"""
+2021 Yifu (https://github.com/chen-yifu) and Lucy (https://github.com/lhao03)
+This file includes tests of the header records of a synoptic section against the generic regex and of the specific
+pairs looked up in them.
+"""
+import re
+
+import pytest
+
+from pipeline.processing.extraction_specific_functions import no_lymph_node
+from pipeline.utils.pair_scanner import GenericPairScanner
+from pipeline.utils.section_tokens import normalize_column, tokenize_section
+
+
+def find_specific_pairs_by_pairs(section: str, separator: str, regex_mappings: dict) -> dict:
+    # GenericPairScanner.find_specific_pairs before it looked up the headers, going through the pairs in order
+    variables = {}
+    for variable, report_columns in regex_mappings.items():
+        for report_column in report_columns:
+            variables.setdefault(normalize_column(report_column), variable)
+    specific_pairs = {}
+    for pair in GenericPairScanner(separator).find_pairs(section):
+        variable = variables.get(normalize_column(pair["column"]))
+        if variable is not None and variable not in specific_pairs and pair["value"].strip():
+            specific_pairs[variable] = pair["value"]
+    return specific_pairs
+
+
+@pytest.mark.parametrize("separator", [":", " - "])
+def test_header_records_have_the_spans_of_the_generic_regex(separator, rng, make_names, make_section):
+    generic_regex = re.compile(r"(?P<column>.*){0}(?P<value>((?!.+({0}|—)\?*)[\s\S])*)".format(separator),
+                               re.MULTILINE)
+    formats = [line_format.replace(":", separator) for line_format in ["- {}: {}", "* {} : {}", "{}: {}", "{}: —{}",
+                                                                       "{} {}", "{0}: {1}: {0}", "• {}:{}"]]
+    names = make_names(8)
+    for num_lines in [1, 10, 50]:
+        for _ in range(30):
+            section = make_section(names, num_lines, formats=formats)
+            records = tokenize_section(section).headers(separator)
+            matches = list(generic_regex.finditer(section))
+            assert len(records) == len(matches)
+            for record, match in zip(records, matches):
+                assert record["anchor"] + record["header"] == match["column"]
+                assert record["header span"] == (match.start("column") + len(record["anchor"]), match.end("column"))
+                assert record["value span"] == match.span("value")
+                assert "\n".join(record["value lines"]) == record["value"] == match["value"]
+                assert section.count("\n", 0, match.start()) == record["line"]
+                assert not record["header"] or record["header"][0] not in " -*•"
+
+
+def test_specific_pairs_are_the_first_header_of_their_variable(rng, make_names, make_section):
+    names = make_names(10)
+    for num_lines in [1, 10, 50]:
+        for _ in range(30):
+            section = "- " + make_section(names, num_lines)
+            # variables that share report columns and report columns that are not in the section
+            mapped = rng.sample(names, 6) + ["absent column"]
+            regex_mappings = {"variable{}".format(index): rng.sample(mapped, rng.randint(1, 3)) for index in range(5)}
+            found = GenericPairScanner(":").find_specific_pairs(section, regex_mappings)
+            expected = find_specific_pairs_by_pairs(section, ":", regex_mappings)
+            assert list(found.items()) == list(expected.items())
+
+
+def test_tools_look_in_the_view_of_the_tokens():
+    result = {}
+    no_lymph_node("- Lymph Nodes: No lymph nod es pre sent\n- Margins: clear", result, {})
+    assert result["number of sentinel nodes examined"] == "0"
+    result = {}
+    no_lymph_node("- Lymph Nodes: No lymph\nnodes present", result, {})
+    assert result == {}
@@ -0,0 +1,58 @@
+"""
+2021 Yifu (https://github.com/chen-yifu) and Lucy (https://github.com/lhao03)
+This file includes tests of the synoptic regex that is compiled once per column config.
+"""
+import ast
+import os
+import subprocess
+import sys
+
+from pipeline.utils.column import Column
+from pipeline.utils.regex_tools import compile_synoptic_capture_regex, get_synoptic_regex_key, max_cached_configs, \
+    synoptic_regex_cache
+
+repo_folder = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def make_columns(names: list) -> dict:
+    return {name: Column(human_col=name, primary_report_col=[name, name + " size"]) for name in names}
+
+
+def test_column_hits_of_a_new_run_reuse_the_compiled_regex():
+    synoptic_regex_cache.clear()
+    columns = make_columns(["tumour site", "tumour focality", "margins"])
+    first, _ = compile_synoptic_capture_regex(columns, column_hits={"tumour site": 3, "tumour focality": 1})
+    second, _ = compile_synoptic_capture_regex(columns, column_hits={"tumour site": 1, "tumour focality": 7})
+    assert second is first
+    assert len(synoptic_regex_cache) == 1
+
+
+def test_cache_keeps_a_bounded_number_of_configs():
+    synoptic_regex_cache.clear()
+    configs = [make_columns(["column {}".format(index) for index in range(count)])
+               for count in range(1, max_cached_configs + 3)]
+    patterns = [compile_synoptic_capture_regex(columns)[0] for columns in configs]
+    assert len(synoptic_regex_cache) == max_cached_configs
+    # the config built first was dropped, the one built last is still there
+    assert get_synoptic_regex_key(configs[0]) not in synoptic_regex_cache
+    assert compile_synoptic_capture_regex(configs[-1])[0] is patterns[-1]
+    compile_synoptic_capture_regex(configs[0])
+    assert len(synoptic_regex_cache) == max_cached_configs
+
+
+def test_same_columns_give_the_same_group_names_across_runs():
+    # the columns share their first report column, so the later ones get numbered group names
+    code = "from pipeline.utils.column import Column\n" \
+           "from pipeline.utils.regex_tools import synoptic_capture_regex_\n" \
+           "columns = {name: Column(human_col=name, primary_report_col=['margins', name]) for name in\n" \
+           "           ['margins', 'margin status', 'closest margin', 'margins of excision']}\n" \
+           "print(synoptic_capture_regex_(columns, column_hits={'margins': 2}))\n"
+    outputs = set()
+    for hash_seed in ["0", "1", "2", "random"]:
+        environment = dict(os.environ, PYTHONHASHSEED=hash_seed)
+        outputs.add(subprocess.run([sys.executable, "-c", code], cwd=repo_folder, env=environment, check=True,
+                                   capture_output=True, text=True).stdout)
+    assert len(outputs) == 1
+    synoptic_regex, mappings = ast.literal_eval(outputs.pop())
+    assert len(mappings) == 4
+    assert all("(?P<{}>".format(variable) in synoptic_regex for variable in mappings)
@@ -0,0 +1,37 @@
+"""
+2021 Yifu (https://github.com/chen-yifu) and Lucy (https://github.com/lhao03)
+This file includes tests of the pages targeted OCR keeps for the full resolution pass.
+"""
+import re
+
+import pytest
+
+pytest.importorskip("pdftotext")
+pytest.importorskip("pytesseract")
+pytest.importorskip("pdf2image")
+
+from pipeline.preprocessing.scanned_pdf_to_text import pages_from_first_anchor
+from pipeline.utils.regex_tools import add_asterisk, pathology_page_anchors
+from pipeline.utils.text_views import get_searches
+
+anchor_searches = get_searches([re.compile(add_asterisk(anchor), re.IGNORECASE) for anchor in pathology_page_anchors])
+
+
+def test_multi_page_synoptic_section_is_kept():
+    # the section starts on page 2 and its end is only on page 5, the draft pass missed "End of Synoptic"
+    page_texts = ["Clinical history", "S ynoptic Rep ort\nSPECIMEN: breast", "Margins: negative", "Comment: none",
+                  "End of Syn0ptic", "Signed out"]
+    page_numbers = list(range(1, len(page_texts) + 1))
+    assert pages_from_first_anchor(page_texts, page_numbers, anchor_searches) == [2, 3, 4, 5, 6]
+
+
+def test_pages_with_a_text_layer_are_not_selected():
+    # page 1 has a usable text layer, so it is not waiting for OCR and is not in page_numbers
+    page_texts = ["Synoptic Report", None, "Margins: negative", None]
+    assert pages_from_first_anchor(page_texts, [2, 4], anchor_searches) == [2, 4]
+
+
+def test_reports_without_an_anchor_keep_every_page():
+    page_texts = ["Clinical history", "Margins: negative"]
+    assert pages_from_first_anchor(page_texts, [1, 2], anchor_searches) == [1, 2]
+    assert pages_from_first_anchor([None, None], [1, 2], anchor_searches) == [1, 2]
@@ -0,0 +1,71 @@
+"""
+2021 Yifu (https://github.com/chen-yifu) and Lucy (https://github.com/lhao03)
+This file includes tests of the searches in the view of a text without spaces against the patterns they stand in for.
+"""
+import random
+import re
+import string
+
+import pytest
+
+from pipeline.utils.regex_tools import add_asterisk
+from pipeline.utils.text_views import TextView, get_searches, get_text_view
+
+phrases = ["PROCEDURE COMPLETION", "Synoptic Report", "Axillary procedure", "End of Synoptic", "Negative for DCIS"]
+
+
+def make_report(rng: random.Random, num_words: int) -> str:
+    """
+    :return:        random words with phrases whose letters are spaced out, cut short or in another case, like OCR
+    """
+    words = []
+    for _ in range(num_words):
+        if rng.random() < 0.05:
+            phrase = rng.choice(phrases)
+            phrase = phrase[:rng.randint(1, len(phrase))] if rng.random() < 0.3 else phrase
+            phrase = phrase.upper() if rng.random() < 0.3 else phrase
+            words.append("".join(char + " " * rng.choice([0, 0, 1, 2]) for char in phrase))
+        else:
+            words.append("".join(rng.choice(string.ascii_letters + "-:K") for _ in range(rng.randint(1, 9))))
+    return rng.choice([" ", "  ", "\n"]).join(words)
+
+
+@pytest.mark.parametrize("num_words", [10, 100, 1000])
+def test_searches_find_the_same_match_as_the_patterns(num_words):
+    rng = random.Random(num_words)
+    patterns = [re.compile(add_asterisk(phrase), re.IGNORECASE) for phrase in phrases] + \
+        [re.compile(add_asterisk(phrase)) for phrase in phrases]
+    searches = get_searches(patterns)
+    assert all(search is not pattern for search, pattern in zip(searches, patterns))
+    for _ in range(30):
+        report = make_report(rng, num_words)
+        get_text_view.cache_clear()
+        for pos in [0, rng.randint(0, len(report))]:
+            expected = [pattern.search(report, pos) for pattern in patterns]
+            found = [search.search(report, pos) for search in searches]
+            assert [m and m.span() for m in found] == [m and m.span() for m in expected]
+
+
+def test_view_maps_back_to_the_text():
+    rng = random.Random(0)
+    text = "".join(rng.choice("ab  CK") for _ in range(500))
+    view = TextView(text)
+    assert view.text == text.replace(" ", "").lower().replace("K", "k")
+    indexes = list(range(len(view.text)))
+    rng.shuffle(indexes)
+    for index in indexes:
+        pos = view.to_original(index)
+        assert text[pos] != " " and view.to_view(pos) == index
+
+
+@pytest.mark.parametrize("pattern", [re.compile(add_asterisk("- End of Synoptic"), re.IGNORECASE),
+                                     re.compile(add_asterisk("Right") + "|" + add_asterisk("Left")),
+                                     re.compile("K *"), re.compile(add_asterisk("Margins"), re.VERBOSE)])
+def test_patterns_without_a_spaced_literal_are_searched_with_re(pattern):
+    # a quantifier on the first character, an OR, less than two letters to look for and re.VERBOSE
+    [search] = get_searches([pattern])
+    assert search is pattern
+    rng = random.Random(pattern.pattern)
+    for _ in range(30):
+        report = make_report(rng, 100) + " - E N D of Synoptic Right Margins"
+        assert search.search(report).span() == pattern.search(report).span()
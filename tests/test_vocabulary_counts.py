@@ -0,0 +1,32 @@
+"""
+2021 Yifu (https://github.com/chen-yifu) and Lucy (https://github.com/lhao03)
+This file includes tests of the word counts kept across runs.
+"""
+import pickle
+
+from pipeline.utils.vocabulary_counts import VocabularyCounts
+
+
+def test_changed_report_replaces_its_counts(tmp_path):
+    counts_path = str(tmp_path / "vocabulary_counts.pickle")
+    vocabulary_counts = VocabularyCounts(counts_path)
+    assert vocabulary_counts.add("tumour site left", "1")
+    assert not vocabulary_counts.add("tumour site left", "1")
+    assert vocabulary_counts.add("tumour site right", "1")
+    assert vocabulary_counts.add("tumour site left", "2")
+    assert vocabulary_counts.num_documents == 2
+    assert vocabulary_counts.counter == {"tumour": 2, "site": 2, "left": 1, "right": 1}
+    vocabulary_counts.save()
+
+    vocabulary_counts = VocabularyCounts(counts_path)
+    assert vocabulary_counts.add("tumour size", "2")
+    assert vocabulary_counts.counter == {"tumour": 2, "site": 1, "right": 1, "size": 1}
+
+
+def test_counts_saved_in_the_old_format_are_counted_again(tmp_path):
+    counts_path = str(tmp_path / "vocabulary_counts.pickle")
+    with open(counts_path, "wb") as f:
+        pickle.dump({"counter": {"tumour": 5}, "document hashes": {"abc"}}, f)
+    vocabulary_counts = VocabularyCounts(counts_path)
+    assert vocabulary_counts.num_documents == 0
+    assert not vocabulary_counts.counter